@@ -1,28 +1,68 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Blueprint, Flask, Response, current_app, render_template, request, jsonify, session, redirect, url_for, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from werkzeug.local import LocalProxy
+from werkzeug.security import generate_password_hash
+from datetime import date, datetime, timedelta, timezone
 import os
+import csv
+import io
 import json
+import base64
+import hashlib
+from collections import Counter
 from functools import wraps
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import object_session
+from location_buffer import LocationWriteBuffer
+from location_archive import LocationArchive
+from photo_store import PhotoStore
+from compression import Compressor
+from response_cache import ResponseCache, LRUCacheBackend
+from json_provider import FastJSONProvider
+from config import get_config, engine_options
+from exporter import EXPORT_FORMATS, format_value
+from live_feed import LiveFeed, FeedBusy
+from password_hashing import PasswordHasher, HashingBusy
+import geo
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'occamy-secret-key-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///occamy.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
-
-db = SQLAlchemy(app)
+db = SQLAlchemy()
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-
-# Ensure upload folder exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+login_manager.login_view = 'main.login'
+# Shared by every app: they decorate views and hook db.session at import,
+# and keep each app's backend in app.extensions
+response_cache = ResponseCache(db)
+live_feed = LiveFeed(db)
+# create_app gives each app its own instance, with its own threads and
+# settings; these names resolve to the current app's
+password_hasher = LocalProxy(lambda: current_app.extensions['password_hasher'])
+location_archive = LocalProxy(lambda: current_app.extensions['location_archive'])
+photo_store = LocalProxy(lambda: current_app.extensions['photo_store'])
+location_buffer = LocalProxy(lambda: current_app.extensions['location_buffer'])
+user_cache = LocalProxy(lambda: current_app.extensions['user_cache'])
+bp = Blueprint('main', __name__)
 
 # ============== MODELS ==============
 
+def activity_day_default(context):
+    """Calendar day of the row's `date`, stored so per-day queries can use an index"""
+    return context.get_current_parameters()['date'].date()
+
+def geohash_default(lat_column, lng_column):
+    """Column default storing the geohash of a row's coordinates, if it has any"""
+    def default(context):
+        params = context.get_current_parameters()
+        lat, lng = params.get(lat_column), params.get(lng_column)
+        if lat is None or lng is None:
+            return None
+        try:
+            return geo.encode(float(lat), float(lng))
+        except (TypeError, ValueError):
+            # A bad coordinate must not fail the insert, or a whole batch with it
+            return None
+    return default
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -35,6 +75,11 @@ class User(UserMixin, db.Model):
     phone = db.Column(db.String(15))
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_user_updated_at', 'updated_at'),
+    )
     
     # Relationships
     work_logs = db.relationship('WorkLog', backref='user', lazy=True)
@@ -56,8 +101,20 @@ class WorkLog(db.Model):
     odometer_end = db.Column(db.Float)
     distance_traveled = db.Column(db.Float)
     notes = db.Column(db.Text)
-    status = db.Column(db.String(20), default='started')  # started, ended
+    status = db.Column(db.String(20), default='started')  # started, ended, duplicate (set aside by migrate_db indexes)
+    track_points = db.Column(db.Integer)  # location points before compaction, NULL until compacted
+    track_points_kept = db.Column(db.Integer)
+    gps_distance = db.Column(db.Float)  # km along the day's GPS track
+    gps_distance_ratio = db.Column(db.Float)  # distance_traveled / gps_distance
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_work_log_user_id_date', 'user_id', 'date'),
+        db.Index('ix_work_log_date_status', 'date', 'status'),
+        # At most one open work session per officer per day
+        db.Index('uq_work_log_user_id_date_started', 'user_id', 'date', unique=True,
+                 sqlite_where=db.text("status = 'started'"), postgresql_where=db.text("status = 'started'")),
+    )
 
 class Meeting(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -82,7 +139,17 @@ class Meeting(db.Model):
     location_name = db.Column(db.String(200))
     notes = db.Column(db.Text)
     photos = db.Column(db.Text)  # JSON array of photo URLs
+    activity_day = db.Column(db.Date, default=activity_day_default)
+    geohash = db.Column(db.String(12), default=geohash_default('location_lat', 'location_lng'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_meeting_user_id_date', 'user_id', 'date'),
+        # Newest-first keyset pages order and seek on (date, id)
+        db.Index('ix_meeting_date_id', 'date', 'id'),
+        db.Index('ix_meeting_user_id_activity_day', 'user_id', 'activity_day'),
+        db.Index('ix_meeting_geohash', 'geohash'),
+    )
 
 class SampleDistribution(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -98,7 +165,16 @@ class SampleDistribution(db.Model):
     location_lng = db.Column(db.Float)
     location_name = db.Column(db.String(200))
     notes = db.Column(db.Text)
+    activity_day = db.Column(db.Date, default=activity_day_default)
+    geohash = db.Column(db.String(12), default=geohash_default('location_lat', 'location_lng'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_sample_distribution_user_id_date', 'user_id', 'date'),
+        db.Index('ix_sample_distribution_date', 'date'),
+        db.Index('ix_sample_distribution_user_id_activity_day', 'user_id', 'activity_day'),
+        db.Index('ix_sample_distribution_geohash', 'geohash'),
+    )
 
 class Sale(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -120,7 +196,17 @@ class Sale(db.Model):
     location_lng = db.Column(db.Float)
     location_name = db.Column(db.String(200))
     notes = db.Column(db.Text)
+    activity_day = db.Column(db.Date, default=activity_day_default)
+    geohash = db.Column(db.String(12), default=geohash_default('location_lat', 'location_lng'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_sale_user_id_date', 'user_id', 'date'),
+        db.Index('ix_sale_date_sale_type', 'date', 'sale_type'),
+        db.Index('ix_sale_date_id', 'date', 'id'),
+        db.Index('ix_sale_user_id_activity_day', 'user_id', 'activity_day'),
+        db.Index('ix_sale_geohash', 'geohash'),
+    )
 
 class LocationLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -130,12 +216,881 @@ class LocationLog(db.Model):
     accuracy = db.Column(db.Float)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     activity_type = db.Column(db.String(50))  # tracking, meeting, sale, etc.
+    geohash = db.Column(db.String(12), default=geohash_default('latitude', 'longitude'))
+    
+    __table_args__ = (
+        db.Index('ix_location_log_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_location_log_geohash', 'geohash'),
+    )
+
+class DailyOfficerSummary(db.Model):
+    """Per-officer, per-day activity totals maintained alongside every write"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    meetings = db.Column(db.Integer, nullable=False, default=0)
+    sales = db.Column(db.Integer, nullable=False, default=0)
+    samples = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    distance = db.Column(db.Float, nullable=False, default=0)
+    location_points = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', name='uq_daily_officer_summary_user_id_day'),
+        db.Index('ix_daily_officer_summary_day', 'day'),
+    )
+
+SUMMARY_COUNTERS = ('meetings', 'sales', 'samples', 'revenue', 'distance', 'location_points')
+
+class IdempotencyKey(db.Model):
+    """Response of a field POST, replayed when the client retries with the same key"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    endpoint = db.Column(db.String(100), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)  # sha256 of the request body
+    status_code = db.Column(db.Integer)  # NULL while the first request is in flight
+    response_body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_id_key'),
+        db.Index('ix_idempotency_key_expires_at', 'expires_at'),
+    )
+
+# ============== LIVE FEED ==============
+
+# Event name and payload columns for each new activity row
+FEED_ACTIVITIES = {
+    Meeting: ('meeting', ('id', 'user_id', 'date', 'meeting_type', 'person_name', 'person_category', 'village',
+                          'attendees_count', 'business_potential', 'location_lat', 'location_lng',
+                          'location_name')),
+    SampleDistribution: ('sample', ('id', 'user_id', 'date', 'recipient_name', 'product_name', 'quantity',
+                                    'unit', 'location_lat', 'location_lng', 'location_name')),
+    Sale: ('sale', ('id', 'user_id', 'date', 'sale_type', 'customer_name', 'product_name', 'quantity',
+                    'total_amount', 'location_lat', 'location_lng', 'location_name')),
+}
+FEED_WORK_LOG_FIELDS = ('id', 'user_id', 'date', 'start_time', 'end_time', 'start_location_lat',
+                        'start_location_lng', 'end_location_lat', 'end_location_lng', 'distance_traveled')
+FEED_POSITION_FIELDS = ('user_id', 'latitude', 'longitude', 'accuracy', 'timestamp', 'activity_type')
+
+def feed_payload(obj, fields):
+    return {field: format_value(obj[field] if isinstance(obj, dict) else getattr(obj, field)) for field in fields}
+
+def feed_activity(name, fields):
+    def serializer(obj, created):
+        return (name, feed_payload(obj, fields)) if created else None
+    return serializer
+
+def feed_work_log(work_log, created):
+    if created:
+        return 'work_start', feed_payload(work_log, FEED_WORK_LOG_FIELDS)
+    if work_log.status == 'ended' and db.inspect(work_log).attrs.status.history.has_changes():
+        return 'work_end', feed_payload(work_log, FEED_WORK_LOG_FIELDS)
+    return None
+
+def feed_position(location, created):
+    return ('position', feed_payload(location, FEED_POSITION_FIELDS)) if created else None
+
+for model, (name, fields) in FEED_ACTIVITIES.items():
+    live_feed.watch(model, feed_activity(name, fields))
+live_feed.watch(WorkLog, feed_work_log)
+live_feed.watch(LocationLog, feed_position)
 
 # ============== HELPER FUNCTIONS ==============
 
+def record_daily_activity(user_id, day, **increments):
+    """Add to an officer's DailyOfficerSummary row in the current transaction
+
+    Uses INSERT ... ON CONFLICT DO UPDATE so concurrent writers for the same
+    officer-day never race on creating the row.
+    """
+    table = DailyOfficerSummary.__table__
+    dialect = db.session.get_bind().dialect.name
+    
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(table).values(user_id=user_id, day=day, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'day'],
+            set_={name: table.c[name] + stmt.excluded[name] for name in increments}
+        )
+        # No cached endpoint shows track point counts, so pings leave the caches alone
+        options = {'cache_invalidate': False} if set(increments) == {'location_points'} else {}
+        db.session.execute(stmt, execution_options=options)
+        return
+    
+    summary = DailyOfficerSummary.query.filter_by(user_id=user_id, day=day).with_for_update().first()
+    if summary is None:
+        summary = DailyOfficerSummary(user_id=user_id, day=day, **{name: 0 for name in SUMMARY_COUNTERS})
+        db.session.add(summary)
+    for name, value in increments.items():
+        setattr(summary, name, getattr(summary, name) + value)
+
+def rebuild_daily_summaries():
+    """Recompute every DailyOfficerSummary row from the raw activity tables"""
+    totals = {}
+    
+    def merge(rows, *columns):
+        for user_id, day, *values in rows:
+            if isinstance(day, str):
+                day = date.fromisoformat(day)
+            summary = totals.setdefault((user_id, day), dict.fromkeys(SUMMARY_COUNTERS, 0))
+            for column, value in zip(columns, values):
+                summary[column] += value or 0
+    
+    def per_day(model, day_column, *aggregates):
+        day = db.func.date(day_column) if day_column.type.python_type is datetime else day_column
+        return db.session.query(model.user_id, day, *aggregates).group_by(model.user_id, day)
+    
+    # Activity tables group on the stored, indexed activity_day column
+    merge(per_day(Meeting, Meeting.activity_day, db.func.count(Meeting.id)), 'meetings')
+    merge(per_day(Sale, Sale.activity_day, db.func.count(Sale.id), db.func.sum(Sale.total_amount)), 'sales', 'revenue')
+    merge(per_day(SampleDistribution, SampleDistribution.activity_day, db.func.count(SampleDistribution.id)), 'samples')
+    merge(per_day(WorkLog, WorkLog.date, db.func.sum(WorkLog.distance_traveled)), 'distance')
+    merge(per_day(LocationLog, LocationLog.timestamp, db.func.count(LocationLog.id)), 'location_points')
+    merge(((user_id, day, count) for (user_id, day), count in location_archive.daily_counts().items()),
+          'location_points')
+    # Points removed by track compaction still count as logged
+    merge(per_day(WorkLog, WorkLog.date, db.func.sum(WorkLog.track_points - WorkLog.track_points_kept)),
+          'location_points')
+    
+    db.session.query(DailyOfficerSummary).delete()
+    if totals:
+        db.session.execute(db.insert(DailyOfficerSummary), [
+            {'user_id': user_id, 'day': day, **counters}
+            for (user_id, day), counters in totals.items()
+        ])
+    db.session.commit()
+    return len(totals)
+
+def add_location_rows(rows):
+    """Insert LocationLog rows with their summary counts in the current transaction"""
+    db.session.execute(db.insert(LocationLog), rows)
+    points = Counter((row['user_id'], row['timestamp'].date()) for row in rows)
+    for (user_id, day), count in points.items():
+        record_daily_activity(user_id, day, location_points=count)
+    # Only each officer's latest fix matters to the live map
+    latest = {}
+    for row in rows:
+        if row['user_id'] not in latest or row['timestamp'] >= latest[row['user_id']]['timestamp']:
+            latest[row['user_id']] = row
+    for row in latest.values():
+        live_feed.publish('position', feed_payload(row, FEED_POSITION_FIELDS))
+
+def write_location_rows(rows):
+    add_location_rows(rows)
+    db.session.commit()
+
+def archive_locations(cutoff=None):
+    """Move LocationLog rows older than `cutoff` to the archive; returns how many
+
+    `cutoff` defaults to LOCATION_RETENTION_DAYS ago. Rows are taken in id
+    order, LOCATION_ARCHIVE_BATCH_SIZE at a time. Each batch is written to
+    the archive files before it is deleted and committed, so no transaction
+    or lock grows with the size of the backlog.
+    """
+    if cutoff is None:
+        cutoff = datetime.utcnow() - timedelta(days=current_app.config['LOCATION_RETENTION_DAYS'])
+    batch_size = current_app.config['LOCATION_ARCHIVE_BATCH_SIZE']
+    
+    archived = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(LocationLog.user_id, *(getattr(LocationLog, field) for field in LocationArchive.FIELDS))
+            .where(LocationLog.timestamp < cutoff, LocationLog.id > last_id)
+            .order_by(LocationLog.id).limit(batch_size)
+        ).mappings().all()
+        if not rows:
+            return archived
+        
+        months = {}
+        for row in rows:
+            months.setdefault((row['user_id'], row['timestamp'].date().replace(day=1)), []).append(row)
+        for (user_id, month), month_rows in months.items():
+            location_archive.append(user_id, month, month_rows)
+        
+        ids = [row['id'] for row in rows]
+        for start in range(0, len(ids), 500):
+            db.session.execute(db.delete(LocationLog).where(LocationLog.id.in_(ids[start:start + 500])))
+        db.session.commit()
+        archived += len(rows)
+        last_id = ids[-1]
+
+def gps_track_distances(user_id, date_from, date_to):
+    """GPS path length in km per day of an officer's location track
+
+    The whole range is read as plain columns in one indexed query and the
+    haversine sums are computed over arrays, not row by row in the ORM.
+    """
+    rows = db.session.execute(
+        db.select(LocationLog.timestamp, LocationLog.latitude, LocationLog.longitude, LocationLog.accuracy)
+        .where(LocationLog.user_id == user_id,
+               LocationLog.timestamp >= datetime.combine(date_from, datetime.min.time()),
+               LocationLog.timestamp < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+        .order_by(LocationLog.timestamp)
+    ).all()
+    if not rows:
+        return {}
+    
+    times, lats, lngs, accuracies = zip(*rows)
+    metres = geo.track_lengths(
+        list(times), lats, lngs, accuracies,
+        max_speed_mps=current_app.config['GPS_MAX_SPEED_KMH'] / 3.6,
+        max_accuracy_m=current_app.config['GPS_MAX_ACCURACY_M'],
+        default_accuracy_m=current_app.config['GPS_DEFAULT_ACCURACY_M']
+    )
+    return {day: total / 1000 for day, total in metres.items()}
+
+def gps_distance_fields(distance_traveled, gps_km):
+    """WorkLog columns storing a GPS distance next to the odometer figure"""
+    return {
+        'gps_distance': round(gps_km, 3),
+        'gps_distance_ratio': round(distance_traveled / gps_km, 3) if gps_km and distance_traveled else None
+    }
+
+def update_gps_distances(date_from, date_to, recompute=False):
+    """Store GPS distances on ended WorkLogs in the range; returns how many
+
+    Days that already have one are skipped unless `recompute` is set, since
+    it was measured before track compaction removed points.
+    """
+    query = db.select(WorkLog.id, WorkLog.user_id, WorkLog.date, WorkLog.distance_traveled).where(
+        WorkLog.status == 'ended', WorkLog.date.between(date_from, date_to)
+    )
+    if not recompute:
+        query = query.where(WorkLog.gps_distance.is_(None))
+    by_user = {}
+    for work_log in db.session.execute(query):
+        by_user.setdefault(work_log.user_id, []).append(work_log)
+    
+    updates = []
+    for user_id, work_logs in by_user.items():
+        distances = gps_track_distances(user_id, date_from, date_to)
+        updates.extend({
+            'id': work_log.id,
+            **gps_distance_fields(work_log.distance_traveled, distances.get(work_log.date, 0.0))
+        } for work_log in work_logs)
+    if updates:
+        db.session.execute(db.update(WorkLog), updates)
+    db.session.commit()
+    return len(updates)
+
+def compact_track(work_log):
+    """Simplify the officer's location track for a work day, in the current transaction
+
+    Tracking points are thinned with Douglas-Peucker to within
+    TRACK_TOLERANCE_M metres of the kept line; points tagged with any other
+    activity_type are always kept. The before and after counts are recorded
+    on `work_log` and returned.
+    """
+    day_start = datetime.combine(work_log.date, datetime.min.time())
+    rows = db.session.execute(
+        db.select(LocationLog.id, LocationLog.latitude, LocationLog.longitude, LocationLog.activity_type)
+        .where(LocationLog.user_id == work_log.user_id, LocationLog.timestamp >= day_start,
+               LocationLog.timestamp < day_start + timedelta(days=1))
+        .order_by(LocationLog.timestamp, LocationLog.id)
+    ).all()
+    
+    keep = [index for index, row in enumerate(rows) if row.activity_type not in (None, 'tracking')]
+    kept = set(geo.simplify([(row.latitude, row.longitude) for row in rows],
+                            current_app.config['TRACK_TOLERANCE_M'], keep))
+    dropped = [row.id for index, row in enumerate(rows) if index not in kept]
+    for start in range(0, len(dropped), 500):
+        db.session.execute(db.delete(LocationLog).where(LocationLog.id.in_(dropped[start:start + 500])))
+    
+    # A re-run (e.g. after a late offline sync) only adds the points that are new since
+    work_log.track_points = (work_log.track_points or 0) - (work_log.track_points_kept or 0) + len(rows)
+    work_log.track_points_kept = len(kept)
+    return work_log.track_points, work_log.track_points_kept
+
+class CachedUser:
+    """Identity snapshot served by the user loader instead of a User row"""
+    is_authenticated = True
+    is_anonymous = False
+    
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.name = user.name
+        self.role = user.role
+        self.state = user.state
+        self.district = user.district
+        self.is_active = user.is_active
+    
+    def get_id(self):
+        return str(self.id)
+
+# A changed user is evicted once the change commits: evicting at flush would
+# let another request thread cache the still-committed row in between
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    object_session(target).info.setdefault('changed_user_ids', set()).add(str(target.id))
+
+@db.event.listens_for(db.session, 'after_commit')
+def evict_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.delete(user_id)
+
+@db.event.listens_for(db.session, 'after_rollback')
+def forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Every authenticated request lands here, so serve it from a short-lived
+    # per-process cache; edits in this worker invalidate it immediately and
+    # other workers pick them up within USER_CACHE_TTL seconds
+    cached = user_cache.get(user_id)
+    if cached is None:
+        user = db.session.get(User, int(user_id))
+        if user is None or not user.is_active:
+            return None
+        cached = CachedUser(user)
+        if current_app.config['USER_CACHE_TTL'] > 0:
+            user_cache.set(user_id, cached, current_app.config['USER_CACHE_TTL'])
+    return cached
+
+def parse_client_timestamp(value):
+    """Parse an ISO 8601 timestamp sent by a device into naive UTC"""
+    if value is None:
+        return datetime.utcnow()
+    if not isinstance(value, str):
+        raise ValueError('timestamp must be an ISO 8601 string')
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def parse_coordinates(data, required=False):
+    """`latitude` and `longitude` sent by a device as floats, (None, None) if absent
+
+    Numeric strings are accepted; anything else, a missing half of the pair or
+    a value out of range raises ValueError.
+    """
+    lat, lng = data.get('latitude'), data.get('longitude')
+    if lat is None and lng is None and not required:
+        return None, None
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        raise ValueError('latitude and longitude must be numbers')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('latitude and longitude out of range')
+    return lat, lng
+
+def state_activity_query():
+    """Meetings and sales per state for field officers
+
+    Each table is counted per officer in its own subquery before joining on
+    the user, so meetings and sales never multiply into a cartesian product.
+    """
+    meeting_counts = db.select(
+        Meeting.user_id,
+        db.func.count(Meeting.id).label('meetings')
+    ).group_by(Meeting.user_id).subquery()
+    
+    sale_counts = db.select(
+        Sale.user_id,
+        db.func.count(Sale.id).label('sales')
+    ).group_by(Sale.user_id).subquery()
+    
+    return db.select(
+        User.state,
+        db.func.coalesce(db.func.sum(meeting_counts.c.meetings), 0).label('meetings'),
+        db.func.coalesce(db.func.sum(sale_counts.c.sales), 0).label('sales')
+    ).outerjoin(
+        meeting_counts, meeting_counts.c.user_id == User.id
+    ).outerjoin(
+        sale_counts, sale_counts.c.user_id == User.id
+    ).where(
+        User.role == 'field_officer'
+    ).group_by(User.state)
+
+def table_watermark(*models):
+    """Max id and latest updated_at of each model, in one query
+
+    Both are index lookups rather than a count's full scan. They change on
+    every insert and (for models with updated_at) update; these tables are
+    never deleted from, so they can stand in for the content of list
+    endpoints in ETags.
+    """
+    columns = []
+    for model in models:
+        columns.append(db.select(db.func.max(model.id)).scalar_subquery())
+        if hasattr(model, 'updated_at'):
+            columns.append(db.select(db.func.max(model.updated_at)).scalar_subquery())
+    return list(db.session.execute(db.select(*columns)).one())
+
+def parse_date_arg(name):
+    """Read an optional YYYY-MM-DD query parameter"""
+    value = request.args.get(name)
+    return date.fromisoformat(value) if value else None
+
+def encode_cursor(row_date, row_id):
+    raw = json.dumps([row_date.isoformat(), row_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    row_date, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return datetime.fromisoformat(row_date), int(row_id)
+
+def activity_filter_args():
+    """Read the officer, state and date range filters from the query string"""
+    return {
+        'user_id': request.args.get('user_id', type=int),
+        'state': request.args.get('state'),
+        'date_from': parse_date_arg('from'),
+        'date_to': parse_date_arg('to')
+    }
+
+def filter_activity_query(query, model, user_id=None, state=None, date_from=None, date_to=None):
+    """Apply the officer, state and date range filters shared by admin lists"""
+    if user_id:
+        query = query.filter(model.user_id == user_id)
+    if state:
+        query = query.filter(User.state == state)
+    if date_from:
+        query = query.filter(model.date >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        query = query.filter(model.date < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    return query
+
+def keyset_page(query, model):
+    """Return one page of a newest-first query and the cursor for the next
+
+    Pages continue from the (date, id) of the last row rather than using
+    OFFSET, so every page costs the same index range scan however deep it is.
+    Rows may be model instances or projected columns named ``date`` and ``id``.
+    """
+    limit = request.args.get('limit', current_app.config['ITEMS_PER_PAGE'], type=int)
+    limit = max(1, min(limit, current_app.config['MAX_ITEMS_PER_PAGE']))
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        query = query.filter(db.tuple_(model.date, model.id) < (cursor_date, cursor_id))
+    
+    rows = query.order_by(model.date.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+    return rows, next_cursor
+
+EXPORT_MODELS = {
+    'sales': Sale,
+    'meetings': Meeting,
+    'samples': SampleDistribution
+}
+
+def export_query(model, **filters):
+    """All columns of an activity table plus the officer, streamed in chunks
+
+    yield_per keeps only one chunk of rows in memory and uses a server-side
+    cursor on PostgreSQL.
+    """
+    query = db.session.query(
+        *model.__table__.columns,
+        User.name.label('officer_name'),
+        User.state.label('officer_state')
+    ).join(User, model.user_id == User.id)
+    query = filter_activity_query(query, model, **filters)
+    return query.order_by(model.id).yield_per(current_app.config['EXPORT_CHUNK_SIZE'])
+
+MAP_LAYERS = {  # layer -> (model, lat column, lng column, time column)
+    'meetings': (Meeting, Meeting.location_lat, Meeting.location_lng, Meeting.date),
+    'sales': (Sale, Sale.location_lat, Sale.location_lng, Sale.date),
+    'samples': (SampleDistribution, SampleDistribution.location_lat, SampleDistribution.location_lng,
+                SampleDistribution.date),
+    'locations': (LocationLog, LocationLog.latitude, LocationLog.longitude, LocationLog.timestamp)
+}
+DEFAULT_MAP_LAYERS = ('meetings', 'sales', 'samples')
+
+def map_layer(layer, bbox, precision, date_from=None, date_to=None):
+    """Points of one map layer inside `bbox`, or per-cell clusters if there are too many
+
+    Rows are found through geohash prefix ranges, one per cell covering the
+    box, so the index does the spatial filtering. Clusters are grouped at the
+    same precision, so their number depends on the box size alone.
+    """
+    model, lat, lng, when = MAP_LAYERS[layer]
+    min_lng, min_lat, max_lng, max_lat = bbox
+    conditions = [
+        db.or_(*(db.and_(model.geohash >= cell, model.geohash < cell + '~')
+                 for cell in geo.cover(bbox, precision))),
+        lat.between(min_lat, max_lat),
+        lng.between(min_lng, max_lng)
+    ]
+    if date_from:
+        conditions.append(when >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        conditions.append(when < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    
+    cell = db.func.substr(model.geohash, 1, precision)
+    clusters = db.session.execute(
+        db.select(cell, db.func.count(), db.func.avg(lat), db.func.avg(lng))
+        .where(*conditions).group_by(cell)
+    ).all()
+    total = sum(count for _, count, _, _ in clusters)
+    
+    if total > current_app.config['MAP_MAX_POINTS']:
+        return {'type': 'clusters', 'total': total, 'items': [{
+            'cell': cell_hash,
+            'count': count,
+            'lat': round(avg_lat, 6),
+            'lng': round(avg_lng, 6)
+        } for cell_hash, count, avg_lat, avg_lng in clusters]}
+    
+    points = db.session.execute(
+        db.select(model.id, model.user_id, lat, lng, when).where(*conditions).order_by(when)
+    ).all()
+    return {'type': 'points', 'total': total, 'items': [{
+        'id': row_id,
+        'user_id': user_id,
+        'lat': point_lat,
+        'lng': point_lng,
+        'time': point_time.isoformat() if point_time else None
+    } for row_id, user_id, point_lat, point_lng, point_time in points]}
+
+OFFICER_FIELDS = ('username', 'email', 'password', 'name', 'state', 'district', 'phone')
+OFFICER_REQUIRED_FIELDS = ('username', 'email', 'password', 'name')
+
+def parse_officer_rows(text, data_format):
+    """Officer dicts from CSV with a header line, or a JSON list / {"users": [...]}"""
+    if data_format == 'csv':
+        return list(csv.DictReader(io.StringIO(text)))
+    data = json.loads(text)
+    return data.get('users') if isinstance(data, dict) else data
+
+class OfficersTaken(Exception):
+    """Raised when officers created by someone else meanwhile clash with a batch"""
+    
+    def __init__(self, usernames):
+        super().__init__(f"Already taken: {', '.join(usernames)}")
+        self.usernames = usernames
+
+def bulk_create_officers(rows):
+    """Create field officers from `rows` in one transaction, returning their usernames
+
+    Rows that fail validation or clash with existing or earlier rows are
+    skipped and reported as {'row': n, 'error': ...} with n counting from 1.
+    If a concurrent insert takes a username or email between the check and
+    the insert, nothing is created and OfficersTaken names the clashing rows.
+    """
+    errors = []
+    candidates = []
+    usernames = set()
+    emails = set()
+    
+    for number, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            errors.append({'row': number, 'error': 'Row must be an object'})
+            continue
+        row = {field: (str(row[field]).strip() or None) if row.get(field) is not None else None
+               for field in OFFICER_FIELDS}
+        missing = [field for field in OFFICER_REQUIRED_FIELDS if not row[field]]
+        if missing:
+            errors.append({'row': number, 'error': f"Missing {', '.join(missing)}"})
+        elif row['username'] in usernames:
+            errors.append({'row': number, 'error': 'Duplicate username in batch'})
+        elif row['email'] in emails:
+            errors.append({'row': number, 'error': 'Duplicate email in batch'})
+        else:
+            usernames.add(row['username'])
+            emails.add(row['email'])
+            candidates.append((number, row))
+    
+    if candidates:
+        taken = db.session.execute(
+            db.select(User.username, User.email).where(
+                db.or_(User.username.in_(usernames), User.email.in_(emails))
+            )
+        ).all()
+        taken_usernames = {username for username, _ in taken}
+        taken_emails = {email for _, email in taken}
+        
+        accepted = []
+        for number, row in candidates:
+            if row['username'] in taken_usernames:
+                errors.append({'row': number, 'error': 'Username already exists'})
+            elif row['email'] in taken_emails:
+                errors.append({'row': number, 'error': 'Email already exists'})
+            else:
+                accepted.append(row)
+        candidates = accepted
+    
+    if not candidates:
+        return [], sorted(errors, key=lambda error: error['row'])
+    
+    hashes = password_hasher.hash_many([row['password'] for row in candidates])
+    try:
+        db.session.execute(
+            db.insert(User),
+            [{
+                'username': row['username'],
+                'email': row['email'],
+                'password_hash': pwhash,
+                'role': 'field_officer',
+                'name': row['name'],
+                'state': row['state'],
+                'district': row['district'],
+                'phone': row['phone']
+            } for row, pwhash in zip(candidates, hashes)]
+        )
+        db.session.commit()
+    except IntegrityError:
+        # Hashing takes long enough for another admin or worker to get in first
+        db.session.rollback()
+        taken = db.session.execute(
+            db.select(User.username, User.email).where(
+                db.or_(User.username.in_(usernames), User.email.in_(emails))
+            )
+        ).all()
+        taken_usernames = {username for username, _ in taken}
+        taken_emails = {email for _, email in taken}
+        raise OfficersTaken([row['username'] for row in candidates
+                             if row['username'] in taken_usernames or row['email'] in taken_emails])
+    
+    errors.sort(key=lambda error: error['row'])
+    return [row['username'] for row in candidates], errors
+
+def location_row(user_id, point, when=None):
+    """LocationLog insert parameters for one point sent by a device
+
+    Raises ValueError for a value the database would reject, so buffered
+    rows are checked before they are queued. `when` overrides the point's
+    own timestamp.
+    """
+    latitude, longitude = parse_coordinates(point, required=True)
+    accuracy = point.get('accuracy')
+    if accuracy is not None:
+        accuracy = float(accuracy)
+    activity_type = point.get('activity_type', 'tracking')
+    if not isinstance(activity_type, str) or len(activity_type) > 50:
+        raise ValueError('activity_type must be a string of at most 50 characters')
+    return {
+        'user_id': user_id,
+        'latitude': latitude,
+        'longitude': longitude,
+        'accuracy': accuracy,
+        'timestamp': when or parse_client_timestamp(point.get('timestamp')),
+        'activity_type': activity_type
+    }
+
+def add_meeting(user_id, data, when):
+    latitude, longitude = parse_coordinates(data)
+    meeting = Meeting(
+        user_id=user_id,
+        meeting_type=data['meeting_type'],
+        date=when,
+        person_name=data.get('person_name'),
+        person_category=data.get('person_category'),
+        contact_number=data.get('contact_number'),
+        business_potential=data.get('business_potential'),
+        village=data.get('village'),
+        attendees_count=data.get('attendees_count'),
+        group_meeting_type=data.get('group_meeting_type'),
+        location_lat=latitude,
+        location_lng=longitude,
+        location_name=data.get('location_name'),
+        notes=data.get('notes'),
+        photos=json.dumps(data.get('photos', []))
+    )
+    db.session.add(meeting)
+    record_daily_activity(user_id, meeting.date.date(), meetings=1)
+    return meeting
+
+def add_sample(user_id, data, when):
+    latitude, longitude = parse_coordinates(data)
+    sample = SampleDistribution(
+        user_id=user_id,
+        date=when,
+        recipient_name=data['recipient_name'],
+        recipient_type=data.get('recipient_type'),
+        product_name=data['product_name'],
+        quantity=data['quantity'],
+        unit=data.get('unit', 'kg'),
+        purpose=data.get('purpose'),
+        location_lat=latitude,
+        location_lng=longitude,
+        location_name=data.get('location_name'),
+        notes=data.get('notes')
+    )
+    db.session.add(sample)
+    record_daily_activity(user_id, sample.date.date(), samples=1)
+    return sample
+
+def add_sale(user_id, data, when):
+    latitude, longitude = parse_coordinates(data)
+    sale = Sale(
+        user_id=user_id,
+        date=when,
+        sale_type=data['sale_type'],
+        customer_name=data['customer_name'],
+        customer_type=data.get('customer_type'),
+        contact_number=data.get('contact_number'),
+        product_sku=data['product_sku'],
+        product_name=data['product_name'],
+        pack_size=data.get('pack_size'),
+        quantity=data['quantity'],
+        unit_price=data.get('unit_price'),
+        total_amount=data.get('total_amount'),
+        mode=data.get('mode'),
+        is_repeat_order=data.get('is_repeat_order', False),
+        location_lat=latitude,
+        location_lng=longitude,
+        location_name=data.get('location_name'),
+        notes=data.get('notes')
+    )
+    db.session.add(sale)
+    record_daily_activity(user_id, sale.date.date(), sales=1, revenue=float(sale.total_amount or 0))
+    return sale
+
+def start_work_day(user_id, data, when):
+    """Open the officer's WorkLog for the day of `when`, or return the one already open
+
+    Uses INSERT ... ON CONFLICT DO NOTHING against the partial unique index on
+    open sessions, so concurrent retries can never open a day twice. A retry
+    that loses the race, or comes without a still-valid Idempotency-Key, gets
+    the open session back unchanged.
+    """
+    latitude, longitude = parse_coordinates(data)
+    values = dict(
+        user_id=user_id,
+        date=when.date(),
+        start_time=when,
+        start_location_lat=latitude,
+        start_location_lng=longitude,
+        odometer_start=data.get('odometer'),
+        notes=data.get('notes'),
+        status='started'
+    )
+    table = WorkLog.__table__
+    dialect = db.session.get_bind().dialect.name
+    
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(table).values(**values).on_conflict_do_nothing(
+            index_elements=['user_id', 'date'],
+            index_where=table.c.status == 'started'
+        ).returning(table.c.id)
+        # Pending ORM changes (e.g. an earlier work_end in a sync) must reach the index first
+        db.session.flush()
+        work_log_id = db.session.execute(stmt).scalar()
+        if work_log_id is None:
+            return WorkLog.query.filter_by(user_id=user_id, date=when.date(), status='started').one()
+        work_log = db.session.get(WorkLog, work_log_id)
+        live_feed.publish('work_start', feed_payload(work_log, FEED_WORK_LOG_FIELDS))
+        return work_log
+    
+    work_log = WorkLog.query.filter_by(user_id=user_id, date=when.date(), status='started').first()
+    if work_log:
+        return work_log
+    work_log = WorkLog(**values)
+    db.session.add(work_log)
+    return work_log
+
+def end_work_day(user_id, data, when):
+    """Close the officer's open WorkLog for the day of `when`; ValueError if none"""
+    latitude, longitude = parse_coordinates(data)
+    work_log = WorkLog.query.filter_by(
+        user_id=user_id,
+        date=when.date(),
+        status='started'
+    ).first()
+    
+    if not work_log:
+        raise ValueError('No active work session found')
+    
+    work_log.end_time = when
+    work_log.end_location_lat = latitude
+    work_log.end_location_lng = longitude
+    work_log.odometer_end = data.get('odometer')
+    work_log.status = 'ended'
+    
+    if work_log.odometer_start and work_log.odometer_end:
+        work_log.distance_traveled = work_log.odometer_end - work_log.odometer_start
+        record_daily_activity(user_id, work_log.date, distance=work_log.distance_traveled)
+    
+    # Measure the GPS track before compaction thins it out. The officer's
+    # buffered points go into this transaction: a flush would write them on
+    # a second connection, which waits for the lock this session may hold.
+    if location_buffer.enabled:
+        rows = location_buffer.take(user_id)
+        if rows:
+            add_location_rows(rows)
+    gps_km = gps_track_distances(user_id, work_log.date, work_log.date).get(work_log.date, 0.0)
+    for column, value in gps_distance_fields(work_log.distance_traveled, gps_km).items():
+        setattr(work_log, column, value)
+    
+    if current_app.config['TRACK_COMPACT_ON_END']:
+        compact_track(work_log)
+    return work_log
+
+SYNC_HANDLERS = {
+    'meeting': add_meeting,
+    'sample': add_sample,
+    'sale': add_sale,
+    'work_start': start_work_day,
+    'work_end': end_work_day
+}
+
+class InvalidItem(ValueError):
+    """A batch item that cannot be applied; `index` is its position in the request"""
+    
+    def __init__(self, index, error):
+        super().__init__(f'Invalid item at index {index}: {error}')
+        self.index = index
+
+def sync_field_items(user_id, items):
+    """Apply a device's offline backlog in the current transaction
+
+    Items are applied in client timestamp order, so a work day's track points
+    are stored before its work_end measures them. Raises InvalidItem for the
+    first invalid item. Returns one {'type', 'id'} per item in request order;
+    location points are bulk inserted and get no id.
+    """
+    entries = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise TypeError('item must be an object')
+            if item.get('type') != 'location' and item.get('type') not in SYNC_HANDLERS:
+                raise ValueError(f"type must be one of location, {', '.join(SYNC_HANDLERS)}")
+            entries.append((parse_client_timestamp(item.get('timestamp')), index, item))
+        except (TypeError, ValueError) as e:
+            raise InvalidItem(index, e)
+    
+    records = {}
+    locations = []
+    for when, index, item in sorted(entries, key=lambda entry: entry[:2]):
+        try:
+            if item['type'] == 'location':
+                locations.append(location_row(user_id, item))
+                continue
+            if item['type'] == 'work_end' and locations:
+                add_location_rows(locations)
+                locations = []
+            records[index] = SYNC_HANDLERS[item['type']](user_id, item, when)
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise InvalidItem(index, e)
+    if locations:
+        add_location_rows(locations)
+    db.session.flush()
+    
+    results = []
+    for index, item in enumerate(items):
+        result = {'type': item['type'], 'id': records[index].id if index in records else None}
+        if 'client_id' in item:
+            result['client_id'] = item['client_id']
+        results.append(result)
+    return results
 
 def admin_required(f):
     @wraps(f)
@@ -155,101 +1110,173 @@ def field_officer_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def idempotent(f):
+    """Honour an Idempotency-Key header: a retried request gets the stored response
+
+    The key row is inserted before the view runs and commits with the view's
+    own writes. A concurrent retry therefore conflicts on the unique index
+    instead of writing twice. Only successful responses are kept; a failed
+    request releases its key. Keys expire after IDEMPOTENCY_KEY_TTL seconds.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({'error': 'Idempotency-Key must be at most 255 characters'}), 400
+        
+        now = datetime.utcnow()
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        record = IdempotencyKey(
+            user_id=current_user.id,
+            key=key,
+            endpoint=request.endpoint,
+            request_hash=request_hash,
+            created_at=now,
+            expires_at=now + timedelta(seconds=current_app.config['IDEMPOTENCY_KEY_TTL'])
+        )
+        db.session.add(record)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            previous = IdempotencyKey.query.filter_by(user_id=current_user.id, key=key).first()
+            if previous is None or previous.expires_at < now:
+                if previous is not None:
+                    db.session.delete(previous)
+                    db.session.commit()
+                return decorated_function(*args, **kwargs)
+            if previous.endpoint != request.endpoint or previous.request_hash != request_hash:
+                return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+            if previous.status_code is None:
+                response = jsonify({'error': 'A request with this Idempotency-Key is in progress'})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            response = current_app.response_class(previous.response_body, status=previous.status_code,
+                                                   mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        
+        try:
+            response = current_app.make_response(f(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            raise
+        
+        if response.status_code >= 400:
+            # Keep the key only if the view committed before failing
+            db.session.rollback()
+            if db.inspect(record).transient:
+                return response
+        record.status_code = response.status_code
+        record.response_body = response.get_data(as_text=True)
+        db.session.commit()
+        return response
+    return decorated_function
+
+def purge_idempotency_keys(now=None):
+    """Delete expired IdempotencyKey rows; returns how many"""
+    deleted = db.session.execute(
+        db.delete(IdempotencyKey).where(IdempotencyKey.expires_at < (now or datetime.utcnow()))
+    ).rowcount
+    db.session.commit()
+    return deleted
+
 # ============== ROUTES ==============
 
-@app.route('/')
+@bp.app_errorhandler(HashingBusy)
+def hashing_busy(error):
+    response = jsonify({'error': 'Server busy, please retry'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@bp.app_errorhandler(FeedBusy)
+def feed_busy(error):
+    response = jsonify({'error': 'Too many live feed connections, please retry'})
+    response.headers['Retry-After'] = '30'
+    return response, 503
+
+@bp.route('/')
 def index():
     if current_user.is_authenticated:
         if current_user.role == 'admin':
-            return redirect(url_for('admin_dashboard'))
+            return redirect(url_for('main.admin_dashboard'))
         else:
-            return redirect(url_for('field_dashboard'))
-    return redirect(url_for('login'))
+            return redirect(url_for('main.field_dashboard'))
+    return redirect(url_for('main.login'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     if request.method == 'POST':
         data = request.get_json()
+        password = data.get('password') or ''
         user = User.query.filter_by(username=data.get('username')).first()
         
-        if user and check_password_hash(user.password_hash, data.get('password')):
+        if user and password_hasher.verify(user.password_hash, password):
             if not user.is_active:
                 return jsonify({'error': 'Account is deactivated'}), 403
+            if password_hasher.needs_rehash(user.password_hash):
+                user.password_hash = password_hasher.hash(password)
+                db.session.commit()
             login_user(user)
             return jsonify({
                 'success': True,
                 'role': user.role,
-                'redirect': url_for('admin_dashboard') if user.role == 'admin' else url_for('field_dashboard')
+                'redirect': url_for('main.admin_dashboard') if user.role == 'admin' else url_for('main.field_dashboard')
             })
         return jsonify({'error': 'Invalid credentials'}), 401
     
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
 # ============== ADMIN ROUTES ==============
 
-@app.route('/admin/dashboard')
+@bp.route('/admin/dashboard')
 @login_required
 @admin_required
 def admin_dashboard():
     return render_template('admin_dashboard.html')
 
-@app.route('/api/admin/stats')
+@bp.route('/api/admin/stats')
 @login_required
 @admin_required
+# The 30-day totals come from the daily summary; only today's open sessions,
+# the B2C/B2B split and the all-time state counts read the activity tables
+@response_cache.cached('admin_stats', depends_on=('user', 'work_log', 'meeting', 'sale', 'daily_officer_summary'))
 def admin_stats():
     today = datetime.utcnow().date()
-    week_ago = today - timedelta(days=7)
     month_ago = today - timedelta(days=30)
+    month_start = datetime.combine(month_ago, datetime.min.time())
     
     # Active field officers today
-    active_officers = WorkLog.query.filter(
-        WorkLog.date == today,
-        WorkLog.status == 'started'
-    ).count()
-    
-    # Total meetings this month
-    total_meetings = Meeting.query.filter(
-        Meeting.date >= datetime.combine(month_ago, datetime.min.time())
-    ).count()
+    active_officers = db.session.query(db.func.count(WorkLog.id)).filter(
+        WorkLog.date == today, WorkLog.status == 'started'
+    ).scalar()
     
-    # Total sales this month
-    total_sales = Sale.query.filter(
-        Sale.date >= datetime.combine(month_ago, datetime.min.time())
-    ).count()
+    # Meetings, sales and distance traveled this month
+    total_meetings, total_sales, total_distance = db.session.query(
+        db.func.coalesce(db.func.sum(DailyOfficerSummary.meetings), 0),
+        db.func.coalesce(db.func.sum(DailyOfficerSummary.sales), 0),
+        db.func.coalesce(db.func.sum(DailyOfficerSummary.distance), 0)
+    ).filter(DailyOfficerSummary.day >= month_ago).one()
     
-    # Total distance traveled this month
-    total_distance = db.session.query(db.func.sum(WorkLog.distance_traveled)).filter(
-        WorkLog.date >= month_ago
-    ).scalar() or 0
-    
-    # Sales by type
-    b2c_sales = Sale.query.filter(
-        Sale.date >= datetime.combine(month_ago, datetime.min.time()),
-        Sale.sale_type == 'B2C'
-    ).count()
-    
-    b2b_sales = Sale.query.filter(
-        Sale.date >= datetime.combine(month_ago, datetime.min.time()),
-        Sale.sale_type == 'B2B'
-    ).count()
+    # Sales by type this month; the summary does not keep the split
+    b2c_sales, b2b_sales = db.session.query(
+        db.func.count(db.case((Sale.sale_type == 'B2C', 1))),
+        db.func.count(db.case((Sale.sale_type == 'B2B', 1)))
+    ).filter(Sale.date >= month_start).one()
     
     # State-wise activity
-    state_activity = db.session.query(
-        User.state,
-        db.func.count(Meeting.id).label('meetings'),
-        db.func.count(Sale.id).label('sales')
-    ).outerjoin(Meeting).outerjoin(Sale).filter(
-        User.role == 'field_officer'
-    ).group_by(User.state).all()
+    state_activity = db.session.execute(state_activity_query()).all()
     
     return jsonify({
         'active_officers': active_officers,
@@ -261,24 +1288,20 @@ def admin_stats():
         'state_activity': [{'state': s[0], 'meetings': s[1], 'sales': s[2]} for s in state_activity]
     })
 
-@app.route('/api/admin/users')
+@bp.route('/api/admin/users')
 @login_required
 @admin_required
+@response_cache.conditional('admin_users', watermark=lambda: table_watermark(User))
 def get_users():
-    users = User.query.filter_by(role='field_officer').all()
-    return jsonify([{
-        'id': u.id,
-        'name': u.name,
-        'username': u.username,
-        'email': u.email,
-        'phone': u.phone,
-        'state': u.state,
-        'district': u.district,
-        'is_active': u.is_active,
-        'created_at': u.created_at.isoformat()
-    } for u in users])
-
-@app.route('/api/admin/users', methods=['POST'])
+    # Project only the emitted columns instead of hydrating User objects;
+    # the JSON provider writes each row as an object keyed by column name
+    users = db.session.query(
+        User.id, User.name, User.username, User.email, User.phone,
+        User.state, User.district, User.is_active, User.created_at
+    ).filter(User.role == 'field_officer').all()
+    return jsonify(users)
+
+@bp.route('/api/admin/users', methods=['POST'])
 @login_required
 @admin_required
 def create_user():
@@ -293,7 +1316,7 @@ def create_user():
     user = User(
         username=data['username'],
         email=data['email'],
-        password_hash=generate_password_hash(data['password']),
+        password_hash=password_hasher.hash(data['password']),
         role='field_officer',
         name=data['name'],
         state=data.get('state'),
@@ -305,9 +1328,59 @@ def create_user():
     
     return jsonify({'success': True, 'user_id': user.id})
 
-@app.route('/api/admin/activities')
+@bp.route('/api/admin/users/bulk', methods=['POST'])
+@login_required
+@admin_required
+def bulk_create_users():
+    data_format = 'csv' if request.mimetype == 'text/csv' else 'json'
+    try:
+        rows = parse_officer_rows(request.get_data(as_text=True), data_format)
+    except ValueError:
+        return jsonify({'error': 'Body must be CSV with a header line or a JSON list of users'}), 400
+    if not isinstance(rows, list):
+        return jsonify({'error': 'Body must be CSV with a header line or a JSON list of users'}), 400
+    if len(rows) > current_app.config['USER_BULK_MAX_ROWS']:
+        return jsonify({'error': f"At most {current_app.config['USER_BULK_MAX_ROWS']} users per request"}), 400
+    
+    try:
+        created, errors = bulk_create_officers(rows)
+    except OfficersTaken as e:
+        return jsonify({'error': 'Some officers were created by someone else meanwhile; nothing was imported',
+                        'usernames': e.usernames}), 409
+    
+    return jsonify({
+        'success': not errors,
+        'created': len(created),
+        'usernames': created,
+        'errors': errors
+    })
+
+@bp.route('/api/admin/users/<int:user_id>', methods=['PATCH'])
+@login_required
+@admin_required
+def update_user(user_id):
+    data = request.get_json()
+    user = db.session.get(User, user_id)
+    
+    if not user or user.role != 'field_officer':
+        return jsonify({'error': 'Field officer not found'}), 404
+    if 'email' in data and data['email'] != user.email and User.query.filter_by(email=data['email']).first():
+        return jsonify({'error': 'Email already exists'}), 400
+    # "false" or 0 would be stored as truthy and reactivate the officer
+    if 'is_active' in data and not isinstance(data['is_active'], bool):
+        return jsonify({'error': 'is_active must be true or false'}), 400
+    
+    for field in ('name', 'email', 'phone', 'state', 'district', 'is_active'):
+        if field in data:
+            setattr(user, field, data[field])
+    db.session.commit()
+    
+    return jsonify({'success': True})
+
+@bp.route('/api/admin/activities')
 @login_required
 @admin_required
+@response_cache.cached('admin_activities', depends_on=('user', 'daily_officer_summary'))
 def get_activities():
     days = request.args.get('days', 7, type=int)
     user_id = request.args.get('user_id', type=int)
@@ -317,137 +1390,219 @@ def get_activities():
     query = db.session.query(
         User.name,
         User.state,
-        WorkLog.date,
-        WorkLog.distance_traveled,
-        db.func.count(Meeting.id).label('meetings_count'),
-        db.func.count(Sale.id).label('sales_count')
-    ).join(User).outerjoin(Meeting, db.and_(
-        Meeting.user_id == WorkLog.user_id,
-        db.func.date(Meeting.date) == WorkLog.date
-    )).outerjoin(Sale, db.and_(
-        Sale.user_id == WorkLog.user_id,
-        db.func.date(Sale.date) == WorkLog.date
-    )).filter(WorkLog.date >= start_date.date())
+        DailyOfficerSummary.day.label('date'),
+        DailyOfficerSummary.distance,
+        DailyOfficerSummary.meetings,
+        DailyOfficerSummary.sales
+    ).join(User).filter(DailyOfficerSummary.day >= start_date.date())
     
     if user_id:
-        query = query.filter(WorkLog.user_id == user_id)
-    
-    results = query.group_by(User.name, User.state, WorkLog.date, WorkLog.distance_traveled).all()
+        query = query.filter(DailyOfficerSummary.user_id == user_id)
     
-    return jsonify([{
-        'name': r[0],
-        'state': r[1],
-        'date': r[2].isoformat(),
-        'distance': r[3] or 0,
-        'meetings': r[4],
-        'sales': r[5]
-    } for r in results])
+    return jsonify(query.order_by(DailyOfficerSummary.day.desc(), User.name).all())
 
-@app.route('/api/admin/meetings')
+@bp.route('/api/admin/meetings')
 @login_required
 @admin_required
+@response_cache.conditional('admin_meetings', watermark=lambda: table_watermark(User, Meeting),
+                           depends_on=('user', 'meeting'))
+@response_cache.cached('admin_meetings', depends_on=('user', 'meeting'))
 def get_all_meetings():
-    meetings = Meeting.query.join(User).order_by(Meeting.date.desc()).limit(100).all()
-    return jsonify([{
-        'id': m.id,
-        'officer_name': m.user.name,
-        'type': m.meeting_type,
-        'date': m.date.isoformat(),
-        'person_name': m.person_name,
-        'category': m.person_category,
-        'village': m.village,
-        'attendees': m.attendees_count,
-        'location': m.location_name,
-        'business_potential': m.business_potential
-    } for m in meetings])
-
-@app.route('/api/admin/sales')
+    try:
+        # Labels are the response keys, so rows are emitted without per-row dicts
+        query = db.session.query(
+            Meeting.id, User.name.label('officer_name'), Meeting.meeting_type.label('type'), Meeting.date,
+            Meeting.person_name, Meeting.person_category.label('category'), Meeting.village,
+            Meeting.attendees_count.label('attendees'), Meeting.location_name.label('location'),
+            Meeting.business_potential
+        ).join(User, Meeting.user_id == User.id)
+        query = filter_activity_query(query, Meeting, **activity_filter_args())
+        meetings, next_cursor = keyset_page(query, Meeting)
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid filter or cursor'}), 400
+    
+    return jsonify({'items': meetings, 'next_cursor': next_cursor})
+
+@bp.route('/api/admin/sales')
 @login_required
 @admin_required
+@response_cache.conditional('admin_sales', watermark=lambda: table_watermark(User, Sale),
+                           depends_on=('user', 'sale'))
+@response_cache.cached('admin_sales', depends_on=('user', 'sale'))
 def get_all_sales():
-    sales = Sale.query.join(User).order_by(Sale.date.desc()).limit(100).all()
-    return jsonify([{
-        'id': s.id,
-        'officer_name': s.user.name,
-        'date': s.date.isoformat(),
-        'type': s.sale_type,
-        'customer': s.customer_name,
-        'product': s.product_name,
-        'quantity': s.quantity,
-        'amount': s.total_amount,
-        'location': s.location_name,
-        'repeat_order': s.is_repeat_order
-    } for s in sales])
+    sale_type = request.args.get('sale_type')
+    product_sku = request.args.get('product_sku')
+    
+    query = db.session.query(
+        Sale.id, User.name.label('officer_name'), Sale.date, Sale.sale_type.label('type'),
+        Sale.customer_name.label('customer'), Sale.product_name.label('product'), Sale.quantity,
+        Sale.total_amount.label('amount'), Sale.location_name.label('location'),
+        Sale.is_repeat_order.label('repeat_order')
+    ).join(User, Sale.user_id == User.id)
+    if sale_type:
+        query = query.filter(Sale.sale_type == sale_type)
+    if product_sku:
+        query = query.filter(Sale.product_sku == product_sku)
+    
+    try:
+        query = filter_activity_query(query, Sale, **activity_filter_args())
+        sales, next_cursor = keyset_page(query, Sale)
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid filter or cursor'}), 400
+    
+    return jsonify({'items': sales, 'next_cursor': next_cursor})
+
+@bp.route('/api/admin/users/<int:user_id>/track')
+@login_required
+@admin_required
+def user_track(user_id):
+    try:
+        date_from = parse_date_arg('from')
+        date_to = parse_date_arg('to')
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    if not date_from or not date_to or date_to < date_from:
+        return jsonify({'error': 'from and to are required, with from <= to'}), 400
+    if (date_to - date_from).days >= current_app.config['TRACK_MAX_DAYS']:
+        return jsonify({'error': f"At most {current_app.config['TRACK_MAX_DAYS']} days per request"}), 400
+    
+    start = datetime.combine(date_from, datetime.min.time())
+    end = datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+    live = db.session.execute(
+        db.select(*(getattr(LocationLog, field) for field in LocationArchive.FIELDS))
+        .where(LocationLog.user_id == user_id, LocationLog.timestamp >= start, LocationLog.timestamp < end)
+    ).mappings().all()
+    # Older points come from the archive files; ids seen in both are the same point
+    archived = location_archive.read(user_id, start, end)
+    points = {row['id']: dict(row) for row in archived}
+    points.update((row['id'], dict(row)) for row in live)
+    
+    return jsonify({
+        'user_id': user_id,
+        'archived_points': len(archived),
+        'points': [{
+            'timestamp': point['timestamp'].isoformat(),
+            'latitude': point['latitude'],
+            'longitude': point['longitude'],
+            'accuracy': point['accuracy'],
+            'activity_type': point['activity_type']
+        } for point in sorted(points.values(), key=lambda point: (point['timestamp'], point['id']))]
+    })
+
+@bp.route('/api/admin/map')
+@login_required
+@admin_required
+# Not invalidated by location_log: pings arrive every few seconds and would
+# keep every map entry cold, so the locations layer refreshes on the TTL
+@response_cache.cached('admin_map', depends_on=('meeting', 'sale', 'sample_distribution'))
+def admin_map():
+    layers = request.args.get('layers') or ','.join(DEFAULT_MAP_LAYERS)
+    layers = [layer.strip() for layer in layers.split(',') if layer.strip()]
+    unknown = [layer for layer in layers if layer not in MAP_LAYERS]
+    if unknown:
+        return jsonify({'error': f"Unknown layers: {', '.join(unknown)}"}), 400
+    
+    try:
+        bbox = geo.parse_bbox(request.args.get('bbox', ''))
+        date_from = parse_date_arg('from')
+        date_to = parse_date_arg('to')
+    except ValueError:
+        return jsonify({'error': 'bbox must be min_lng,min_lat,max_lng,max_lat and dates YYYY-MM-DD'}), 400
+    
+    precision = geo.precision_for_bbox(bbox, current_app.config['MAP_MAX_CELLS'])
+    return jsonify({
+        'bbox': list(bbox),
+        'precision': precision,
+        'layers': {layer: map_layer(layer, bbox, precision, date_from, date_to) for layer in layers}
+    })
+
+@bp.route('/api/admin/export/<table>')
+@login_required
+@admin_required
+def export_table(table):
+    model = EXPORT_MODELS.get(table)
+    if model is None:
+        return jsonify({'error': f'Unknown export table: {table}'}), 404
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format: {export_format}'}), 400
+    
+    try:
+        query = export_query(model, **activity_filter_args())
+    except ValueError:
+        return jsonify({'error': 'Invalid filter'}), 400
+    
+    serializer, mimetype = EXPORT_FORMATS[export_format]
+    columns = [column['name'] for column in query.column_descriptions]
+    filename = f"{table}-{datetime.utcnow().date().isoformat()}.{export_format}"
+    
+    return Response(
+        stream_with_context(serializer(columns, query, current_app.config['EXPORT_CHUNK_SIZE'])),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@bp.route('/api/admin/cache')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+@bp.route('/api/admin/location-buffer')
+@login_required
+@admin_required
+def location_buffer_stats():
+    return jsonify(location_buffer.stats())
+
+@bp.route('/api/admin/stream')
+@login_required
+@admin_required
+def admin_stream():
+    """Server-Sent Events feed of new activity, work days and officer positions"""
+    # EventSource resends the last id it saw when it reconnects
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return live_feed.response(last_event_id)
 
 # ============== FIELD OFFICER ROUTES ==============
 
-@app.route('/field/dashboard')
+@bp.route('/field/dashboard')
 @login_required
 @field_officer_required
 def field_dashboard():
     return render_template('field_dashboard.html')
 
-@app.route('/api/field/worklog/start', methods=['POST'])
+@bp.route('/api/field/worklog/start', methods=['POST'])
 @login_required
 @field_officer_required
+@idempotent
 def start_work():
     data = request.get_json()
-    today = datetime.utcnow().date()
     
-    # Check if already started today
-    existing = WorkLog.query.filter_by(
-        user_id=current_user.id,
-        date=today,
-        status='started'
-    ).first()
-    
-    if existing:
-        return jsonify({'error': 'Work already started today'}), 400
-    
-    work_log = WorkLog(
-        user_id=current_user.id,
-        date=today,
-        start_time=datetime.utcnow(),
-        start_location_lat=data.get('latitude'),
-        start_location_lng=data.get('longitude'),
-        odometer_start=data.get('odometer'),
-        notes=data.get('notes')
-    )
-    db.session.add(work_log)
+    try:
+        work_log = start_work_day(current_user.id, data, datetime.utcnow())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     db.session.commit()
     
     return jsonify({'success': True, 'worklog_id': work_log.id})
 
-@app.route('/api/field/worklog/end', methods=['POST'])
+@bp.route('/api/field/worklog/end', methods=['POST'])
 @login_required
 @field_officer_required
+@idempotent
 def end_work():
     data = request.get_json()
-    today = datetime.utcnow().date()
-    
-    work_log = WorkLog.query.filter_by(
-        user_id=current_user.id,
-        date=today,
-        status='started'
-    ).first()
-    
-    if not work_log:
-        return jsonify({'error': 'No active work session found'}), 400
-    
-    work_log.end_time = datetime.utcnow()
-    work_log.end_location_lat = data.get('latitude')
-    work_log.end_location_lng = data.get('longitude')
-    work_log.odometer_end = data.get('odometer')
-    work_log.status = 'ended'
-    
-    if work_log.odometer_start and work_log.odometer_end:
-        work_log.distance_traveled = work_log.odometer_end - work_log.odometer_start
     
+    try:
+        end_work_day(current_user.id, data, datetime.utcnow())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     db.session.commit()
     
     return jsonify({'success': True})
 
-@app.route('/api/field/worklog/status')
+@bp.route('/api/field/worklog/status')
 @login_required
 @field_officer_required
 def worklog_status():
@@ -466,111 +1621,153 @@ def worklog_status():
         'end_time': work_log.end_time.isoformat() if work_log.end_time else None
     })
 
-@app.route('/api/field/meeting', methods=['POST'])
+@bp.route('/api/field/meeting', methods=['POST'])
 @login_required
 @field_officer_required
+@idempotent
 def create_meeting():
     data = request.get_json()
     
-    meeting = Meeting(
-        user_id=current_user.id,
-        meeting_type=data['meeting_type'],
-        date=datetime.utcnow(),
-        person_name=data.get('person_name'),
-        person_category=data.get('person_category'),
-        contact_number=data.get('contact_number'),
-        business_potential=data.get('business_potential'),
-        village=data.get('village'),
-        attendees_count=data.get('attendees_count'),
-        group_meeting_type=data.get('group_meeting_type'),
-        location_lat=data.get('latitude'),
-        location_lng=data.get('longitude'),
-        location_name=data.get('location_name'),
-        notes=data.get('notes'),
-        photos=json.dumps(data.get('photos', []))
-    )
-    db.session.add(meeting)
+    try:
+        meeting = add_meeting(current_user.id, data, datetime.utcnow())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     db.session.commit()
     
     return jsonify({'success': True, 'meeting_id': meeting.id})
 
-@app.route('/api/field/sample', methods=['POST'])
+@bp.route('/api/field/sample', methods=['POST'])
 @login_required
 @field_officer_required
+@idempotent
 def create_sample():
     data = request.get_json()
     
-    sample = SampleDistribution(
-        user_id=current_user.id,
-        date=datetime.utcnow(),
-        recipient_name=data['recipient_name'],
-        recipient_type=data.get('recipient_type'),
-        product_name=data['product_name'],
-        quantity=data['quantity'],
-        unit=data.get('unit', 'kg'),
-        purpose=data.get('purpose'),
-        location_lat=data.get('latitude'),
-        location_lng=data.get('longitude'),
-        location_name=data.get('location_name'),
-        notes=data.get('notes')
-    )
-    db.session.add(sample)
+    try:
+        sample = add_sample(current_user.id, data, datetime.utcnow())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     db.session.commit()
     
     return jsonify({'success': True, 'sample_id': sample.id})
 
-@app.route('/api/field/sale', methods=['POST'])
+@bp.route('/api/field/sale', methods=['POST'])
 @login_required
 @field_officer_required
+@idempotent
 def create_sale():
     data = request.get_json()
     
-    sale = Sale(
-        user_id=current_user.id,
-        date=datetime.utcnow(),
-        sale_type=data['sale_type'],
-        customer_name=data['customer_name'],
-        customer_type=data.get('customer_type'),
-        contact_number=data.get('contact_number'),
-        product_sku=data['product_sku'],
-        product_name=data['product_name'],
-        pack_size=data.get('pack_size'),
-        quantity=data['quantity'],
-        unit_price=data.get('unit_price'),
-        total_amount=data.get('total_amount'),
-        mode=data.get('mode'),
-        is_repeat_order=data.get('is_repeat_order', False),
-        location_lat=data.get('latitude'),
-        location_lng=data.get('longitude'),
-        location_name=data.get('location_name'),
-        notes=data.get('notes')
-    )
-    db.session.add(sale)
+    try:
+        sale = add_sale(current_user.id, data, datetime.utcnow())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     db.session.commit()
     
     return jsonify({'success': True, 'sale_id': sale.id})
 
-@app.route('/api/field/location', methods=['POST'])
+@bp.route('/api/field/location', methods=['POST'])
 @login_required
 @field_officer_required
+@idempotent
 def log_location():
     data = request.get_json()
     
-    location = LocationLog(
-        user_id=current_user.id,
-        latitude=data['latitude'],
-        longitude=data['longitude'],
-        accuracy=data.get('accuracy'),
-        activity_type=data.get('activity_type', 'tracking')
-    )
+    try:
+        row = location_row(current_user.id, data, when=datetime.utcnow())
+    except (TypeError, ValueError, AttributeError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if location_buffer.enabled:
+        if not location_buffer.enqueue([row]):
+            return jsonify({'error': 'Location buffer full, retry later'}), 503
+        return jsonify({'success': True, 'queued': True})
+    
+    location = LocationLog(**row)
     db.session.add(location)
+    record_daily_activity(current_user.id, location.timestamp.date(), location_points=1)
     db.session.commit()
     
     return jsonify({'success': True})
 
-@app.route('/api/field/my-activities')
+@bp.route('/api/field/location/batch', methods=['POST'])
 @login_required
 @field_officer_required
+@idempotent
+def log_location_batch():
+    data = request.get_json()
+    points = data.get('points') if isinstance(data, dict) else data
+    
+    if not isinstance(points, list) or not points:
+        return jsonify({'error': 'points must be a non-empty array'}), 400
+    if len(points) > current_app.config['LOCATION_BATCH_MAX_POINTS']:
+        return jsonify({'error': f"At most {current_app.config['LOCATION_BATCH_MAX_POINTS']} points per batch"}), 400
+    
+    rows = []
+    for index, point in enumerate(points):
+        try:
+            rows.append(location_row(current_user.id, point))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            return jsonify({'error': f'Invalid point at index {index}: {e}', 'index': index}), 400
+    
+    if location_buffer.enabled:
+        if not location_buffer.enqueue(rows):
+            return jsonify({'error': 'Location buffer full, retry later'}), 503
+        return jsonify({'success': True, 'inserted': len(rows), 'queued': True})
+    
+    # One executemany INSERT and a single commit for the whole batch
+    write_location_rows(rows)
+    
+    return jsonify({'success': True, 'inserted': len(rows)})
+
+@bp.route('/api/field/photos', methods=['POST'])
+@login_required
+@field_officer_required
+def upload_photos():
+    """Store multipart `photo` files; attach the returned URLs to a meeting's photos"""
+    # Not @idempotent: that would buffer the whole body to hash it, and a
+    # repeated upload already resolves to the same stored file
+    if request.mimetype != 'multipart/form-data':
+        return jsonify({'error': 'Upload photos as multipart/form-data'}), 400
+    try:
+        photos = photo_store.receive(request)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'success': True, 'photos': photos})
+
+@bp.route('/api/field/sync', methods=['POST'])
+@login_required
+@field_officer_required
+@idempotent
+def sync_field_data():
+    """Upload work logged offline: one transaction for the whole batch"""
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty array'}), 400
+    if len(items) > current_app.config['SYNC_MAX_ITEMS']:
+        return jsonify({'error': f"At most {current_app.config['SYNC_MAX_ITEMS']} items per sync"}), 400
+    
+    try:
+        results = sync_field_items(current_user.id, items)
+        db.session.commit()
+    except InvalidItem as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'index': e.index}), 400
+    except IntegrityError as e:
+        db.session.rollback()
+        return jsonify({'error': f'Invalid batch: {e.orig}'}), 400
+    
+    return jsonify({'success': True, 'synced': len(results), 'results': results})
+
+@bp.route('/api/field/my-activities')
+@login_required
+@field_officer_required
+# The 7-day window moves every second, so no write watermark can tell when
+# the totals change; the ETag is a hash of the (small) body instead
+@response_cache.conditional('my_activities')
 def my_activities():
     days = request.args.get('days', 7, type=int)
     start_date = datetime.utcnow() - timedelta(days=days)
@@ -602,9 +1799,58 @@ def my_activities():
         'distance': round(distance, 2)
     })
 
+# ============== APPLICATION FACTORY ==============
+
+def sqlite_pragmas(app_config):
+    """Connect listener applying the SQLITE_* settings to every new connection"""
+    pragmas = (
+        f"PRAGMA journal_mode={app_config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={app_config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA mmap_size={int(app_config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA busy_timeout={int(app_config['SQLITE_BUSY_TIMEOUT'])}"
+    )
+    
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+    return on_connect
+
+def create_app(config_name=None):
+    """Build an app from config.py; `config_name` defaults to FLASK_ENV"""
+    app = Flask(__name__)
+    config_class = get_config(config_name)
+    app.config.from_object(config_class)
+    config_class.init_app(app)
+    app.json = FastJSONProvider(app)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    
+    db.init_app(app)
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        with app.app_context():
+            db.event.listen(db.engine, 'connect', sqlite_pragmas(app.config))
+    
+    login_manager.init_app(app)
+    response_cache.init_app(app)
+    live_feed.init_app(app)
+    # Per-app instances; each registers itself in app.extensions
+    PasswordHasher(app)
+    # A lost connection or a locked database is retried; bad rows are bisected out
+    LocationWriteBuffer(write_location_rows, app, retryable=lambda exc: isinstance(exc, OperationalError))
+    LocationArchive(app)
+    PhotoStore(app)
+    Compressor(app)
+    app.extensions['user_cache'] = LRUCacheBackend(app.config['USER_CACHE_MAX_ENTRIES'])
+    app.register_blueprint(bp)
+    
+    # Ensure upload folder exists
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    return app
+
 # ============== INITIALIZATION ==============
 
-def init_db():
+def init_db(app):
     with app.app_context():
         db.create_all()
         
@@ -623,5 +1869,6 @@ def init_db():
             print("Default admin created: username='admin', password='admin123'")
 
 if __name__ == '__main__':
-    init_db()
+    app = create_app()
+    init_db(app)
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,320 @@
+"""
+Performance Benchmarks for Occamy Field Operations System
+Runs against a throwaway in-memory SQLite database, never the app database
+Run with: python benchmarks.py
+"""
+
+import math
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from app import db, User, Meeting, Sale, LocationLog, state_activity_query
+import geo
+from password_hashing import PasswordHasher
+import json_provider
+from json_provider import FastJSONProvider
+
+STATES = ['Uttar Pradesh', 'Punjab', 'Gujarat', 'Bihar', 'Maharashtra']
+
+
+def timed(func, repeat=3):
+    """Best wall-clock time of several runs, in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def seed_officers(session, officers):
+    """Create field officers spread over the states, returning their ids"""
+    session.execute(insert(User), [{
+        'username': f'officer_{i}',
+        'email': f'officer_{i}@occamy.com',
+        'password_hash': 'x',
+        'role': 'field_officer',
+        'name': f'Officer {i}',
+        'state': STATES[i % len(STATES)]
+    } for i in range(officers)])
+    return [row[0] for row in session.execute(db.select(User.id))]
+
+
+def seed_activity(session, officers, per_officer):
+    """Create officers that each have `per_officer` meetings and sales"""
+    now = datetime.utcnow()
+    user_ids = seed_officers(session, officers)
+
+    session.execute(insert(Meeting), [{
+        'user_id': user_id,
+        'meeting_type': 'one_on_one',
+        'date': now - timedelta(hours=random.randint(0, 24 * 30))
+    } for user_id in user_ids for _ in range(per_officer)])
+    session.execute(insert(Sale), [{
+        'user_id': user_id,
+        'date': now - timedelta(hours=random.randint(0, 24 * 30)),
+        'sale_type': random.choice(['B2C', 'B2B']),
+        'customer_name': 'Customer',
+        'product_sku': 'NUT-001',
+        'product_name': 'Calcium Supplement',
+        'quantity': 1
+    } for user_id in user_ids for _ in range(per_officer)])
+    session.commit()
+
+
+def legacy_state_activity_query():
+    """The original User -> Meeting -> Sale outer join, kept for comparison"""
+    return db.select(
+        User.state,
+        db.func.count(Meeting.id),
+        db.func.count(Sale.id)
+    ).outerjoin(Meeting, Meeting.user_id == User.id).outerjoin(
+        Sale, Sale.user_id == User.id
+    ).where(User.role == 'field_officer').group_by(User.state)
+
+
+def benchmark_state_activity(officers=50, scales=(50, 100, 200, 400)):
+    """Time state_activity as per-officer activity grows"""
+    print("state_activity: pre-aggregated subqueries vs fan-out join")
+    print(f"{'rows':>8} {'subqueries (ms)':>16} {'fan-out (ms)':>14}")
+
+    for per_officer in scales:
+        engine = create_engine('sqlite://')
+        db.metadata.create_all(engine)
+        with Session(engine) as session:
+            seed_activity(session, officers, per_officer)
+            new_ms = timed(lambda: session.execute(state_activity_query()).all())
+            old_ms = timed(lambda: session.execute(legacy_state_activity_query()).all(), repeat=1)
+        engine.dispose()
+
+        rows = officers * per_officer * 2
+        print(f"{rows:>8} {new_ms:>16.2f} {old_ms:>14.2f}")
+    print()
+
+
+def seed_track(session, user_id, day_start, points):
+    """A day of one-minute pings: straight road legs and long stops, with GPS jitter"""
+    lat, lng = 30.9, 75.85
+    rows = []
+    for minute in range(points):
+        if minute % 60 == 0:
+            heading = random.uniform(0, 2 * math.pi)
+        if (minute // 60) % 2 == 0:  # on the move every other hour
+            lat += 0.004 * math.cos(heading)
+            lng += 0.004 * math.sin(heading)
+        rows.append({
+            'user_id': user_id,
+            'latitude': lat + random.gauss(0, 0.00002),
+            'longitude': lng + random.gauss(0, 0.00002),
+            'timestamp': day_start + timedelta(minutes=minute),
+            'activity_type': 'meeting' if minute % 97 == 0 else 'tracking'
+        })
+    session.execute(insert(LocationLog), rows)
+
+
+def benchmark_track_compaction(officers=20, points=500, tolerance_m=10):
+    """Rows stored and one-day replay time before and after track compaction"""
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    day_start = datetime(2024, 3, 1)
+    replay = lambda: [session.execute(
+        db.select(LocationLog.latitude, LocationLog.longitude).where(LocationLog.user_id == user_id)
+        .order_by(LocationLog.timestamp)
+    ).all() for user_id in user_ids]
+
+    with Session(engine) as session:
+        user_ids = seed_officers(session, officers)
+        for user_id in user_ids:
+            seed_track(session, user_id, day_start, points)
+        session.commit()
+        rows_before = session.query(LocationLog).count()
+        replay_before = timed(replay)
+
+        start = time.perf_counter()
+        for user_id in user_ids:
+            track = session.execute(
+                db.select(LocationLog.id, LocationLog.latitude, LocationLog.longitude, LocationLog.activity_type)
+                .where(LocationLog.user_id == user_id).order_by(LocationLog.timestamp)
+            ).all()
+            keep = [i for i, row in enumerate(track) if row.activity_type != 'tracking']
+            kept = set(geo.simplify([(row.latitude, row.longitude) for row in track], tolerance_m, keep))
+            session.execute(db.delete(LocationLog).where(
+                LocationLog.id.in_([row.id for i, row in enumerate(track) if i not in kept])
+            ))
+        session.commit()
+        compaction_ms = (time.perf_counter() - start) * 1000
+
+        rows_after = session.query(LocationLog).count()
+        replay_after = timed(replay)
+    engine.dispose()
+
+    print(f"track compaction: {officers} officers x {points} points, tolerance {tolerance_m} m")
+    print(f"{'':>8} {'rows':>8} {'replay (ms)':>12}")
+    print(f"{'before':>8} {rows_before:>8} {replay_before:>12.2f}")
+    print(f"{'after':>8} {rows_after:>8} {replay_after:>12.2f}")
+    print(f"compression {rows_before / rows_after:.1f}x, compaction took {compaction_ms:.0f} ms")
+    print()
+
+
+def benchmark_gps_distance(officers=50, days=30, points=300):
+    """Time measuring a month of every officer's tracks, per engine"""
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    with Session(engine) as session:
+        user_ids = seed_officers(session, officers)
+        for user_id in user_ids:
+            for day in range(days):
+                seed_track(session, user_id, datetime(2024, 3, 1) + timedelta(days=day), points)
+        session.commit()
+
+        tracks = []
+
+        def load():
+            tracks.clear()
+            for user_id in user_ids:
+                rows = session.execute(
+                    db.select(LocationLog.timestamp, LocationLog.latitude, LocationLog.longitude,
+                              LocationLog.accuracy)
+                    .where(LocationLog.user_id == user_id).order_by(LocationLog.timestamp)
+                ).all()
+                times, lats, lngs, accuracies = zip(*rows)
+                tracks.append((list(times), lats, lngs, [10 if a is None else a for a in accuracies]))
+
+        def measure(track_lengths):
+            for track in tracks:
+                track_lengths(*track, 120 / 3.6, 100)
+
+        print(f"GPS distance: {officers} officers x {days} days x {points} points")
+        print(f"{'load tracks (ms)':>24} {timed(load, repeat=1):>8.0f}")
+        engines = [('python', geo._track_lengths_python)]
+        if geo.np is not None:
+            engines.insert(0, ('numpy', geo._track_lengths_numpy))
+        for name, track_lengths in engines:
+            print(f"{name + ' haversine (ms)':>24} {timed(lambda: measure(track_lengths), repeat=1):>8.0f}")
+    engine.dispose()
+    print()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def benchmark_password_hashing(logins=32, threads=8, workers=(0, 2)):
+    """Latency of a login storm and of cheap requests served alongside it
+
+    With workers=0 verification runs inline on the request thread and holds
+    the GIL for the whole hash; with a pool it runs in other processes.
+    """
+    print(f"login storm: {logins} logins over {threads} threads")
+    print(f"{'pool workers':>12} {'login p50 (ms)':>15} {'login p95 (ms)':>15} {'other p95 (ms)':>15}")
+
+    for pool_workers in workers:
+        stub = Flask(__name__)
+        stub.config['PASSWORD_HASH_WORKERS'] = pool_workers
+        stub.config['PASSWORD_HASH_MAX_CONCURRENT'] = threads
+        hasher = PasswordHasher(stub)
+        pwhash = hasher.hash('secret')
+
+        def login():
+            start = time.perf_counter()
+            hasher.verify(pwhash, 'secret')
+            return (time.perf_counter() - start) * 1000
+
+        def other_request():
+            start = time.perf_counter()
+            sum(range(20000))
+            return (time.perf_counter() - start) * 1000
+
+        with ThreadPoolExecutor(max_workers=threads + 1) as pool:
+            storm = [pool.submit(login) for _ in range(logins)]
+            others = []
+            while not all(future.done() for future in storm):
+                others.append(other_request())
+                time.sleep(0.005)
+            login_ms = [future.result() for future in storm]
+        hasher.shutdown()
+
+        print(f"{pool_workers:>12} {statistics.median(login_ms):>15.1f} "
+              f"{percentile(login_ms, 0.95):>15.1f} {percentile(others or [0], 0.95):>15.2f}")
+    print()
+
+
+def benchmark_json_serialization(rows=10000):
+    """Encode a 10k-row meetings page: per-row dicts vs rows through the provider
+
+    'dicts' is how the list views used to build responses, with Flask's
+    default provider. The provider rows are encoded with the standard
+    library and, when installed, with orjson.
+    """
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    with Session(engine) as session:
+        seed_activity(session, 20, rows // 20)
+        meetings = session.execute(db.select(
+            Meeting.id, User.name.label('officer_name'), Meeting.meeting_type.label('type'), Meeting.date,
+            Meeting.person_name, Meeting.person_category.label('category'), Meeting.village,
+            Meeting.attendees_count.label('attendees'), Meeting.location_name.label('location'),
+            Meeting.business_potential
+        ).join(User, Meeting.user_id == User.id)).all()
+    engine.dispose()
+
+    stub = Flask(__name__)
+    default = DefaultJSONProvider(stub)
+    provider = FastJSONProvider(stub)
+
+    def dicts():
+        return default.response({'items': [{
+            'id': m.id,
+            'officer_name': m.officer_name,
+            'type': m.type,
+            'date': m.date.isoformat(),
+            'person_name': m.person_name,
+            'category': m.category,
+            'village': m.village,
+            'attendees': m.attendees,
+            'location': m.location,
+            'business_potential': m.business_potential
+        } for m in meetings]}).get_data()
+
+    def provider_rows(fast):
+        def encode():
+            stub.config['JSON_FAST_ENCODER'] = fast
+            return provider.response({'items': meetings}).get_data()
+        return encode
+
+    print(f"JSON serialization: {len(meetings)} meeting rows")
+    print(f"{'path':>24} {'encode (ms)':>12} {'bytes':>9}")
+    paths = [('dicts + json', dicts), ('rows + json', provider_rows(False))]
+    if json_provider.orjson is not None:
+        paths.append(('rows + orjson', provider_rows(True)))
+    for name, encode in paths:
+        print(f"{name:>24} {timed(encode, repeat=5):>12.1f} {len(encode()):>9}")
+    print()
+
+
+def main():
+    print("=" * 60)
+    print("Occamy Field Operations - Benchmarks")
+    print("=" * 60)
+    print()
+    random.seed(42)
+    benchmark_state_activity()
+    benchmark_track_compaction()
+    benchmark_gps_distance()
+    benchmark_password_hashing()
+    benchmark_json_serialization()
+
+
+if __name__ == '__main__':
+    main()
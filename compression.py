@@ -0,0 +1,84 @@
+"""
+In-app response compression
+gzip, or brotli when installed, for large responses when no proxy in front
+of the app compresses them
+"""
+
+import gzip
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+
+class Compressor:
+    """Compresses large responses in an encoding the client accepts
+
+    Streamed responses (the live feed, CSV exports) and files are left alone.
+    A strong ETag becomes weak, since the compressed body is only
+    semantically equal to the uncompressed one.
+
+    - COMPRESS_ENABLED: compress at all; turn off behind a proxy that compresses
+    - COMPRESS_MIN_SIZE: bytes; smaller bodies are sent as they are
+    - COMPRESS_MIMETYPES: response types worth compressing
+    - COMPRESS_LEVEL: gzip level
+    - COMPRESS_BROTLI_QUALITY: brotli quality; low values are fast enough per request
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_MIMETYPES', {'application/json', 'text/html', 'text/csv'})
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BROTLI_QUALITY', 4)
+        app.after_request(self.compress)
+        app.extensions['compressor'] = self
+        self.app = app
+
+    @staticmethod
+    def encodings():
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def choose(self, accept_encodings):
+        """Best supported encoding by the client's q-values, or None"""
+        best, best_quality = None, 0
+        for encoding in self.encodings():
+            quality = accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress(self, response):
+        config = current_app.config
+        if (not config['COMPRESS_ENABLED'] or response.status_code != 200
+                or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in config['COMPRESS_MIMETYPES']):
+            return response
+
+        body = response.get_data()
+        if len(body) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if encoding == 'br':
+            body = brotli.compress(body, quality=config['COMPRESS_BROTLI_QUALITY'])
+        else:
+            body = gzip.compress(body, compresslevel=config['COMPRESS_LEVEL'], mtime=0)
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
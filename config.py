@@ -19,6 +19,12 @@ class Config:
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'static/uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf'}
+    PHOTO_UPLOAD_DIR = os.path.join(UPLOAD_FOLDER, 'photos')  # content-addressed meeting photos
+    PHOTO_URL_PREFIX = '/static/uploads/photos'  # must serve PHOTO_UPLOAD_DIR
+    PHOTO_MAX_FILES = 10  # per upload request
+    PHOTO_MAX_DIMENSION = 1600  # px; larger photos are downscaled after upload
+    PHOTO_THUMBNAIL_SIZE = 320  # px
+    PHOTO_WORKERS = 2  # image processing threads per worker process
     
     # Session
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
@@ -26,15 +32,91 @@ class Config:
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
     
-    # Pagination
+    # Database engine (pool settings apply to server databases, SQLITE_* to SQLite)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_RECYCLE = 1800  # seconds
+    DB_POOL_PRE_PING = True
+    DB_STATEMENT_TIMEOUT = 30000  # milliseconds, PostgreSQL only
+    SQLITE_JOURNAL_MODE = 'WAL'
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # bytes
+    SQLITE_BUSY_TIMEOUT = 5000  # milliseconds
+    
+    # Pagination and exports
     ITEMS_PER_PAGE = 50
+    MAX_ITEMS_PER_PAGE = 500
+    EXPORT_CHUNK_SIZE = 1000
+    USER_BULK_MAX_ROWS = 1000
+    
+    # Admin map
+    MAP_MAX_CELLS = 256  # grid cells per request, sets the clustering precision
+    MAP_MAX_POINTS = 500  # per layer; above this points are clustered by cell
     
     # Location tracking
     LOCATION_LOG_INTERVAL = 60  # seconds
+    LOCATION_BATCH_MAX_POINTS = 1000
+    LOCATION_BUFFER_ENABLED = os.environ.get('LOCATION_BUFFER_ENABLED', '').lower() in ('1', 'true', 'yes')
+    LOCATION_BUFFER_MAX_SIZE = 10000
+    LOCATION_BUFFER_FLUSH_SIZE = 500
+    LOCATION_BUFFER_FLUSH_INTERVAL = 5  # seconds
+    TRACK_TOLERANCE_M = 10  # max deviation of dropped points from the compacted track
+    TRACK_COMPACT_ON_END = True  # compact the day's track when the work day ends
+    GPS_MAX_SPEED_KMH = 120  # faster steps are GPS glitches, not travel
+    GPS_MAX_ACCURACY_M = 100  # fixes reported less accurate than this are ignored
+    GPS_DEFAULT_ACCURACY_M = 10  # assumed when a device sends no accuracy
+    LOCATION_RETENTION_DAYS = 90  # older points move to compressed archive files
+    LOCATION_ARCHIVE_BATCH_SIZE = 5000
+    TRACK_MAX_DAYS = 31  # per admin track request
+    SYNC_MAX_ITEMS = 5000  # records and location points per offline sync upload
+    IDEMPOTENCY_KEY_TTL = 24 * 3600  # seconds a field POST can be safely retried with the same key
+    
+    # Caching
+    CACHE_ENABLED = True
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')  # shared cache across workers
+    CACHE_MAX_ENTRIES = 1024
+    CACHE_TTLS = {  # seconds
+        'admin_stats': 30,
+        'admin_activities': 60,
+        'admin_meetings': 15,
+        'admin_sales': 15,
+        'admin_map': 30
+    }
+    ETAG_ENABLED = True  # 304 Not Modified for unchanged list responses
+    USER_CACHE_TTL = 30  # seconds a deactivation may take to reach other workers
+    USER_CACHE_MAX_ENTRIES = 10000
+    
+    # Response compression (leave to the proxy when it compresses, as nginx.conf does)
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    COMPRESS_MIN_SIZE = 1024  # bytes
+    COMPRESS_MIMETYPES = {'application/json', 'text/html', 'text/csv'}
+    COMPRESS_LEVEL = 6  # gzip
+    COMPRESS_BROTLI_QUALITY = 4  # used when the brotli package is installed
+    
+    # Admin live feed (Server-Sent Events)
+    LIVE_FEED_ENABLED = True
+    LIVE_FEED_REDIS_URL = os.environ.get('LIVE_FEED_REDIS_URL', CACHE_REDIS_URL)  # share events across workers
+    LIVE_FEED_HISTORY = 500  # events a reconnecting dashboard can catch up on
+    LIVE_FEED_HEARTBEAT = 15  # seconds; keeps idle streams open through proxies
+    LIVE_FEED_MAX_STREAM_SECONDS = 300  # then the browser reconnects with Last-Event-ID
+    LIVE_FEED_MAX_CLIENTS = 4  # open streams per worker process, keep below gunicorn --threads
+    
+    # Password hashing
+    PASSWORD_HASH_METHOD = 'scrypt'  # existing hashes are upgraded on login
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_MAX_CONCURRENT = 4
+    
+    # JSON
+    JSON_FAST_ENCODER = True  # orjson when installed, else the standard library
     
     # Application settings
     APP_NAME = 'Occamy Field Operations'
     ADMIN_EMAIL = 'admin@occamy.com'
+    
+    @classmethod
+    def init_app(cls, app):
+        """Environment-specific checks run when an app is configured"""
+        pass
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -47,6 +129,9 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///test_occamy.db'
     WTF_CSRF_ENABLED = False
+    LOCATION_BUFFER_ENABLED = False
+    CACHE_REDIS_URL = None
+    LIVE_FEED_REDIS_URL = None
 
 class ProductionConfig(Config):
     """Production configuration"""
@@ -62,9 +147,12 @@ class ProductionConfig(Config):
     # Security
     SESSION_COOKIE_SECURE = True  # Requires HTTPS
     
-    # Must set SECRET_KEY in production
-    if not os.environ.get('SECRET_KEY'):
-        raise ValueError('SECRET_KEY environment variable must be set in production')
+    @classmethod
+    def init_app(cls, app):
+        # Must set SECRET_KEY in production; checked here rather than in the
+        # class body so that importing this module never fails
+        if not os.environ.get('SECRET_KEY'):
+            raise ValueError('SECRET_KEY environment variable must be set in production')
 
 # Configuration dictionary
 config = {
@@ -74,6 +162,26 @@ config = {
     'default': DevelopmentConfig
 }
 
+def engine_options(app_config):
+    """SQLALCHEMY_ENGINE_OPTIONS built from the DB_* settings
+    
+    SQLite gets none of these; it is tuned per connection with the SQLITE_*
+    PRAGMAs instead.
+    """
+    uri = app_config['SQLALCHEMY_DATABASE_URI'] or ''
+    if uri.startswith('sqlite'):
+        return {}
+    
+    options = {
+        'pool_size': app_config['DB_POOL_SIZE'],
+        'max_overflow': app_config['DB_MAX_OVERFLOW'],
+        'pool_recycle': app_config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': app_config['DB_POOL_PRE_PING']
+    }
+    if uri.startswith('postgresql') and app_config['DB_STATEMENT_TIMEOUT']:
+        options['connect_args'] = {'options': f"-c statement_timeout={app_config['DB_STATEMENT_TIMEOUT']}"}
+    return options
+
 def get_config(env=None):
     """Get configuration based on environment"""
     if env is None:
@@ -3,7 +3,8 @@ Demo Data Population Script for Occamy Field Operations
 Run this after initial setup to populate the database with sample data for testing
 """
 
-from app import app, db, User, WorkLog, Meeting, Sale, SampleDistribution
+from wsgi import app
+from app import db, User, WorkLog, Meeting, Sale, SampleDistribution, rebuild_daily_summaries
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
 import random
@@ -11,6 +12,7 @@ import random
 def create_demo_data():
     with app.app_context():
         print("Creating demo data...")
+        db.create_all()
         
         # Create field officers
         officers = [
@@ -181,6 +183,9 @@ def create_demo_data():
         
         db.session.commit()
         
+        # Demo rows bypass the API, so derive the daily rollup from them
+        rebuild_daily_summaries()
+        
         print("\n✅ Demo data created successfully!")
         print("\nDemo Field Officer Credentials:")
         print("=" * 50)
@@ -0,0 +1,48 @@
+"""
+Streaming exporters for activity tables
+Serialize row iterators to CSV or NDJSON chunk by chunk, in constant memory
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+
+
+def format_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(columns, rows, chunk_size=1000):
+    """Yield CSV text, a header line then one chunk per `chunk_size` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    for count, row in enumerate(rows, 1):
+        writer.writerow([format_value(value) for value in row])
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(columns, rows, chunk_size=1000):
+    """Yield newline-delimited JSON objects, one chunk per `chunk_size` rows"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, map(format_value, row)))))
+        if len(lines) == chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson')
+}
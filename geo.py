@@ -0,0 +1,214 @@
+"""
+Geographic helpers
+Geohash cells and bounding-box covers for map queries, track simplification
+and GPS path length
+"""
+
+import math
+from datetime import date, datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # path lengths fall back to pure Python
+    np = None
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9  # stored precision, cells of roughly 5 m x 5 m
+EARTH_RADIUS_M = 6371000.0
+EPOCH = datetime(1970, 1, 1)
+ONE_SECOND = timedelta(seconds=1)
+
+
+def encode(lat, lng, precision=PRECISION):
+    """Geohash of a point; every prefix of it is an enclosing cell"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        bounds, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            bounds[0] = mid
+        else:
+            bits = bits * 2
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(lat, lng) degrees spanned by one cell at `precision`"""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def _cell_spans(bbox, precision):
+    min_lng, min_lat, max_lng, max_lat = bbox
+    lat_step, lng_step = cell_size(precision)
+    rows = range(int((min_lat + 90) // lat_step), int((min(max_lat, 90 - 1e-9) + 90) // lat_step) + 1)
+    cols = range(int((min_lng + 180) // lng_step), int((min(max_lng, 180 - 1e-9) + 180) // lng_step) + 1)
+    return rows, cols, lat_step, lng_step
+
+
+def precision_for_bbox(bbox, max_cells, max_precision=PRECISION):
+    """Finest precision at which at most `max_cells` cells cover `bbox`"""
+    for precision in range(max_precision, 0, -1):
+        rows, cols, _, _ = _cell_spans(bbox, precision)
+        if len(rows) * len(cols) <= max_cells:
+            return precision
+    return 1
+
+
+def cover(bbox, precision):
+    """Geohashes of every cell at `precision` that intersects `bbox`"""
+    rows, cols, lat_step, lng_step = _cell_spans(bbox, precision)
+    return sorted(
+        encode(-90 + (row + 0.5) * lat_step, -180 + (col + 0.5) * lng_step, precision)
+        for row in rows for col in cols
+    )
+
+
+def parse_bbox(value):
+    """Parse 'min_lng,min_lat,max_lng,max_lat' into a tuple of floats"""
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4 or not all(math.isfinite(part) for part in parts):
+        raise ValueError('bbox must be min_lng,min_lat,max_lng,max_lat')
+    min_lng, min_lat, max_lng, max_lat = parts
+    if not (-180 <= min_lng <= max_lng <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise ValueError('bbox must be min_lng,min_lat,max_lng,max_lat')
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def _project(points):
+    """Local equirectangular projection of (lat, lng) pairs to metres"""
+    ref_lat = math.radians(sum(lat for lat, _ in points) / len(points))
+    scale = math.cos(ref_lat) * EARTH_RADIUS_M
+    return [(math.radians(lng) * scale, math.radians(lat) * EARTH_RADIUS_M) for lat, lng in points]
+
+
+def _segment_distance(point, start, end):
+    px, py = point
+    ax, ay = start
+    bx, by = end
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
+
+
+def simplify(points, tolerance_m, keep=()):
+    """Douglas-Peucker simplification of a track of (lat, lng) points
+
+    Returns the sorted indices of the points to keep: the endpoints, every
+    index in `keep`, and enough others that no dropped point lies further
+    than `tolerance_m` metres from the simplified line.
+    """
+    if len(points) <= 2:
+        return list(range(len(points)))
+
+    xy = _project(points)
+    anchors = sorted({0, len(points) - 1, *keep})
+    kept = set(anchors)
+    stack = list(zip(anchors, anchors[1:]))
+    while stack:
+        first, last = stack.pop()
+        furthest, distance = None, tolerance_m
+        for index in range(first + 1, last):
+            d = _segment_distance(xy[index], xy[first], xy[last])
+            if d > distance:
+                furthest, distance = index, d
+        if furthest is not None:
+            kept.add(furthest)
+            stack.append((first, furthest))
+            stack.append((furthest, last))
+    return sorted(kept)
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in metres"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def track_lengths(times, lats, lngs, accuracies, max_speed_mps, max_accuracy_m, default_accuracy_m):
+    """Path length in metres per calendar day of one device's time-ordered fixes
+
+    Fixes with a reported accuracy worse than `max_accuracy_m` are dropped,
+    as are single-fix spikes reachable only above `max_speed_mps`. A step
+    shorter than the combined accuracy of its two fixes is treated as jitter
+    and not counted. Steps that cross midnight are not counted either.
+    Returns {date: metres}.
+    """
+    if not times:
+        return {}
+    accuracies = [default_accuracy_m if accuracy is None else accuracy for accuracy in accuracies]
+    if np is not None:
+        return _track_lengths_numpy(times, lats, lngs, accuracies, max_speed_mps, max_accuracy_m)
+    return _track_lengths_python(times, lats, lngs, accuracies, max_speed_mps, max_accuracy_m)
+
+
+def _track_lengths_numpy(times, lats, lngs, accuracies, max_speed_mps, max_accuracy_m):
+    # Seconds since the epoch; much faster than numpy's own datetime parsing
+    stamps = np.fromiter(((time - EPOCH) / ONE_SECOND for time in times), dtype=float, count=len(times))
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lng = np.radians(np.asarray(lngs, dtype=float))
+    acc = np.asarray(accuracies, dtype=float)
+
+    keep = acc <= max_accuracy_m
+    stamps, lat, lng, acc = stamps[keep], lat[keep], lng[keep], acc[keep]
+
+    def steps(stamps, lat, lng):
+        a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2) ** 2
+        metres = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        seconds = np.diff(stamps)
+        fast = metres > max_speed_mps * np.maximum(seconds, 1.0)
+        return metres, fast
+
+    # Drop fixes where both the step in and the step out are impossibly fast
+    if len(lat) > 2:
+        _, fast = steps(stamps, lat, lng)
+        spike = np.zeros(len(lat), dtype=bool)
+        spike[1:-1] = fast[:-1] & fast[1:]
+        stamps, lat, lng, acc = stamps[~spike], lat[~spike], lng[~spike], acc[~spike]
+    if len(lat) < 2:
+        return {}
+
+    metres, fast = steps(stamps, lat, lng)
+    days = (stamps // 86400).astype(np.int64)
+    counted = (days[1:] == days[:-1]) & ~fast & (metres > np.hypot(acc[:-1], acc[1:]))
+    unique_days, codes = np.unique(days[1:], return_inverse=True)
+    totals = np.bincount(codes[counted], weights=metres[counted], minlength=len(unique_days))
+    return {date.fromordinal(EPOCH.toordinal() + int(day)): float(total) for day, total in zip(unique_days, totals)}
+
+
+def _track_lengths_python(times, lats, lngs, accuracies, max_speed_mps, max_accuracy_m):
+    fixes = [fix for fix in zip(times, lats, lngs, accuracies) if fix[3] <= max_accuracy_m]
+
+    def fast(a, b):
+        seconds = max((b[0] - a[0]).total_seconds(), 1.0)
+        return haversine(a[1], a[2], b[1], b[2]) > max_speed_mps * seconds
+
+    fixes = [fix for index, fix in enumerate(fixes)
+             if index in (0, len(fixes) - 1) or not (fast(fixes[index - 1], fix) and fast(fix, fixes[index + 1]))]
+
+    totals = {}
+    for a, b in zip(fixes, fixes[1:]):
+        totals.setdefault(b[0].date(), 0.0)
+        metres = haversine(a[1], a[2], b[1], b[2])
+        if a[0].date() == b[0].date() and not fast(a, b) and metres > math.hypot(a[3], b[3]):
+            totals[b[0].date()] += metres
+    return totals
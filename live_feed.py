@@ -0,0 +1,232 @@
+"""
+Live feed for the admin dashboard
+Committed writes are published as events and streamed to browsers over
+Server-Sent Events
+"""
+
+import json
+import re
+import threading
+import time
+from collections import deque
+
+from flask import Response, current_app
+from sqlalchemy import event
+
+
+class FeedBusy(Exception):
+    """Raised when a process already serves LIVE_FEED_MAX_CLIENTS streams"""
+
+
+class MemoryFeedBackend:
+    """In-process event log; viewers only see writes handled by their own worker"""
+
+    def __init__(self, history=500):
+        self._events = deque(maxlen=history)
+        self._last_id = 0
+        self._changed = threading.Condition()
+
+    def publish(self, name, data):
+        with self._changed:
+            self._last_id += 1
+            self._events.append((str(self._last_id), name, data))
+            self._changed.notify_all()
+
+    def last_id(self):
+        return str(self._last_id)
+
+    def cursor(self, last_event_id):
+        """Resume position for a reconnecting client, or now for a new one"""
+        if last_event_id and last_event_id.isdigit() and int(last_event_id) <= self._last_id:
+            return last_event_id
+        return self.last_id()
+
+    def read(self, after, timeout):
+        """Events newer than `after`, waiting up to `timeout` seconds for one"""
+        after = int(after)
+        with self._changed:
+            self._changed.wait_for(lambda: self._last_id > after, timeout)
+            return [entry for entry in self._events if int(entry[0]) > after]
+
+
+class RedisFeedBackend:
+    """Capped Redis stream, so every gunicorn worker sees every event
+
+    ``client`` only needs ``xadd``, ``xread`` and ``xrevrange``, so a fake
+    can stand in for redis-py in tests.
+    """
+
+    ID_PATTERN = re.compile(r'^\d+-\d+$')
+
+    def __init__(self, client, history=500, key='occamy:feed'):
+        self.client = client
+        self.history = history
+        self.key = key
+
+    def publish(self, name, data):
+        self.client.xadd(self.key, {'event': name, 'data': json.dumps(data)},
+                         maxlen=self.history, approximate=True)
+
+    def last_id(self):
+        entries = self.client.xrevrange(self.key, count=1)
+        return self._text(entries[0][0]) if entries else '0-0'
+
+    def cursor(self, last_event_id):
+        if last_event_id and self.ID_PATTERN.match(last_event_id):
+            return last_event_id
+        return self.last_id()
+
+    def read(self, after, timeout):
+        response = self.client.xread({self.key: after}, count=100, block=max(int(timeout * 1000), 1))
+        events = []
+        for _, entries in response or []:
+            for entry_id, fields in entries:
+                fields = {self._text(key): self._text(value) for key, value in fields.items()}
+                events.append((self._text(entry_id), fields['event'], json.loads(fields['data'])))
+        return events
+
+    @staticmethod
+    def _text(value):
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class FeedState:
+    """One app's event backend and stream slots, kept in app.extensions"""
+
+    def __init__(self, backend, max_clients):
+        self.backend = backend
+        self.slots = threading.BoundedSemaphore(max_clients)
+
+
+class LiveFeed:
+    """Publishes committed writes and serves them as an SSE stream
+
+    Models are registered with `watch`. Their serializer is called as
+    serializer(obj, created) for each object inserted or updated in a flush
+    and returns an (event, data) pair, or None to skip it. Events
+    from `publish` and from watched models are held on the session and only
+    sent once the transaction commits.
+
+    One instance watches the models and may serve several apps; each app's
+    backend and stream slots are a FeedState in app.extensions['live_feed'].
+
+    A stream holds one thread, not one process, for at most
+    LIVE_FEED_MAX_STREAM_SECONDS. Browsers then reconnect with
+    Last-Event-ID and pick up where they left off.
+
+    - LIVE_FEED_ENABLED: publish events at all
+    - LIVE_FEED_REDIS_URL: share events across workers (default: per-worker memory)
+    - LIVE_FEED_HISTORY: events kept for reconnecting clients
+    - LIVE_FEED_HEARTBEAT: seconds between keep-alive comments on an idle stream
+    - LIVE_FEED_MAX_STREAM_SECONDS: lifetime of one stream response
+    - LIVE_FEED_MAX_CLIENTS: open streams per app process before FeedBusy
+    """
+
+    def __init__(self, db=None, app=None):
+        self.db = db
+        self.serializers = {}
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LIVE_FEED_ENABLED', True)
+        app.config.setdefault('LIVE_FEED_REDIS_URL', None)
+        app.config.setdefault('LIVE_FEED_HISTORY', 500)
+        app.config.setdefault('LIVE_FEED_HEARTBEAT', 15)
+        app.config.setdefault('LIVE_FEED_MAX_STREAM_SECONDS', 300)
+        app.config.setdefault('LIVE_FEED_MAX_CLIENTS', 4)
+
+        if app.config['LIVE_FEED_REDIS_URL']:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError('LIVE_FEED_REDIS_URL is set but the redis package is not installed')
+            backend = RedisFeedBackend(redis.Redis.from_url(app.config['LIVE_FEED_REDIS_URL']),
+                                       app.config['LIVE_FEED_HISTORY'])
+        else:
+            backend = MemoryFeedBackend(app.config['LIVE_FEED_HISTORY'])
+
+        app.extensions['live_feed'] = FeedState(backend, app.config['LIVE_FEED_MAX_CLIENTS'])
+        if self.db is not None and not self._listening:
+            # db.session is shared by every app, so listen only once
+            self._listen(self.db.session)
+            self._listening = True
+
+    @property
+    def state(self):
+        """The current app's FeedState"""
+        return current_app.extensions['live_feed']
+
+    def watch(self, model, serializer):
+        self.serializers[model] = serializer
+
+    def publish(self, name, data):
+        """Send an event when the current transaction commits"""
+        if current_app.config['LIVE_FEED_ENABLED']:
+            self.db.session.info.setdefault('live_feed_pending', []).append((name, data))
+
+    def response(self, last_event_id=None):
+        """text/event-stream response starting after `last_event_id`"""
+        state = self.state
+        if not state.slots.acquire(blocking=False):
+            raise FeedBusy()
+
+        backend = state.backend
+        heartbeat = current_app.config['LIVE_FEED_HEARTBEAT']
+        lifetime = current_app.config['LIVE_FEED_MAX_STREAM_SECONDS']
+        try:
+            cursor = backend.cursor(last_event_id)
+        except Exception:
+            state.slots.release()
+            raise
+
+        def generate(cursor):
+            yield 'retry: 2000\n\n'  # reconnect delay once the stream ends
+            deadline = time.monotonic() + lifetime
+            while (remaining := deadline - time.monotonic()) > 0:
+                events = backend.read(cursor, min(heartbeat, remaining))
+                if not events:
+                    yield ': keep-alive\n\n'
+                for cursor, name, data in events:
+                    yield f'id: {cursor}\nevent: {name}\ndata: {json.dumps(data)}\n\n'
+
+        response = Response(generate(cursor), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # stop nginx holding events back
+        # Runs when the server closes the response, even if it never started
+        response.call_on_close(state.slots.release)
+        return response
+
+    def _send(self, events):
+        backend = self.state.backend
+        for name, data in events:
+            try:
+                backend.publish(name, data)
+            except Exception:
+                # The write already committed; a lost event must not fail the request
+                current_app.logger.exception('Could not publish %s event', name)
+
+    def _listen(self, session):
+        @event.listens_for(session, 'after_flush')
+        def after_flush(session, flush_context):
+            if not current_app.config['LIVE_FEED_ENABLED']:
+                return
+            pending = session.info.setdefault('live_feed_pending', [])
+            changed = [(obj, True) for obj in session.new] + [(obj, False) for obj in session.dirty]
+            for obj, created in changed:
+                serializer = self.serializers.get(type(obj))
+                if serializer is not None:
+                    entry = serializer(obj, created)
+                    if entry is not None:
+                        pending.append(entry)
+
+        @event.listens_for(session, 'after_commit')
+        def after_commit(session):
+            pending = session.info.pop('live_feed_pending', None)
+            if pending:
+                self._send(pending)
+
+        @event.listens_for(session, 'after_rollback')
+        def after_rollback(session):
+            session.info.pop('live_feed_pending', None)
@@ -0,0 +1,105 @@
+"""
+Compressed archive tier for old LocationLog rows
+One gzip-compressed NDJSON file per officer per month on local disk
+"""
+
+import gzip
+import json
+import os
+from datetime import date, datetime
+
+
+class LocationArchive:
+    """Append-only per-user, per-month archive files
+
+    Each append adds a gzip member to the month's file, so archiving can be
+    re-run without rewriting what is already there. Rows carry their
+    original LocationLog id and are de-duplicated on read. A run that stops
+    between writing a batch and deleting it from the database therefore
+    leaves no visible duplicates.
+
+    - LOCATION_ARCHIVE_DIR: directory for archive files (default: <instance>/location_archive)
+    - LOCATION_RETENTION_DAYS: rows older than this are moved out of the database
+    - LOCATION_ARCHIVE_BATCH_SIZE: rows archived and deleted per transaction
+    """
+
+    FIELDS = ('id', 'timestamp', 'latitude', 'longitude', 'accuracy', 'activity_type')
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOCATION_ARCHIVE_DIR', os.path.join(app.instance_path, 'location_archive'))
+        app.config.setdefault('LOCATION_RETENTION_DAYS', 90)
+        app.config.setdefault('LOCATION_ARCHIVE_BATCH_SIZE', 5000)
+        app.extensions['location_archive'] = self
+        self.app = app
+
+    @property
+    def directory(self):
+        return self.app.config['LOCATION_ARCHIVE_DIR']
+
+    def path(self, user_id, month):
+        return os.path.join(self.directory, str(user_id), f'{month:%Y-%m}.ndjson.gz')
+
+    def append(self, user_id, month, rows):
+        """Durably add row dicts for one officer-month to its archive file"""
+        path = self.path(user_id, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lines = ''.join(json.dumps(self._encode(row)) + '\n' for row in rows)
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='ab') as archive:
+                archive.write(lines.encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+
+    def read(self, user_id, start, end):
+        """Archived rows of one officer with start <= timestamp < end, oldest first"""
+        rows = {}
+        for month in self._months(start, end):
+            for row in self._read_file(self.path(user_id, month)):
+                if start <= row['timestamp'] < end:
+                    rows[row['id']] = row
+        return sorted(rows.values(), key=lambda row: (row['timestamp'], row['id']))
+
+    def daily_counts(self):
+        """{(user_id, day): archived rows} over the whole archive"""
+        counts = {}
+        if not os.path.isdir(self.directory):
+            return counts
+        for user_dir in os.listdir(self.directory):
+            if not user_dir.isdigit():
+                continue
+            for name in os.listdir(os.path.join(self.directory, user_dir)):
+                rows = {row['id']: row for row in self._read_file(os.path.join(self.directory, user_dir, name))}
+                for row in rows.values():
+                    key = (int(user_dir), row['timestamp'].date())
+                    counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def _read_file(self, path):
+        if not os.path.exists(path):
+            return
+        with gzip.open(path, 'rt', encoding='utf-8') as archive:
+            for line in archive:
+                if line.strip():
+                    yield self._decode(json.loads(line))
+
+    @staticmethod
+    def _months(start, end):
+        month = date(start.year, start.month, 1)
+        while datetime.combine(month, datetime.min.time()) < end:
+            yield month
+            month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+    def _encode(self, row):
+        row = {field: row[field] for field in self.FIELDS}
+        row['timestamp'] = row['timestamp'].isoformat()
+        return row
+
+    @staticmethod
+    def _decode(row):
+        row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+        return row
@@ -0,0 +1,195 @@
+"""
+Write-behind buffer for LocationLog rows
+Queues GPS points in-process and commits them in bulk from a background thread
+"""
+
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class _Unavailable(Exception):
+    """The writer failed in a way worth retrying; `rows` were not written"""
+
+    def __init__(self, rows):
+        super().__init__(len(rows))
+        self.rows = rows
+
+
+class LocationWriteBuffer:
+    """Bounded in-process queue flushed by size or time threshold
+
+    ``writer`` is called inside an app context with a list of row dicts and
+    must persist them in one transaction. Rows must be validated before they
+    are queued. A batch that still fails is split in half and each half
+    retried, so one bad row only loses itself. If ``retryable(exc)`` is true
+    for the error (the database is down or locked), the batch goes back to
+    the front of the queue for the next flush instead. Settings are read
+    from the app config on every call so they can be changed at runtime:
+
+    - LOCATION_BUFFER_ENABLED: route location writes through the buffer
+    - LOCATION_BUFFER_MAX_SIZE: queued rows before enqueue is refused
+    - LOCATION_BUFFER_FLUSH_SIZE: rows that trigger an early flush
+    - LOCATION_BUFFER_FLUSH_INTERVAL: seconds between time-based flushes
+    """
+
+    def __init__(self, writer, app=None, retryable=None):
+        self.writer = writer
+        self.retryable = retryable or (lambda exc: False)
+        self.app = None
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._unavailable = False
+        self.flushed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.requeued = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOCATION_BUFFER_ENABLED', False)
+        app.config.setdefault('LOCATION_BUFFER_MAX_SIZE', 10000)
+        app.config.setdefault('LOCATION_BUFFER_FLUSH_SIZE', 500)
+        app.config.setdefault('LOCATION_BUFFER_FLUSH_INTERVAL', 5)
+        app.extensions['location_buffer'] = self
+        self.app = app
+        atexit.register(self.shutdown)
+
+    @property
+    def enabled(self):
+        return bool(self.app and self.app.config['LOCATION_BUFFER_ENABLED'])
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def enqueue(self, rows):
+        """Queue rows for writing; returns False when the buffer is full"""
+        with self._cond:
+            if len(self._queue) + len(rows) > self.app.config['LOCATION_BUFFER_MAX_SIZE']:
+                self.rejected += len(rows)
+                return False
+            self._queue.extend(rows)
+            self._ensure_worker()
+            if len(self._queue) >= self.app.config['LOCATION_BUFFER_FLUSH_SIZE']:
+                self._cond.notify()
+        return True
+
+    def take(self, user_id):
+        """Remove and return the rows queued for `user_id`, oldest first
+
+        For callers that need an officer's points in their own transaction.
+        A flush would write them on another connection, which has to wait for
+        a caller that already holds the write lock. Rows in a batch the
+        flusher is already writing are not returned.
+        """
+        with self._cond:
+            taken = [row for row in self._queue if row['user_id'] == user_id]
+            if taken:
+                kept = [row for row in self._queue if row['user_id'] != user_id]
+                self._queue.clear()
+                self._queue.extend(kept)
+        return taken
+
+    def flush(self):
+        """Write everything queued so far; returns the number of rows written
+
+        Stops early, leaving the rest queued, when the database cannot be
+        written to at all.
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    count = min(len(self._queue), self.app.config['LOCATION_BUFFER_FLUSH_SIZE'])
+                    batch = [self._queue.popleft() for _ in range(count)]
+                if not batch:
+                    self._unavailable = False
+                    return written
+                try:
+                    written += self._write(batch)
+                except _Unavailable as e:
+                    self._unavailable = True
+                    with self._cond:
+                        self._queue.extendleft(reversed(e.rows))
+                    self.requeued += len(e.rows)
+                    logger.error('Database unavailable, %d buffered location rows kept for the next flush',
+                                 len(e.rows), exc_info=e.__cause__)
+                    return written
+
+    def _write(self, batch):
+        """Write `batch`, bisecting around rows the writer rejects
+
+        Returns the number of rows written. Raises _Unavailable with the rows
+        not yet written when the error is retryable.
+        """
+        try:
+            with self.app.app_context():
+                self.writer(batch)
+        except Exception as exc:
+            if self.retryable(exc):
+                raise _Unavailable(batch) from exc
+            if len(batch) == 1:
+                self.failed += 1
+                logger.exception('Dropped a buffered location row the database rejected: %r', batch[0])
+                return 0
+            middle = len(batch) // 2
+            try:
+                written = self._write(batch[:middle])
+            except _Unavailable as e:
+                raise _Unavailable(e.rows + batch[middle:]) from e.__cause__
+            return written + self._write(batch[middle:])
+        self.flushed += len(batch)
+        return len(batch)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'depth': self.depth,
+            'capacity': self.app.config['LOCATION_BUFFER_MAX_SIZE'],
+            'flushed': self.flushed,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'requeued': self.requeued
+        }
+
+    def shutdown(self):
+        """Stop the flusher thread and write out whatever is still queued"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so each gunicorn worker starts its own
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._stopping = False
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='location-buffer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # While the database is down a full queue must not spin the
+                # thread; wait out the interval before trying again
+                self._cond.wait_for(
+                    lambda: self._stopping or (not self._unavailable and
+                                               len(self._queue) >= self.app.config['LOCATION_BUFFER_FLUSH_SIZE']),
+                    timeout=self.app.config['LOCATION_BUFFER_FLUSH_INTERVAL']
+                )
+                if self._stopping:
+                    return
+            self.flush()
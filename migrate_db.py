@@ -3,10 +3,19 @@ Database Migration Script
 Use this to migrate from SQLite to PostgreSQL or to reset database
 """
 
-from app import app, db
+from wsgi import app
+from app import db
 from app import User, WorkLog, Meeting, Sale, SampleDistribution, LocationLog
+from app import DailyOfficerSummary, rebuild_daily_summaries, compact_track
+from app import gps_track_distances, gps_distance_fields, update_gps_distances, archive_locations
+from app import EXPORT_MODELS, export_query, parse_officer_rows, bulk_create_officers, OfficersTaken, MAP_LAYERS
+from app import IdempotencyKey, purge_idempotency_keys
+import geo
+from exporter import EXPORT_FORMATS
+from datetime import date, datetime, timedelta
 from werkzeug.security import generate_password_hash
 import sys
+import time
 
 def create_tables():
     """Create all database tables"""
@@ -62,6 +71,218 @@ def create_default_admin():
         else:
             print("✓ Admin already exists")
 
+def close_duplicate_work_sessions():
+    """Mark all but the earliest open WorkLog of an officer-day as 'duplicate'
+
+    Needed once before the unique index on open sessions can be built.
+    """
+    duplicates = db.session.query(WorkLog.user_id, WorkLog.date).filter_by(status='started').group_by(
+        WorkLog.user_id, WorkLog.date
+    ).having(db.func.count(WorkLog.id) > 1).all()
+    for user_id, day in duplicates:
+        work_logs = WorkLog.query.filter_by(user_id=user_id, date=day, status='started').order_by(
+            WorkLog.start_time, WorkLog.id
+        ).all()
+        for work_log in work_logs[1:]:
+            work_log.status = 'duplicate'
+            print(f"  ! Work log {work_log.id} duplicates {work_logs[0].id} (user {user_id}, {day})")
+    db.session.commit()
+    return len(duplicates)
+
+# Indexes an older release created that a newer one now covers
+SUPERSEDED_INDEXES = (
+    'ix_meeting_date',  # by ix_meeting_date_id
+)
+
+def create_indexes():
+    """Bring an existing database up to the current models
+
+    The one command to run after upgrading: creates missing tables, adds
+    missing columns, then builds missing indexes. Safe to run again.
+    """
+    with app.app_context():
+        print("Upgrading schema...")
+        new_tables = set(db.metadata.tables) - set(db.inspect(db.engine).get_table_names())
+        db.create_all()
+        for model in (User, WorkLog, Meeting, Sale, SampleDistribution, LocationLog):
+            add_missing_columns(model)
+        # Indexes on activity_day and geohash are only useful once old rows have them
+        backfill_activity_day()
+        backfill_geohash()
+        if DailyOfficerSummary.__tablename__ in new_tables:
+            print(f"✓ {rebuild_daily_summaries()} daily officer summaries built")
+        close_duplicate_work_sessions()
+        for model in (User, WorkLog, Meeting, SampleDistribution, Sale, LocationLog):
+            for index in sorted(model.__table__.indexes, key=lambda i: i.name):
+                index.create(bind=db.engine, checkfirst=True)
+                print(f"✓ {index.name}")
+        for name in SUPERSEDED_INDEXES:
+            db.session.execute(db.text(f'DROP INDEX IF EXISTS {name}'))
+        db.session.commit()
+        print("✓ Indexes up to date")
+
+def backfill_activity_day(batch_size=10000):
+    """Add and backfill the indexed activity_day column on activity tables"""
+    with app.app_context():
+        inspector = db.inspect(db.engine)
+        for model in (Meeting, Sale, SampleDistribution):
+            table = model.__tablename__
+            if 'activity_day' not in [column['name'] for column in inspector.get_columns(table)]:
+                db.session.execute(db.text(f'ALTER TABLE {table} ADD COLUMN activity_day DATE'))
+                db.session.commit()
+                print(f"✓ Added {table}.activity_day")
+            
+            for index in model.__table__.indexes:
+                if 'activity_day' in index.columns:
+                    index.create(bind=db.engine, checkfirst=True)
+            
+            # Backfill in id ranges so each transaction stays small
+            max_id = db.session.query(db.func.max(model.id)).scalar() or 0
+            updated = 0
+            for start in range(1, max_id + 1, int(batch_size)):
+                result = db.session.execute(
+                    db.update(model)
+                    .where(model.id.between(start, start + int(batch_size) - 1), model.activity_day.is_(None))
+                    .values(activity_day=db.func.date(model.date))
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+                updated += result.rowcount
+            print(f"✓ {table}: {updated} rows backfilled")
+
+def backfill_geohash(batch_size=10000):
+    """Add and backfill the indexed geohash column used by the admin map"""
+    with app.app_context():
+        inspector = db.inspect(db.engine)
+        for model, lat, lng, _ in MAP_LAYERS.values():
+            table = model.__tablename__
+            if 'geohash' not in [column['name'] for column in inspector.get_columns(table)]:
+                db.session.execute(db.text(f'ALTER TABLE {table} ADD COLUMN geohash VARCHAR(12)'))
+                db.session.commit()
+                print(f"✓ Added {table}.geohash")
+            
+            # Geohashes are computed in Python, one id range per transaction
+            max_id = db.session.query(db.func.max(model.id)).scalar() or 0
+            updated = 0
+            for start in range(1, max_id + 1, int(batch_size)):
+                rows = db.session.execute(
+                    db.select(model.id, lat, lng).where(
+                        model.id.between(start, start + int(batch_size) - 1),
+                        model.geohash.is_(None), lat.isnot(None), lng.isnot(None)
+                    )
+                ).all()
+                if rows:
+                    db.session.execute(db.update(model), [
+                        {'id': row_id, 'geohash': geo.encode(row_lat, row_lng)} for row_id, row_lat, row_lng in rows
+                    ])
+                    db.session.commit()
+                updated += len(rows)
+            
+            for index in model.__table__.indexes:
+                if 'geohash' in index.columns:
+                    index.create(bind=db.engine, checkfirst=True)
+            print(f"✓ {table}: {updated} rows backfilled")
+
+def add_missing_columns(model):
+    """ALTER TABLE ... ADD COLUMN for model columns the database does not have yet"""
+    inspector = db.inspect(db.engine)
+    existing = [column['name'] for column in inspector.get_columns(model.__tablename__)]
+    for column in model.__table__.columns:
+        if column.name not in existing:
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(db.text(f'ALTER TABLE {model.__tablename__} ADD COLUMN {column.name} {column_type}'))
+            db.session.commit()
+            print(f"✓ Added {model.__tablename__}.{column.name}")
+
+def gps_distance(*args):
+    """Store GPS track distances next to the odometer distance of ended work days
+
+    Usage: gps-distance [--from=YYYY-MM-DD] [--to=YYYY-MM-DD] [--recompute] [--flag=RATIO]
+    Defaults to the last 30 days; days whose odometer/GPS ratio exceeds
+    --flag (default 1.2) are listed.
+    """
+    options = dict(arg[2:].split('=', 1) for arg in args if arg.startswith('--') and '=' in arg)
+    date_to = date.fromisoformat(options['to']) if 'to' in options else date.today()
+    date_from = date.fromisoformat(options['from']) if 'from' in options else date_to - timedelta(days=30)
+    flag = float(options.get('flag', 1.2))
+    
+    with app.app_context():
+        add_missing_columns(WorkLog)
+        print(f"Measuring GPS tracks from {date_from} to {date_to}...")
+        started = time.perf_counter()
+        updated = update_gps_distances(date_from, date_to, recompute='--recompute' in args)
+        print(f"✓ {updated} officer-days measured in {time.perf_counter() - started:.1f}s")
+        
+        flagged = WorkLog.query.filter(
+            WorkLog.date.between(date_from, date_to), WorkLog.gps_distance_ratio > flag
+        ).order_by(WorkLog.gps_distance_ratio.desc()).all()
+        for work_log in flagged:
+            print(f"  ! {work_log.date} {work_log.user.name}: odometer {work_log.distance_traveled} km, "
+                  f"GPS {work_log.gps_distance} km ({work_log.gps_distance_ratio}x)")
+
+def compact_tracks(*args):
+    """Simplify the location tracks of ended work days that are not compacted yet
+
+    Usage: compact-tracks [--all]   (--all re-runs already compacted days)
+    """
+    with app.app_context():
+        add_missing_columns(WorkLog)
+        
+        query = WorkLog.query.filter_by(status='ended')
+        if '--all' not in args:
+            query = query.filter(WorkLog.track_points.is_(None))
+        work_log_ids = [row.id for row in query.with_entities(WorkLog.id).order_by(WorkLog.id)]
+        
+        print(f"Compacting {len(work_log_ids)} officer-days...")
+        before = after = 0
+        for work_log_id in work_log_ids:
+            work_log = db.session.get(WorkLog, work_log_id)
+            if work_log.gps_distance is None:
+                gps_km = gps_track_distances(work_log.user_id, work_log.date, work_log.date).get(work_log.date, 0.0)
+                for column, value in gps_distance_fields(work_log.distance_traveled, gps_km).items():
+                    setattr(work_log, column, value)
+            previous = (work_log.track_points or 0) - (work_log.track_points_kept or 0)
+            total, kept = compact_track(work_log)
+            db.session.commit()
+            before += total - previous
+            after += kept
+        ratio = before / after if after else 1
+        print(f"✓ {before} points reduced to {after} ({ratio:.1f}x compression)")
+
+def archive_location_logs(*args):
+    """Move old LocationLog rows to compressed per-officer monthly files
+
+    Usage: archive-locations [--days=N]   (default: LOCATION_RETENTION_DAYS)
+    """
+    options = dict(arg[2:].split('=', 1) for arg in args if arg.startswith('--') and '=' in arg)
+    with app.app_context():
+        days = int(options.get('days', app.config['LOCATION_RETENTION_DAYS']))
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        print(f"Archiving location logs older than {cutoff:%Y-%m-%d %H:%M} to {app.config['LOCATION_ARCHIVE_DIR']}...")
+        archived = archive_locations(cutoff)
+        print(f"✓ {archived} rows archived and deleted")
+        if archived and db.engine.dialect.name == 'sqlite':
+            print("  Run VACUUM to return the freed pages to the filesystem")
+
+def expire_idempotency_keys():
+    """Delete idempotency keys past IDEMPOTENCY_KEY_TTL"""
+    with app.app_context():
+        IdempotencyKey.__table__.create(bind=db.engine, checkfirst=True)
+        deleted = purge_idempotency_keys()
+        print(f"✓ {deleted} expired idempotency keys deleted")
+
+def rollup(*args):
+    """Show or rebuild the DailyOfficerSummary rollup table"""
+    with app.app_context():
+        db.create_all()
+        if '--rebuild' in args:
+            print("Rebuilding daily officer summaries...")
+            rows = rebuild_daily_summaries()
+            print(f"✓ {rows} officer-day rows rebuilt")
+        else:
+            print(f"Daily officer summaries: {DailyOfficerSummary.query.count()} rows")
+            print("Run 'python migrate_db.py rollup --rebuild' to backfill from raw activity")
+
 def export_to_sql(filename='backup.sql'):
     """Export database to SQL file (SQLite only)"""
     import sqlite3
@@ -85,6 +306,65 @@ def export_to_sql(filename='backup.sql'):
     conn.close()
     print(f"✓ Database exported to {filename}")
 
+def export_table(table=None, *args):
+    """Stream an activity table to CSV or NDJSON
+
+    Usage: export-csv <sales|meetings|samples> [file] [--from=YYYY-MM-DD]
+           [--to=YYYY-MM-DD] [--state=NAME] [--format=csv|ndjson]
+    """
+    if table not in EXPORT_MODELS:
+        print(f"✗ Table must be one of: {', '.join(EXPORT_MODELS)}")
+        return
+    
+    options = dict(arg[2:].split('=', 1) for arg in args if arg.startswith('--') and '=' in arg)
+    positional = [arg for arg in args if not arg.startswith('--')]
+    export_format = options.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        print(f"✗ Format must be one of: {', '.join(EXPORT_FORMATS)}")
+        return
+    filename = positional[0] if positional else f'{table}.{export_format}'
+    
+    filters = {
+        'state': options.get('state'),
+        'date_from': date.fromisoformat(options['from']) if 'from' in options else None,
+        'date_to': date.fromisoformat(options['to']) if 'to' in options else None
+    }
+    
+    with app.app_context():
+        print(f"Exporting {table} to {filename}...")
+        query = export_query(EXPORT_MODELS[table], **filters)
+        columns = [column['name'] for column in query.column_descriptions]
+        serializer = EXPORT_FORMATS[export_format][0]
+        with open(filename, 'w', newline='') as f:
+            for chunk in serializer(columns, query, app.config['EXPORT_CHUNK_SIZE']):
+                f.write(chunk)
+        print(f"✓ {table} exported to {filename}")
+
+def import_users(filename=None):
+    """Create field officers from a CSV or JSON file
+
+    Usage: import-users <file.csv|file.json>
+    CSV columns: username,email,password,name,state,district,phone
+    """
+    if not filename:
+        print("✗ Usage: python migrate_db.py import-users <file.csv|file.json>")
+        return
+    
+    data_format = 'json' if filename.lower().endswith('.json') else 'csv'
+    with open(filename, newline='') as f:
+        rows = parse_officer_rows(f.read(), data_format)
+    
+    with app.app_context():
+        print(f"Importing {len(rows)} officers from {filename}...")
+        try:
+            created, errors = bulk_create_officers(rows)
+        except OfficersTaken as e:
+            print(f"✗ Taken while importing, nothing was created: {', '.join(e.usernames)}")
+            return
+        for error in errors:
+            print(f"  ✗ row {error['row']}: {error['error']}")
+        print(f"✓ {len(created)} officers created, {len(errors)} rows skipped")
+
 def migrate_to_postgres():
     """Helper guide for migrating to PostgreSQL"""
     print("""
@@ -128,6 +408,7 @@ def show_stats():
         print(f"  - B2B: {Sale.query.filter_by(sale_type='B2B').count()}")
         print(f"Sample Distributions: {SampleDistribution.query.count()}")
         print(f"Location Logs: {LocationLog.query.count()}")
+        print(f"Daily Summaries: {DailyOfficerSummary.query.count()}")
         print("=" * 50)
 
 def main():
@@ -144,7 +425,17 @@ Commands:
   drop          Drop all database tables (DESTRUCTIVE!)
   reset         Drop and recreate all tables (DESTRUCTIVE!)
   admin         Create default admin user
+  indexes       Upgrade an existing database (tables, columns, indexes)
+  activity-day  Add and backfill the activity_day column
+  geohash       Add and backfill the geohash column for the admin map
+  rollup        Show daily summary rollup (--rebuild to backfill)
+  compact-tracks  Simplify location tracks of ended work days
+  gps-distance  Compare GPS track distance with the odometer distance
+  archive-locations  Move old location logs to compressed archive files
+  idempotency-keys  Delete expired idempotency keys
   export        Export database to SQL file (SQLite only)
+  export-csv    Stream sales, meetings or samples to CSV/NDJSON
+  import-users  Create field officers from a CSV or JSON file
   migrate       Show PostgreSQL migration guide
   stats         Show database statistics
 
@@ -152,6 +443,9 @@ Examples:
   python migrate_db.py create
   python migrate_db.py reset
   python migrate_db.py stats
+  python migrate_db.py rollup --rebuild
+  python migrate_db.py export-csv sales sales.csv --from=2024-01-01 --state=Punjab
+  python migrate_db.py import-users officers.csv
         """)
         return
     
@@ -162,13 +456,23 @@ Examples:
         'drop': drop_tables,
         'reset': reset_database,
         'admin': create_default_admin,
+        'indexes': create_indexes,
+        'activity-day': backfill_activity_day,
+        'geohash': backfill_geohash,
+        'rollup': rollup,
+        'compact-tracks': compact_tracks,
+        'gps-distance': gps_distance,
+        'archive-locations': archive_location_logs,
+        'idempotency-keys': expire_idempotency_keys,
         'export': export_to_sql,
+        'export-csv': export_table,
+        'import-users': import_users,
         'migrate': migrate_to_postgres,
         'stats': show_stats
     }
     
     if command in commands:
-        commands[command]()
+        commands[command](*sys.argv[2:])
     else:
         print(f"✗ Unknown command: {command}")
         print("Run without arguments to see available commands")
@@ -0,0 +1,107 @@
+"""
+Password hashing off the request path
+Runs werkzeug hashing in a bounded process pool and detects outdated hashes
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    """Raised when every hashing slot stays taken for PASSWORD_HASH_TIMEOUT"""
+
+
+class PasswordHasher:
+    """Hash and verify passwords in worker processes
+
+    - PASSWORD_HASH_METHOD: werkzeug method spec for new hashes
+    - PASSWORD_HASH_WORKERS: pool processes per app process (0 hashes inline)
+    - PASSWORD_HASH_MAX_CONCURRENT: hashing jobs in flight per app process
+    - PASSWORD_HASH_TIMEOUT: seconds to wait for a free slot before HashingBusy
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._pid = None
+        self._slots = None
+        self._prefixes = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+        app.config.setdefault('PASSWORD_HASH_MAX_CONCURRENT', 4)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+        app.extensions['password_hasher'] = self
+        self.app = app
+        self._slots = threading.BoundedSemaphore(app.config['PASSWORD_HASH_MAX_CONCURRENT'])
+        atexit.register(self.shutdown)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.app.config['PASSWORD_HASH_METHOD'])
+
+    def hash_many(self, passwords):
+        """Hash a batch across the whole pool in one slot, preserving order"""
+        method = self.app.config['PASSWORD_HASH_METHOD']
+        return self._run_many(generate_password_hash, [(password, method) for password in passwords])
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if `pwhash` was made with other parameters than the configured method"""
+        return pwhash.split('$', 1)[0] != self._method_prefix(self.app.config['PASSWORD_HASH_METHOD'])
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def _method_prefix(self, method):
+        # werkzeug fills in defaults (e.g. 'scrypt' -> 'scrypt:32768:8:1'), so
+        # learn the full prefix from one real hash per configured method
+        if method not in self._prefixes:
+            self._prefixes[method] = self._run(generate_password_hash, '', method).split('$', 1)[0]
+        return self._prefixes[method]
+
+    def _run(self, func, *args):
+        return self._run_many(func, [args])[0]
+
+    def _run_many(self, func, arg_lists):
+        if self.app.config['PASSWORD_HASH_WORKERS'] <= 0:
+            return [func(*args) for args in arg_lists]
+
+        if not self._slots.acquire(timeout=self.app.config['PASSWORD_HASH_TIMEOUT']):
+            raise HashingBusy()
+        try:
+            executor = self._get_executor()
+            futures = [executor.submit(func, *args) for args in arg_lists]
+            return [future.result() for future in futures]
+        finally:
+            self._slots.release()
+
+    def _get_executor(self):
+        # A pool inherited across a gunicorn fork is unusable, so each worker
+        # process creates its own on first use. By then the worker runs request,
+        # buffer and photo threads, and a forked child could inherit one of
+        # their locks held, so pool processes come from a fork server instead
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.app.config['PASSWORD_HASH_WORKERS'],
+                                                     mp_context=_pool_context())
+                self._pid = os.getpid()
+            return self._executor
+
+
+def _pool_context():
+    # forkserver is POSIX only; Windows has spawn, which is just as safe
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
@@ -0,0 +1,241 @@
+"""
+Content-addressed photo storage
+Multipart uploads are hashed while they stream to disk; downscaled copies
+and thumbnails are made in a background thread pool
+"""
+
+import atexit
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.formparser import FormDataParser
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # photos are stored as uploaded, without thumbnails
+    Image = None
+
+# Leading bytes of each accepted format; the client's filename and
+# Content-Type are not trusted
+PHOTO_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+
+def photo_type(head):
+    for signature, extension in PHOTO_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+class HashingFile:
+    """Temporary upload file that hashes bytes as the form parser writes them"""
+
+    def __init__(self, directory):
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self.file = os.fdopen(fd, 'w+b')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.head = b''
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        if len(self.head) < 16:
+            self.head += data[:16 - len(self.head)]
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class PhotoStore:
+    """Stores each photo once, under the SHA-256 of its bytes
+
+    Files live at <PHOTO_UPLOAD_DIR>/<first two hex digits>/<sha256>.<ext>.
+    They are served as PHOTO_URL_PREFIX/<same path>. Uploading the same bytes
+    again returns the existing file. A stored file is never rewritten, so
+    its name always matches its bytes. With Pillow installed, a background
+    thread writes a <sha256>_display.<ext> copy of photos larger than
+    PHOTO_MAX_DIMENSION, then a <sha256>_thumb.jpg, next to the original.
+    The thumbnail is written last and marks processing as finished.
+
+    - PHOTO_UPLOAD_DIR: storage directory (default: <UPLOAD_FOLDER>/photos)
+    - PHOTO_URL_PREFIX: URL the directory is served under
+    - PHOTO_MAX_FILES: photos per upload request
+    - PHOTO_MAX_DIMENSION: longest side in pixels that stored photos are reduced to
+    - PHOTO_THUMBNAIL_SIZE: longest side of thumbnails
+    - PHOTO_WORKERS: image processing threads per app process
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._pid = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PHOTO_UPLOAD_DIR', os.path.join(app.config.get('UPLOAD_FOLDER', 'static/uploads'), 'photos'))
+        app.config.setdefault('PHOTO_URL_PREFIX', '/static/uploads/photos')
+        app.config.setdefault('PHOTO_MAX_FILES', 10)
+        app.config.setdefault('PHOTO_MAX_DIMENSION', 1600)
+        app.config.setdefault('PHOTO_THUMBNAIL_SIZE', 320)
+        app.config.setdefault('PHOTO_WORKERS', 2)
+        app.extensions['photo_store'] = self
+        self.app = app
+        atexit.register(self.shutdown)
+
+    @property
+    def directory(self):
+        return self.app.config['PHOTO_UPLOAD_DIR']
+
+    @property
+    def thumbnails(self):
+        return Image is not None
+
+    def receive(self, request, field='photo'):
+        """Store every `field` file of a multipart request
+
+        The body is parsed straight from the input stream; file parts are
+        written to disk in chunks as they arrive, never held in memory.
+        Raises ValueError for missing, empty or non-image files.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        uploads = []
+
+        def stream_factory(total_content_length, content_type, filename, content_length=None):
+            if len(uploads) >= self.app.config['PHOTO_MAX_FILES']:
+                raise ValueError(f"At most {self.app.config['PHOTO_MAX_FILES']} photos per upload")
+            uploads.append(HashingFile(self.directory))
+            return uploads[-1]
+
+        parser = FormDataParser(stream_factory, max_content_length=self.app.config['MAX_CONTENT_LENGTH'],
+                                silent=False)
+        try:
+            _, _, files = parser.parse(request.stream, request.mimetype, request.content_length,
+                                       request.mimetype_params)
+            photos = [storage.stream for storage in files.getlist(field)]
+            if not photos:
+                raise ValueError(f"No '{field}' file in the upload")
+            for index, upload in enumerate(photos):
+                if upload.size == 0 or photo_type(upload.head) is None:
+                    raise ValueError(f'File {index} is not a JPEG, PNG, GIF or WebP image')
+            return [self._store(upload) for upload in photos]
+        finally:
+            for upload in uploads:
+                upload.close()
+                if os.path.exists(upload.path):
+                    os.remove(upload.path)
+
+    def url(self, relative_path):
+        return f"{self.app.config['PHOTO_URL_PREFIX'].rstrip('/')}/{relative_path.replace(os.sep, '/')}"
+
+    def wait(self):
+        """Block until queued image processing has finished"""
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.result()
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def _store(self, upload):
+        digest = upload.sha256.hexdigest()
+        relative = os.path.join(digest[:2], f'{digest}.{photo_type(upload.head)}')
+        path = os.path.join(self.directory, relative)
+        upload.flush()
+
+        duplicate = os.path.exists(path)
+        if not duplicate:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Same filesystem, so this is an atomic rename, not a copy
+            os.replace(upload.path, path)
+            if self.thumbnails:
+                self._submit(path)
+
+        return {'sha256': digest, 'size': upload.size, **self._variants(relative), 'duplicate': duplicate}
+
+    def _variants(self, relative):
+        """URLs of a stored photo and the copies processing has written so far
+
+        `thumbnail_url` and `display_url` stay null while `processing` is true;
+        `display_url` is the original itself when it needed no downscaling.
+        """
+        base, extension = relative.rsplit('.', 1)
+        variants = {'url': self.url(relative), 'thumbnail_url': None, 'display_url': None, 'processing': False}
+        if not self.thumbnails:
+            variants['display_url'] = variants['url']
+        elif os.path.exists(os.path.join(self.directory, f'{base}_thumb.jpg')):
+            display = f'{base}_display.{extension}'
+            variants['thumbnail_url'] = self.url(f'{base}_thumb.jpg')
+            variants['display_url'] = self.url(display if os.path.exists(os.path.join(self.directory, display))
+                                               else relative)
+        else:
+            variants['processing'] = True
+        return variants
+
+    def _submit(self, path):
+        future = self._get_executor().submit(self._process, path)
+        with self._lock:
+            self._pending.add(future)
+        # Runs at once if the job already finished
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+        if future.exception() is not None:
+            self.app.logger.error('Photo processing failed: %s', future.exception())
+
+    def _process(self, path):
+        max_dimension = self.app.config['PHOTO_MAX_DIMENSION']
+        thumbnail_size = self.app.config['PHOTO_THUMBNAIL_SIZE']
+        base, extension = path.rsplit('.', 1)
+
+        with Image.open(path) as original:
+            image_format = original.format
+            animated = getattr(original, 'is_animated', False)
+            image = ImageOps.exif_transpose(original)
+
+            thumbnail = image.convert('RGB')
+            thumbnail.thumbnail((thumbnail_size, thumbnail_size))
+
+            # The original keeps its bytes; the smaller copy gets its own name
+            if not animated and max(image.size) > max_dimension:
+                image.thumbnail((max_dimension, max_dimension))
+                options = {'quality': 85} if image_format in ('JPEG', 'WEBP') else {}
+                self._save(image, f'{base}_display.{extension}', image_format, **options)
+
+            self._save(thumbnail, f'{base}_thumb.jpg', 'JPEG', quality=80)
+
+    @staticmethod
+    def _save(image, path, image_format, **options):
+        # Write beside the target and rename, so readers never see half a file
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        image.save(temporary, image_format, **options)
+        os.replace(temporary, path)
+
+    def _get_executor(self):
+        # Threads do not survive a gunicorn fork, so each worker process
+        # creates its own pool on first use
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.app.config['PHOTO_WORKERS'],
+                                                    thread_name_prefix='photo')
+                self._pid = os.getpid()
+            return self._executor
@@ -0,0 +1,305 @@
+"""
+Response cache for admin aggregate endpoints
+TTL-bounded entries keyed by endpoint and query string, invalidated on writes,
+and ETags so clients can revalidate what they already have
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+from sqlalchemy import event
+
+
+class LRUCacheBackend:
+    """In-process cache; invalidations are only seen by the current worker"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_counter(self, key):
+        return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class RedisCacheBackend:
+    """Shared cache so every gunicorn worker sees the same invalidations
+
+    ``client`` only needs ``get``, ``setex``, ``incr``, ``delete`` and
+    ``scan_iter``, so a fake can stand in for redis-py in tests.
+    """
+
+    def __init__(self, client, prefix='occamy:cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl):
+        self.client.setex(self.prefix + key, ttl, value)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def get_counter(self, key):
+        value = self.client.get(self.prefix + key)
+        return int(value) if value is not None else 0
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class CacheState:
+    """One app's cache backend and hit counters, kept in app.extensions"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+
+class ResponseCache:
+    """Caches JSON responses of read endpoints until TTL or a relevant write
+
+    Every endpoint declares the tables it reads. Each table has a generation
+    counter that is part of the cache key. A commit that wrote a table bumps
+    its generation, so older entries stop matching and age out.
+
+    One instance decorates the views and may serve several apps; each app's
+    backend and counters are a CacheState in app.extensions['response_cache'].
+    """
+
+    def __init__(self, db=None, app=None):
+        self.db = db
+        self.watched_tables = set()
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_ENABLED', True)
+        app.config.setdefault('CACHE_REDIS_URL', None)
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('CACHE_DEFAULT_TTL', 30)
+        app.config.setdefault('CACHE_TTLS', {})
+        app.config.setdefault('ETAG_ENABLED', True)
+
+        if app.config['CACHE_REDIS_URL']:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError('CACHE_REDIS_URL is set but the redis package is not installed')
+            backend = RedisCacheBackend(redis.Redis.from_url(app.config['CACHE_REDIS_URL']))
+        else:
+            backend = LRUCacheBackend(app.config['CACHE_MAX_ENTRIES'])
+
+        app.extensions['response_cache'] = CacheState(backend)
+        if self.db is not None and not self._listening:
+            # db.session is shared by every app, so listen only once
+            self._listen(self.db.session)
+            self._listening = True
+
+    def cached(self, name, depends_on):
+        """Cache a view's JSON body under its query string for CACHE_TTLS[name]"""
+        tables = tuple(sorted(depends_on))
+        self.watched_tables.update(tables)
+
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                ttl = current_app.config['CACHE_TTLS'].get(name, current_app.config['CACHE_DEFAULT_TTL'])
+                if not current_app.config['CACHE_ENABLED'] or ttl <= 0:
+                    return f(*args, **kwargs)
+
+                state = self.state
+                key = self._key(name, tables)
+                body = state.backend.get(key)
+                if body is not None:
+                    state.hits += 1
+                    response = current_app.response_class(body, mimetype='application/json')
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                state.misses += 1
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code == 200 and response.mimetype == 'application/json':
+                    state.backend.set(key, response.get_data(as_text=True), ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return decorated_function
+        return decorator
+
+    def conditional(self, name, watermark=None, depends_on=()):
+        """Tag a view's 200 responses with an ETag and answer If-None-Match with 304
+
+        `watermark` returns a small JSON-serializable value that changes
+        whenever the view's output can, such as row counts and max ids of the
+        tables it reads. It is checked before the view runs, so a client
+        that is up to date costs one cheap query. With `depends_on`, the
+        watermark is itself cached like a `cached` body of the same name, so
+        it is never staler than that body. Without a watermark the ETag is a
+        hash of the body, which saves the transfer but not the work.
+        """
+        tables = tuple(sorted(depends_on))
+        self.watched_tables.update(tables)
+
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if not current_app.config['ETAG_ENABLED']:
+                    return f(*args, **kwargs)
+
+                etag = None
+                if watermark is not None:
+                    etag = self._etag(name, self._watermark(name, tables, watermark))
+                    if request.if_none_match.contains_weak(etag):
+                        return self._not_modified(etag)
+
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                if etag is None:
+                    etag = self._etag(name, response.get_data(as_text=True))
+                    if request.if_none_match.contains_weak(etag):
+                        return self._not_modified(etag)
+                response.set_etag(etag, weak=True)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+            return decorated_function
+        return decorator
+
+    @property
+    def state(self):
+        """The current app's CacheState"""
+        return current_app.extensions['response_cache']
+
+    def invalidate(self, *tables):
+        for table in tables:
+            self.state.backend.incr(f'gen:{table}')
+
+    def clear(self):
+        self.state.backend.clear()
+
+    def stats(self):
+        state = self.state
+        total = state.hits + state.misses
+        return {
+            'backend': type(state.backend).__name__,
+            'hits': state.hits,
+            'misses': state.misses,
+            'hit_ratio': round(state.hits / total, 3) if total else 0,
+            'not_modified': state.not_modified
+        }
+
+    def _generations(self, tables):
+        return ','.join(str(self.state.backend.get_counter(f'gen:{table}')) for table in tables)
+
+    def _key(self, name, tables):
+        query = json.dumps(sorted(request.args.items(multi=True)))
+        return f'{name}:{self._generations(tables)}:{query}'
+
+    def _watermark(self, name, tables, watermark):
+        ttl = current_app.config['CACHE_TTLS'].get(name, current_app.config['CACHE_DEFAULT_TTL'])
+        if not tables or not current_app.config['CACHE_ENABLED'] or ttl <= 0:
+            return json.dumps(watermark(), default=str)
+
+        key = f'watermark:{name}:{self._generations(tables)}'
+        backend = self.state.backend
+        state = backend.get(key)
+        if state is None:
+            state = json.dumps(watermark(), default=str)
+            backend.set(key, state, ttl)
+        return state
+
+    @staticmethod
+    def _etag(name, state):
+        query = sorted(request.args.items(multi=True))
+        return hashlib.sha1(json.dumps([name, query, state], default=str).encode('utf-8')).hexdigest()
+
+    def _not_modified(self, etag):
+        self.state.not_modified += 1
+        response = current_app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def _listen(self, session):
+        # ORM flushes and Core DML run through the session both mark tables dirty;
+        # they are only invalidated once the transaction actually commits
+        @event.listens_for(session, 'after_flush')
+        def after_flush(session, flush_context):
+            dirty = session.info.setdefault('cache_dirty_tables', set())
+            for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+                table = getattr(obj, '__tablename__', None)
+                if table:
+                    dirty.add(table)
+
+        # A statement run with execution_options(cache_invalidate=False) is not counted
+        @event.listens_for(session, 'do_orm_execute')
+        def do_orm_execute(orm_execute_state):
+            if not orm_execute_state.execution_options.get('cache_invalidate', True):
+                return
+            if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+                table = getattr(orm_execute_state.statement, 'table', None)
+                if table is not None:
+                    dirty = orm_execute_state.session.info.setdefault('cache_dirty_tables', set())
+                    dirty.add(table.name)
+
+        @event.listens_for(session, 'after_commit')
+        def after_commit(session):
+            dirty = session.info.pop('cache_dirty_tables', None)
+            if dirty:
+                self.invalidate(*(dirty & self.watched_tables))
+
+        @event.listens_for(session, 'after_rollback')
+        def after_rollback(session):
+            session.info.pop('cache_dirty_tables', None)
@@ -65,7 +65,8 @@ def test_database():
     """Test if database can be created"""
     print("\nTesting database...")
     try:
-        from app import app, db, User
+        from wsgi import app
+        from app import db, User
         with app.app_context():
             # Try to query users
             users = User.query.all()
@@ -87,7 +88,7 @@ def test_routes():
     """Test if main routes are accessible"""
     print("\nTesting routes...")
     try:
-        from app import app
+        from wsgi import app
         with app.test_client() as client:
             # Test login page
             response = client.get('/')
@@ -6,21 +6,51 @@ or: python tests.py
 
 import unittest
 import json
-from datetime import datetime, date
-from app import app, db, User, WorkLog, Meeting, Sale, SampleDistribution
+import os
+import shutil
+import tempfile
+import threading
+import time
+import csv
+import sqlite3
+import gzip
+import hashlib
+import io
+from contextlib import contextmanager
+from unittest import mock
+from datetime import datetime, date, timedelta
+from app import create_app, db, User, WorkLog, Meeting, Sale, SampleDistribution, LocationLog
+from app import DailyOfficerSummary, rebuild_daily_summaries, load_user
+from app import archive_locations, IdempotencyKey, purge_idempotency_keys
+from response_cache import RedisCacheBackend
+from live_feed import RedisFeedBackend
+import photo_store as photo_store_module
+import compression
+import json_provider
+from config import engine_options
+import geo
 from werkzeug.security import generate_password_hash
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+app = create_app('testing')
+# This app's own instances, reachable outside a request
+location_buffer = app.extensions['location_buffer']
+password_hasher = app.extensions['password_hasher']
+photo_store = app.extensions['photo_store']
+user_cache = app.extensions['user_cache']
+response_cache = app.extensions['response_cache']
+live_feed = app.extensions['live_feed']
 
 class OccamyTestCase(unittest.TestCase):
     """Base test case with setup and teardown"""
     
     def setUp(self):
         """Set up test client and database"""
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test_occamy.db'
-        app.config['WTF_CSRF_ENABLED'] = False
-        
         self.app = app
         self.client = app.test_client()
+        response_cache.backend.clear()
+        user_cache.clear()
         
         with app.app_context():
             db.create_all()
@@ -64,6 +94,27 @@ class OccamyTestCase(unittest.TestCase):
     def logout(self):
         """Helper function to logout"""
         return self.client.get('/logout')
+    
+    def post(self, url, data, key=None):
+        """Helper function to POST `data` as JSON, with an optional Idempotency-Key"""
+        headers = {'Idempotency-Key': key} if key else {}
+        return self.client.post(url, data=json.dumps(data), content_type='application/json', headers=headers)
+    
+    @contextmanager
+    def count_queries(self):
+        """Collect every SQL statement executed inside the block"""
+        statements = []
+        
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
 
 
 class AuthenticationTests(OccamyTestCase):
@@ -126,6 +177,52 @@ class AdminAPITests(OccamyTestCase):
         self.assertIn('active_officers', data)
         self.assertIn('total_meetings', data)
     
+    def test_admin_stats_query_count(self):
+        """Test admin stats costs one query per table"""
+        self.login('test_admin', 'test123')
+        with self.count_queries() as statements:
+            response = self.client.get('/api/admin/stats')
+        self.assertEqual(response.status_code, 200)
+        # user loader + open sessions + summary totals + sales split + state activity
+        self.assertEqual(len(statements), 5)
+    
+    def test_admin_stats_sales_breakdown(self):
+        """Test conditional aggregation splits sales by type"""
+        with app.app_context():
+            officer = User.query.filter_by(username='test_officer').first()
+            for sale_type in ('B2C', 'B2C', 'B2B'):
+                db.session.add(Sale(user_id=officer.id, sale_type=sale_type, customer_name='Test',
+                                    product_sku='TEST', product_name='Test', quantity=1))
+            db.session.add(WorkLog(user_id=officer.id, date=datetime.utcnow().date(),
+                                   status='started', distance_traveled=12.5))
+            db.session.commit()
+            rebuild_daily_summaries()
+        
+        self.login('test_admin', 'test123')
+        data = json.loads(self.client.get('/api/admin/stats').data)
+        self.assertEqual(data['total_sales'], 3)
+        self.assertEqual(data['b2c_sales'], 2)
+        self.assertEqual(data['b2b_sales'], 1)
+        self.assertEqual(data['active_officers'], 1)
+        self.assertEqual(data['total_distance'], 12.5)
+    
+    def test_admin_stats_state_activity_counts(self):
+        """Test state activity counts are not multiplied by the join"""
+        with app.app_context():
+            officer = User.query.filter_by(username='test_officer').first()
+            for _ in range(2):
+                db.session.add(Meeting(user_id=officer.id, meeting_type='one_on_one'))
+            for _ in range(3):
+                db.session.add(Sale(user_id=officer.id, sale_type='B2C', customer_name='Test',
+                                    product_sku='TEST', product_name='Test', quantity=1))
+            db.session.commit()
+        
+        self.login('test_admin', 'test123')
+        response = self.client.get('/api/admin/stats')
+        data = json.loads(response.data)
+        self.assertEqual(data['state_activity'],
+                         [{'state': 'Test State', 'meetings': 2, 'sales': 3}])
+    
     def test_admin_can_create_user(self):
         """Test admin can create new field officer"""
         self.login('test_admin', 'test123')
@@ -180,6 +277,14 @@ class FieldOfficerAPITests(OccamyTestCase):
         response = self.client.get('/field/dashboard')
         self.assertEqual(response.status_code, 200)
     
+    def test_dashboard_uploads_track_within_batch_limit(self):
+        """Test the dashboard chunks its location uploads by the server's limit"""
+        self.login('test_officer', 'test123')
+        response = self.client.get('/field/dashboard')
+        page = response.get_data(as_text=True)
+        self.assertIn(f"const LOCATION_BATCH_MAX_POINTS = {app.config['LOCATION_BATCH_MAX_POINTS']};", page)
+        self.assertIn(f"const SYNC_MAX_ITEMS = {app.config['SYNC_MAX_ITEMS']};", page)
+    
     def test_start_work_day(self):
         """Test starting work day"""
         self.login('test_officer', 'test123')
@@ -196,8 +301,8 @@ class FieldOfficerAPITests(OccamyTestCase):
         data = json.loads(response.data)
         self.assertTrue(data['success'])
     
-    def test_cannot_start_work_twice(self):
-        """Test cannot start work day twice"""
+    def test_starting_work_twice_returns_the_open_session(self):
+        """Test a repeated start gets the open work session back instead of a second one"""
         self.login('test_officer', 'test123')
         work_data = {
             'latitude': 26.8467,
@@ -205,16 +310,20 @@ class FieldOfficerAPITests(OccamyTestCase):
             'odometer': 1000
         }
         # First start
-        self.client.post('/api/field/worklog/start',
+        first = self.client.post('/api/field/worklog/start',
             data=json.dumps(work_data),
             content_type='application/json'
         )
-        # Second start (should fail)
+        # Second start (a retry without an idempotency key)
         response = self.client.post('/api/field/worklog/start',
-            data=json.dumps(work_data),
+            data=json.dumps(dict(work_data, odometer=1005)),
             content_type='application/json'
         )
-        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['worklog_id'], json.loads(first.data)['worklog_id'])
+        with app.app_context():
+            self.assertEqual(WorkLog.query.count(), 1)
+            self.assertEqual(WorkLog.query.one().odometer_start, 1000)
     
     def test_log_one_on_one_meeting(self):
         """Test logging one-on-one meeting"""
@@ -251,6 +360,37 @@ class FieldOfficerAPITests(OccamyTestCase):
         )
         self.assertEqual(response.status_code, 200)
     
+    def test_meeting_coordinates_sent_as_strings(self):
+        """Test numeric strings are stored as floats with a geohash"""
+        self.login('test_officer', 'test123')
+        response = self.client.post('/api/field/meeting',
+            data=json.dumps({'meeting_type': 'group', 'village': 'Test', 'latitude': '26.8467', 'longitude': '80.9462'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        with app.app_context():
+            meeting = db.session.get(Meeting, json.loads(response.data)['meeting_id'])
+            self.assertEqual(meeting.location_lat, 26.8467)
+            self.assertEqual(meeting.geohash, geo.encode(26.8467, 80.9462))
+    
+    def test_invalid_coordinates_rejected(self):
+        """Test non-numeric or out of range coordinates return 400"""
+        self.login('test_officer', 'test123')
+        for latitude, longitude in (('abc', 80.9), (26.8, None), (95, 80.9)):
+            response = self.client.post('/api/field/meeting',
+                data=json.dumps({'meeting_type': 'group', 'village': 'Test', 'latitude': latitude, 'longitude': longitude}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400)
+            response = self.client.post('/api/field/location',
+                data=json.dumps({'latitude': latitude, 'longitude': longitude}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400)
+        with app.app_context():
+            self.assertEqual(Meeting.query.count(), 0)
+            self.assertEqual(LocationLog.query.count(), 0)
+    
     def test_log_sample_distribution(self):
         """Test logging sample distribution"""
         self.login('test_officer', 'test123')
@@ -310,6 +450,47 @@ class FieldOfficerAPITests(OccamyTestCase):
         )
         self.assertEqual(response.status_code, 200)
     
+    def test_batch_location_upload(self):
+        """Test uploading a batch of buffered GPS points"""
+        self.login('test_officer', 'test123')
+        points = [
+            {'latitude': 26.8467, 'longitude': 80.9462, 'accuracy': 12,
+             'timestamp': '2024-02-06T09:00:00Z'},
+            {'latitude': 26.8470, 'longitude': 80.9465,
+             'timestamp': '2024-02-06T09:01:00+05:30'}
+        ]
+        response = self.client.post('/api/field/location/batch',
+            data=json.dumps({'points': points}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['inserted'], 2)
+        
+        with app.app_context():
+            logs = LocationLog.query.order_by(LocationLog.timestamp).all()
+            self.assertEqual(len(logs), 2)
+            self.assertEqual(logs[0].timestamp, datetime(2024, 2, 6, 3, 31))
+            self.assertEqual(logs[1].timestamp, datetime(2024, 2, 6, 9, 0))
+            self.assertEqual(logs[1].activity_type, 'tracking')
+    
+    def test_batch_location_rejects_invalid_point(self):
+        """Test a batch with a bad point is rejected without partial writes"""
+        self.login('test_officer', 'test123')
+        points = [
+            {'latitude': 26.8467, 'longitude': 80.9462},
+            {'latitude': 26.8470, 'timestamp': 'yesterday'}
+        ]
+        response = self.client.post('/api/field/location/batch',
+            data=json.dumps({'points': points}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['index'], 1)
+        
+        with app.app_context():
+            self.assertEqual(LocationLog.query.count(), 0)
+    
     def test_get_my_activities(self):
         """Test getting personal activity statistics"""
         self.login('test_officer', 'test123')
@@ -320,6 +501,1687 @@ class FieldOfficerAPITests(OccamyTestCase):
         self.assertIn('sales', data)
 
 
+class LocationBufferTests(OccamyTestCase):
+    """Test the write-behind buffer for location pings"""
+    
+    def setUp(self):
+        super().setUp()
+        app.config['LOCATION_BUFFER_ENABLED'] = True
+        app.config['LOCATION_BUFFER_FLUSH_INTERVAL'] = 60
+    
+    def tearDown(self):
+        location_buffer.flush()
+        app.config['LOCATION_BUFFER_ENABLED'] = False
+        app.config['LOCATION_BUFFER_MAX_SIZE'] = 10000
+        app.config['LOCATION_BUFFER_FLUSH_INTERVAL'] = 5
+        super().tearDown()
+    
+    def post_location(self):
+        return self.client.post('/api/field/location',
+            data=json.dumps({'latitude': 26.8467, 'longitude': 80.9462}),
+            content_type='application/json'
+        )
+    
+    def test_location_is_queued_then_flushed(self):
+        """Test location pings are written on flush rather than in the request"""
+        self.login('test_officer', 'test123')
+        response = self.post_location()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.data)['queued'])
+        
+        with app.app_context():
+            self.assertEqual(LocationLog.query.count(), 0)
+        self.assertEqual(location_buffer.flush(), 1)
+        with app.app_context():
+            self.assertEqual(LocationLog.query.count(), 1)
+    
+    def test_string_coordinates_do_not_break_a_flush(self):
+        """Test a ping sent with string coordinates is queued as floats"""
+        self.login('test_officer', 'test123')
+        self.post_location()
+        response = self.client.post('/api/field/location',
+            data=json.dumps({'latitude': '26.8', 'longitude': '80.9'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(location_buffer.flush(), 2)
+        with app.app_context():
+            self.assertEqual(LocationLog.query.filter(LocationLog.geohash.isnot(None)).count(), 2)
+    
+    def test_failed_batch_is_bisected_around_bad_rows(self):
+        """Test one row the database rejects does not take its batch with it"""
+        self.login('test_officer', 'test123')
+        for _ in range(5):
+            self.post_location()
+        with app.app_context():
+            location_buffer._queue[2] = dict(location_buffer._queue[2], user_id=None)
+        failed = location_buffer.failed
+        
+        self.assertEqual(location_buffer.flush(), 4)
+        self.assertEqual(location_buffer.failed, failed + 1)
+        with app.app_context():
+            self.assertEqual(LocationLog.query.count(), 4)
+    
+    def test_unavailable_database_keeps_rows_queued(self):
+        """Test a retryable error puts the batch back instead of dropping it"""
+        self.login('test_officer', 'test123')
+        for _ in range(3):
+            self.post_location()
+        down = OperationalError('INSERT', {}, Exception('database is locked'))
+        
+        with mock.patch.object(location_buffer, 'writer', side_effect=down):
+            self.assertEqual(location_buffer.flush(), 0)
+        self.assertEqual(location_buffer.depth, 3)
+        self.assertEqual(location_buffer.flush(), 3)
+        with app.app_context():
+            self.assertEqual(LocationLog.query.count(), 3)
+    
+    def test_work_end_measures_buffered_points_in_its_transaction(self):
+        """Test ending the day writes the officer's queued points without a flush"""
+        self.login('test_officer', 'test123')
+        self.client.post('/api/field/worklog/start', data=json.dumps({'odometer': 10}),
+                         content_type='application/json')
+        for step in range(5):
+            self.client.post('/api/field/location',
+                data=json.dumps({'latitude': 26.84 + step * 0.01, 'longitude': 80.94}),
+                content_type='application/json'
+            )
+        self.assertEqual(location_buffer.depth, 5)
+        # A minute apart, so the speed filter keeps every step of the track
+        first = location_buffer._queue[0]['timestamp']
+        start = max(first - timedelta(minutes=5), datetime.combine(first.date(), datetime.min.time()))
+        for step, row in enumerate(location_buffer._queue):
+            row['timestamp'] = start + timedelta(minutes=step)
+        
+        with mock.patch.object(location_buffer, 'flush') as flush:
+            response = self.client.post('/api/field/worklog/end', data=json.dumps({'odometer': 20}),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        flush.assert_not_called()
+        self.assertEqual(location_buffer.depth, 0)
+        with app.app_context():
+            work_log = WorkLog.query.one()
+            self.assertEqual(LocationLog.query.count(), work_log.track_points_kept)
+            self.assertEqual(work_log.track_points, 5)
+            self.assertGreater(work_log.gps_distance, 4)
+    
+    def test_invalid_ping_is_rejected_before_queueing(self):
+        """Test rows are validated in the request, not at flush time"""
+        self.login('test_officer', 'test123')
+        response = self.client.post('/api/field/location',
+            data=json.dumps({'latitude': 26.8, 'longitude': 80.9, 'accuracy': 'high'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(location_buffer.depth, 0)
+    
+    def test_full_buffer_returns_503(self):
+        """Test backpressure when the buffer is at capacity"""
+        app.config['LOCATION_BUFFER_MAX_SIZE'] = 1
+        self.login('test_officer', 'test123')
+        self.assertEqual(self.post_location().status_code, 200)
+        self.assertEqual(self.post_location().status_code, 503)
+    
+    def test_admin_can_see_buffer_depth(self):
+        """Test queue depth is exposed to admins"""
+        self.login('test_officer', 'test123')
+        self.post_location()
+        self.logout()
+        self.login('test_admin', 'test123')
+        response = self.client.get('/api/admin/location-buffer')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['depth'], 1)
+
+
+class FieldSyncTests(OccamyTestCase):
+    """Test uploading an offline backlog in one request"""
+    
+    def sync(self, items):
+        return self.client.post('/api/field/sync',
+            data=json.dumps({'items': items}),
+            content_type='application/json'
+        )
+    
+    def backlog(self):
+        """One offline work day from yesterday, deliberately out of order"""
+        day = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        at = lambda hours: (day + timedelta(hours=hours)).isoformat() + 'Z'
+        return [
+            {'type': 'work_end', 'timestamp': at(17), 'latitude': 26.87, 'longitude': 80.95, 'odometer': 1030},
+            {'type': 'work_start', 'timestamp': at(9), 'latitude': 26.84, 'longitude': 80.95, 'odometer': 1000},
+            {'type': 'meeting', 'client_id': 'm-1', 'timestamp': at(10), 'meeting_type': 'one_on_one',
+             'person_name': 'Ram Singh', 'latitude': 26.85, 'longitude': 80.95},
+            {'type': 'sale', 'timestamp': at(11), 'sale_type': 'B2C', 'customer_name': 'Ram Singh',
+             'product_sku': 'CF-001', 'product_name': 'Cattle Feed', 'quantity': 2, 'total_amount': 900},
+            {'type': 'sample', 'timestamp': at(12), 'recipient_name': 'Ram Singh',
+             'product_name': 'Cattle Feed', 'quantity': 1},
+        ] + [
+            {'type': 'location', 'timestamp': at(9 + i), 'latitude': 26.84 + i * 0.005, 'longitude': 80.95}
+            for i in range(7)
+        ], day.date()
+    
+    def test_backlog_is_applied_in_one_request(self):
+        """Test a mixed batch is stored with client times and per-item ids"""
+        self.login('test_officer', 'test123')
+        items, day = self.backlog()
+        response = self.sync(items)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['synced'], len(items))
+        self.assertEqual([result['type'] for result in data['results']], [item['type'] for item in items])
+        self.assertEqual(data['results'][2]['client_id'], 'm-1')
+        self.assertIsNone(data['results'][-1]['id'])
+        
+        with app.app_context():
+            meeting = db.session.get(Meeting, data['results'][2]['id'])
+            self.assertEqual(meeting.person_name, 'Ram Singh')
+            self.assertEqual(meeting.date, datetime.combine(day, datetime.min.time()) + timedelta(hours=10))
+            work_log = db.session.get(WorkLog, data['results'][1]['id'])
+            self.assertEqual(data['results'][0]['id'], work_log.id)
+            self.assertEqual(work_log.date, day)
+            self.assertEqual(work_log.status, 'ended')
+            self.assertEqual(work_log.distance_traveled, 30)
+            # The day's points were stored before work_end measured and compacted them
+            self.assertEqual(work_log.track_points, 7)
+            self.assertGreater(work_log.gps_distance, 3)
+            summary = DailyOfficerSummary.query.filter_by(day=day).one()
+            self.assertEqual((summary.meetings, summary.sales, summary.samples, summary.revenue), (1, 1, 1, 900))
+    
+    def test_invalid_item_rejects_whole_batch(self):
+        """Test nothing is stored when one item is invalid"""
+        self.login('test_officer', 'test123')
+        items, _ = self.backlog()
+        del items[3]['product_sku']
+        response = self.sync(items)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('index 3', json.loads(response.data)['error'])
+        # The device sets that item aside by its index and syncs the rest
+        self.assertEqual(json.loads(response.data)['index'], 3)
+        with app.app_context():
+            self.assertEqual(Meeting.query.count(), 0)
+            self.assertEqual(WorkLog.query.count(), 0)
+            self.assertEqual(LocationLog.query.count(), 0)
+    
+    def test_work_end_needs_open_work_day(self):
+        """Test work events are checked like the single-item endpoints"""
+        self.login('test_officer', 'test123')
+        response = self.sync([{'type': 'work_end', 'odometer': 10}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('No active work session found', json.loads(response.data)['error'])
+    
+    def test_malformed_batches_rejected(self):
+        """Test empty, oversized and unknown-type batches"""
+        self.login('test_officer', 'test123')
+        self.assertEqual(self.sync([]).status_code, 400)
+        self.assertEqual(self.sync([{'type': 'visit'}]).status_code, 400)
+        self.assertEqual(self.sync([{'type': 'location', 'timestamp': 5}]).status_code, 400)
+        app.config['SYNC_MAX_ITEMS'] = 1
+        try:
+            items, _ = self.backlog()
+            self.assertEqual(self.sync(items[:2]).status_code, 400)
+        finally:
+            app.config['SYNC_MAX_ITEMS'] = 5000
+
+
+class IdempotencyTests(OccamyTestCase):
+    """Test Idempotency-Key replay and the single open work session per day"""
+    
+    MEETING = {'meeting_type': 'group', 'village': 'Rampur', 'attendees_count': 15}
+    
+    def test_retry_replays_stored_response(self):
+        """Test a retried POST returns the first response without writing again"""
+        self.login('test_officer', 'test123')
+        first = self.post('/api/field/meeting', self.MEETING, key='meeting-1')
+        second = self.post('/api/field/meeting', self.MEETING, key='meeting-1')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second.headers['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+        with app.app_context():
+            self.assertEqual(Meeting.query.count(), 1)
+            self.assertEqual(DailyOfficerSummary.query.one().meetings, 1)
+        
+        # Without a key every POST is a new record, as before
+        self.post('/api/field/meeting', self.MEETING)
+        with app.app_context():
+            self.assertEqual(Meeting.query.count(), 2)
+    
+    def test_key_reused_for_other_request(self):
+        """Test a key cannot be replayed against a different body or endpoint"""
+        self.login('test_officer', 'test123')
+        self.post('/api/field/meeting', self.MEETING, key='k')
+        self.assertEqual(self.post('/api/field/meeting', dict(self.MEETING, village='Other'), key='k').status_code, 422)
+        self.assertEqual(self.post('/api/field/location', {'latitude': 1, 'longitude': 2}, key='k').status_code, 422)
+    
+    def test_failed_request_releases_key(self):
+        """Test only successful responses are stored"""
+        self.login('test_officer', 'test123')
+        self.assertEqual(self.post('/api/field/worklog/end', {}, key='end-1').status_code, 400)
+        with app.app_context():
+            self.assertEqual(IdempotencyKey.query.count(), 0)
+        self.post('/api/field/worklog/start', {'odometer': 100}, key='start-1')
+        self.assertEqual(self.post('/api/field/worklog/end', {}, key='end-1').status_code, 200)
+    
+    def test_in_flight_key_conflicts(self):
+        """Test a retry that overlaps the original request is told to wait"""
+        self.login('test_officer', 'test123')
+        body = json.dumps(self.MEETING).encode()
+        with app.app_context():
+            officer = User.query.filter_by(username='test_officer').first()
+            db.session.add(IdempotencyKey(user_id=officer.id, key='k', endpoint='main.create_meeting',
+                                          request_hash=hashlib.sha256(body).hexdigest(),
+                                          expires_at=datetime.utcnow() + timedelta(hours=1)))
+            db.session.commit()
+        response = self.client.post('/api/field/meeting', data=body, content_type='application/json',
+                                    headers={'Idempotency-Key': 'k'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.headers['Retry-After'], '1')
+    
+    def test_expired_keys(self):
+        """Test an expired key is treated as new and purged"""
+        self.login('test_officer', 'test123')
+        self.post('/api/field/meeting', self.MEETING, key='k')
+        with app.app_context():
+            db.session.execute(db.update(IdempotencyKey).values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+            db.session.commit()
+        response = self.post('/api/field/meeting', self.MEETING, key='k')
+        self.assertNotIn('Idempotent-Replayed', response.headers)
+        with app.app_context():
+            self.assertEqual(Meeting.query.count(), 2)
+            self.assertEqual(purge_idempotency_keys(datetime.utcnow() + timedelta(days=2)), 1)
+    
+    def test_one_open_work_session_per_day(self):
+        """Test the unique index rejects a second open session but not a new one after ending"""
+        self.login('test_officer', 'test123')
+        first = self.post('/api/field/worklog/start', {'odometer': 100})
+        self.assertEqual(first.status_code, 200)
+        response = self.post('/api/field/worklog/start', {'odometer': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['worklog_id'], json.loads(first.data)['worklog_id'])
+        
+        with app.app_context():
+            officer = User.query.filter_by(username='test_officer').first()
+            db.session.add(WorkLog(user_id=officer.id, date=datetime.utcnow().date(), status='started'))
+            with self.assertRaises(IntegrityError):
+                db.session.commit()
+            db.session.rollback()
+        
+        self.post('/api/field/worklog/end', {'odometer': 110})
+        self.assertEqual(self.post('/api/field/worklog/start', {'odometer': 110}).status_code, 200)
+        with app.app_context():
+            self.assertEqual(WorkLog.query.filter_by(status='started').count(), 1)
+    
+    def test_indexes_command_closes_duplicate_sessions(self):
+        """Test existing duplicate open sessions are set aside before the index is built"""
+        from migrate_db import create_indexes
+        with app.app_context():
+            db.session.execute(db.text('DROP INDEX uq_work_log_user_id_date_started'))
+            officer = User.query.filter_by(username='test_officer').first()
+            today = datetime.utcnow().date()
+            for hour in (9, 10):
+                db.session.add(WorkLog(user_id=officer.id, date=today, status='started',
+                                       start_time=datetime.combine(today, datetime.min.time()) + timedelta(hours=hour)))
+            db.session.commit()
+        with mock.patch('migrate_db.app', app):
+            create_indexes()
+        with app.app_context():
+            statuses = [work_log.status for work_log in WorkLog.query.order_by(WorkLog.start_time)]
+            self.assertEqual(statuses, ['started', 'duplicate'])
+
+
+class PhotoUploadTests(OccamyTestCase):
+    """Test streamed, content-addressed photo uploads"""
+    
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        app.config['PHOTO_UPLOAD_DIR'] = self.directory
+    
+    def tearDown(self):
+        photo_store.wait()
+        app.config['PHOTO_UPLOAD_DIR'] = os.path.join(app.config['UPLOAD_FOLDER'], 'photos')
+        app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+        shutil.rmtree(self.directory)
+        super().tearDown()
+    
+    def image(self, size=(40, 30), color='red', image_format='PNG'):
+        if photo_store_module.Image is None:
+            # Any bytes behind a valid signature are accepted without Pillow
+            return io.BytesIO(b'\x89PNG\r\n\x1a\n' + color.encode() * 100)
+        buffer = io.BytesIO()
+        photo_store_module.Image.new('RGB', size, color).save(buffer, image_format)
+        buffer.seek(0)
+        return buffer
+    
+    def upload(self, *files):
+        return self.client.post('/api/field/photos', content_type='multipart/form-data',
+                                data={'photo': [(file, name) for file, name in files]})
+    
+    def stored_files(self):
+        return sorted(name for _, _, names in os.walk(self.directory) for name in names)
+    
+    def test_upload_is_stored_under_its_hash(self):
+        """Test a photo is written once, named by its SHA-256"""
+        self.login('test_officer', 'test123')
+        data = self.image().getvalue()
+        response = self.upload((io.BytesIO(data), 'meeting.jpeg'))
+        self.assertEqual(response.status_code, 200)
+        photo = json.loads(response.data)['photos'][0]
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(photo['sha256'], digest)
+        self.assertEqual(photo['size'], len(data))
+        self.assertFalse(photo['duplicate'])
+        # The detected format decides the extension, not the client's filename
+        self.assertEqual(photo['url'], f'/static/uploads/photos/{digest[:2]}/{digest}.png')
+        self.assertTrue(os.path.exists(os.path.join(self.directory, digest[:2], f'{digest}.png')))
+    
+    def test_reupload_is_deduplicated(self):
+        """Test the same bytes resolve to the existing file"""
+        self.login('test_officer', 'test123')
+        data = self.image().getvalue()
+        first = json.loads(self.upload((io.BytesIO(data), 'a.png')).data)['photos'][0]
+        second = json.loads(self.upload((io.BytesIO(data), 'b.png')).data)['photos'][0]
+        self.assertTrue(second['duplicate'])
+        self.assertEqual(first['url'], second['url'])
+        photo_store.wait()
+        self.assertEqual(len([name for name in self.stored_files() if not name.endswith('_thumb.jpg')]), 1)
+    
+    def test_several_photos_in_one_request(self):
+        """Test every photo part is stored and reported in order"""
+        self.login('test_officer', 'test123')
+        response = self.upload((self.image(color='red'), 'a.png'), (self.image(color='blue'), 'b.png'))
+        photos = json.loads(response.data)['photos']
+        self.assertEqual(len(photos), 2)
+        self.assertNotEqual(photos[0]['sha256'], photos[1]['sha256'])
+    
+    def test_rejected_uploads_leave_no_files(self):
+        """Test non-images, missing files and oversized bodies are refused cleanly"""
+        self.login('test_officer', 'test123')
+        response = self.upload((io.BytesIO(b'%PDF-1.4 not a photo'), 'photo.jpg'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post('/api/field/photos', data={'notes': 'x'},
+                                          content_type='multipart/form-data').status_code, 400)
+        self.assertEqual(self.client.post('/api/field/photos', json={}).status_code, 400)
+        app.config['MAX_CONTENT_LENGTH'] = 1024
+        self.assertEqual(self.upload((io.BytesIO(b'\xff\xd8\xff' + b'0' * 4096), 'big.jpg')).status_code, 413)
+        self.assertEqual(self.stored_files(), [])
+    
+    @unittest.skipIf(photo_store_module.Image is None, 'Pillow is not installed')
+    def test_large_photo_downscaled_with_thumbnail(self):
+        """Test background processing writes a smaller copy and a thumbnail beside the original"""
+        self.login('test_officer', 'test123')
+        data = self.image(size=(3200, 2400), image_format='JPEG').getvalue()
+        self.upload((io.BytesIO(data), 'big.jpg'))
+        photo_store.wait()
+        photo = json.loads(self.upload((io.BytesIO(data), 'big.jpg')).data)['photos'][0]
+        self.assertFalse(photo['processing'])
+        prefix = len(app.config['PHOTO_URL_PREFIX']) + 1
+        # The content-addressed original is never rewritten
+        with open(os.path.join(self.directory, photo['url'][prefix:]), 'rb') as original:
+            self.assertEqual(hashlib.sha256(original.read()).hexdigest(), photo['sha256'])
+        with photo_store_module.Image.open(os.path.join(self.directory, photo['display_url'][prefix:])) as image:
+            self.assertEqual(image.size, (1600, 1200))
+        with photo_store_module.Image.open(os.path.join(self.directory, photo['thumbnail_url'][prefix:])) as image:
+            self.assertEqual(image.size, (320, 240))
+    
+    @unittest.skipIf(photo_store_module.Image is None, 'Pillow is not installed')
+    def test_thumbnail_url_only_once_written(self):
+        """Test a photo still being processed reports no thumbnail yet"""
+        self.login('test_officer', 'test123')
+        with mock.patch.object(photo_store, '_submit'):
+            photo = json.loads(self.upload((self.image(), 'a.png')).data)['photos'][0]
+        self.assertTrue(photo['processing'])
+        self.assertIsNone(photo['thumbnail_url'])
+        self.assertIsNone(photo['display_url'])
+    
+    def test_admin_cannot_upload(self):
+        """Test uploads are limited to field officers"""
+        self.login('test_admin', 'test123')
+        self.assertEqual(self.upload((self.image(), 'a.png')).status_code, 403)
+
+
+class DailySummaryTests(OccamyTestCase):
+    """Test the incrementally maintained daily rollup"""
+    
+    def log_day(self):
+        self.login('test_officer', 'test123')
+        self.post('/api/field/worklog/start', {'latitude': 26.8, 'longitude': 80.9, 'odometer': 1000})
+        self.post('/api/field/meeting', {'meeting_type': 'group', 'village': 'Rampur'})
+        self.post('/api/field/meeting', {'meeting_type': 'one_on_one', 'person_name': 'Ram'})
+        self.post('/api/field/sale', {'sale_type': 'B2C', 'customer_name': 'Ram', 'product_sku': 'NUT-001',
+                                      'product_name': 'Calcium', 'quantity': 5, 'total_amount': 500})
+        self.post('/api/field/sample', {'recipient_name': 'Ram', 'product_name': 'Calcium', 'quantity': 1})
+        self.post('/api/field/location', {'latitude': 26.8, 'longitude': 80.9})
+        self.post('/api/field/worklog/end', {'latitude': 26.9, 'longitude': 81.0, 'odometer': 1042})
+        self.logout()
+    
+    def summary_row(self):
+        summary = DailyOfficerSummary.query.one()
+        return {name: getattr(summary, name) for name in
+                ('day', 'meetings', 'sales', 'samples', 'revenue', 'distance', 'location_points')}
+    
+    def test_writes_update_summary(self):
+        """Test every field write updates the officer-day row"""
+        self.log_day()
+        with app.app_context():
+            self.assertEqual(self.summary_row(), {
+                'day': datetime.utcnow().date(), 'meetings': 2, 'sales': 1, 'samples': 1,
+                'revenue': 500, 'distance': 42, 'location_points': 1
+            })
+    
+    def test_rebuild_matches_incremental(self):
+        """Test the backfill produces the same totals as live updates"""
+        self.log_day()
+        with app.app_context():
+            incremental = self.summary_row()
+            self.assertEqual(rebuild_daily_summaries(), 1)
+            self.assertEqual(self.summary_row(), incremental)
+    
+    def test_activities_read_from_summary(self):
+        """Test admin activities are served from the rollup"""
+        self.log_day()
+        self.login('test_admin', 'test123')
+        data = json.loads(self.client.get('/api/admin/activities?days=7').data)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0]['meetings'], 2)
+        self.assertEqual(data[0]['sales'], 1)
+        self.assertEqual(data[0]['distance'], 42)
+
+
+class TrackCompactionTests(OccamyTestCase):
+    """Test location track simplification when a work day ends"""
+    
+    def log_track(self, points=200):
+        """Start a day and log a straight, slightly noisy track with one meeting stop off the line"""
+        self.login('test_officer', 'test123')
+        self.post('/api/field/worklog/start', {'latitude': 30.9, 'longitude': 75.85, 'odometer': 1000})
+        start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        batch = [{
+            'latitude': 30.9 + i * 0.0001,
+            'longitude': 75.85 + (0.00002 if i % 2 else -0.00002),
+            'timestamp': (start + timedelta(minutes=i)).isoformat(),
+            'activity_type': 'meeting' if i == points // 2 else 'tracking'
+        } for i in range(points)]
+        batch[points // 2]['longitude'] = 75.8503
+        self.post('/api/field/location/batch', {'points': batch})
+    
+    def test_end_of_day_compacts_track(self):
+        """Test ending the day drops near-collinear points but keeps activity points"""
+        self.log_track()
+        self.post('/api/field/worklog/end', {'latitude': 30.92, 'longitude': 75.85, 'odometer': 1042})
+        with app.app_context():
+            work_log = WorkLog.query.one()
+            self.assertEqual(work_log.track_points, 200)
+            self.assertEqual(work_log.track_points_kept, LocationLog.query.count())
+            self.assertLessEqual(work_log.track_points_kept, 20)
+            self.assertEqual(LocationLog.query.filter_by(activity_type='meeting').count(), 1)
+            self.assertEqual(DailyOfficerSummary.query.one().location_points, 200)
+            self.assertEqual(rebuild_daily_summaries(), 1)
+            self.assertEqual(DailyOfficerSummary.query.one().location_points, 200)
+    
+    def test_compaction_can_be_disabled(self):
+        """Test TRACK_COMPACT_ON_END=False leaves the raw track alone"""
+        app.config['TRACK_COMPACT_ON_END'] = False
+        try:
+            self.log_track()
+            self.post('/api/field/worklog/end', {'latitude': 30.92, 'longitude': 75.85, 'odometer': 1042})
+        finally:
+            app.config['TRACK_COMPACT_ON_END'] = True
+        with app.app_context():
+            self.assertEqual(LocationLog.query.count(), 200)
+            self.assertIsNone(WorkLog.query.one().track_points)
+    
+    def test_compact_tracks_command(self):
+        """Test the migration command compacts ended days once"""
+        from migrate_db import compact_tracks
+        app.config['TRACK_COMPACT_ON_END'] = False
+        try:
+            self.log_track()
+            self.post('/api/field/worklog/end', {'latitude': 30.92, 'longitude': 75.85, 'odometer': 1042})
+            with mock.patch('migrate_db.app', app):
+                compact_tracks()
+        finally:
+            app.config['TRACK_COMPACT_ON_END'] = True
+        with app.app_context():
+            work_log = WorkLog.query.one()
+            self.assertEqual(work_log.track_points, 200)
+            self.assertEqual(LocationLog.query.count(), work_log.track_points_kept)
+    
+    def test_simplify_keeps_corners(self):
+        """Test a corner further than the tolerance survives simplification"""
+        track = [(30.9 + i * 0.0001, 75.85) for i in range(50)] + \
+                [(30.9049, 75.85 + i * 0.0001) for i in range(1, 50)]
+        kept = geo.simplify(track, 10)
+        self.assertEqual(kept, [0, 49, 98])
+
+
+class GpsDistanceTests(OccamyTestCase):
+    """Test GPS track distance stored next to the odometer distance"""
+    
+    def log_walk(self):
+        """Walk 60 steps of 0.001 degrees north, plus one glitch and one inaccurate fix"""
+        self.login('test_officer', 'test123')
+        self.post('/api/field/worklog/start', {'latitude': 30.9, 'longitude': 75.85, 'odometer': 1000})
+        start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        batch = [{
+            'latitude': 30.9 + i * 0.001, 'longitude': 75.85, 'accuracy': 5,
+            'timestamp': (start + timedelta(minutes=i)).isoformat()
+        } for i in range(61)]
+        batch[30]['latitude'] += 0.5  # 55 km jump and back
+        batch[40]['accuracy'] = 500
+        self.post('/api/field/location/batch', {'points': batch})
+        self.post('/api/field/worklog/end', {'latitude': 30.96, 'longitude': 75.85, 'odometer': 1010})
+    
+    def test_end_of_day_stores_gps_distance(self):
+        """Test glitches are rejected and the odometer/GPS ratio is stored"""
+        self.log_walk()
+        with app.app_context():
+            work_log = WorkLog.query.one()
+            self.assertAlmostEqual(work_log.gps_distance, 60 * 0.1112, delta=0.05)
+            self.assertAlmostEqual(work_log.gps_distance_ratio, 10 / work_log.gps_distance, places=2)
+    
+    def test_gps_distance_command(self):
+        """Test the batch command fills days that have no GPS distance yet"""
+        from migrate_db import gps_distance
+        app.config['TRACK_COMPACT_ON_END'] = False
+        try:
+            self.log_walk()
+        finally:
+            app.config['TRACK_COMPACT_ON_END'] = True
+        with app.app_context():
+            db.session.execute(db.update(WorkLog).values(gps_distance=None, gps_distance_ratio=None))
+            db.session.commit()
+        with mock.patch('migrate_db.app', app):
+            gps_distance()
+        with app.app_context():
+            self.assertAlmostEqual(WorkLog.query.one().gps_distance, 60 * 0.1112, delta=0.05)
+    
+    @unittest.skipIf(geo.np is None, 'numpy is not installed')
+    def test_numpy_matches_python(self):
+        """Test the vectorized and pure Python engines agree"""
+        start = datetime(2024, 3, 1, 23)
+        times = [start + timedelta(minutes=i) for i in range(120)]
+        lats = [30.9 + i * 0.0007 + (0.3 if i == 50 else 0) for i in range(120)]
+        lngs = [75.85 + (i % 7) * 0.0002 for i in range(120)]
+        accuracies = [5 + i % 20 for i in range(120)]
+        args = (times, lats, lngs, accuracies, 120 / 3.6, 100)
+        numpy_totals = geo._track_lengths_numpy(*args)
+        python_totals = geo._track_lengths_python(*args)
+        self.assertEqual(numpy_totals.keys(), python_totals.keys())
+        for day in numpy_totals:
+            self.assertAlmostEqual(numpy_totals[day], python_totals[day], places=6)
+
+
+class LocationArchiveTests(OccamyTestCase):
+    """Test moving old location logs to the compressed archive"""
+    
+    def setUp(self):
+        super().setUp()
+        self.archive_dir = tempfile.mkdtemp()
+        app.config['LOCATION_ARCHIVE_DIR'] = self.archive_dir
+        app.config['LOCATION_ARCHIVE_BATCH_SIZE'] = 2
+        self.old = datetime(2024, 1, 31, 10)
+        with app.app_context():
+            self.officer_id = User.query.filter_by(username='test_officer').first().id
+            for when in (self.old, self.old + timedelta(minutes=1), self.old + timedelta(days=1)):
+                db.session.add(LocationLog(user_id=self.officer_id, latitude=30.9, longitude=75.85,
+                                           accuracy=5, timestamp=when))
+            db.session.add(LocationLog(user_id=self.officer_id, latitude=30.95, longitude=75.85,
+                                       timestamp=datetime.utcnow()))
+            db.session.commit()
+    
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.archive_dir, ignore_errors=True)
+        app.config['LOCATION_ARCHIVE_DIR'] = os.path.join(app.instance_path, 'location_archive')
+        app.config['LOCATION_ARCHIVE_BATCH_SIZE'] = 5000
+    
+    def archive(self):
+        with app.app_context():
+            return archive_locations()
+    
+    def test_old_rows_moved_to_monthly_files(self):
+        """Test rows past retention are written per officer-month and deleted"""
+        self.assertEqual(self.archive(), 3)
+        with app.app_context():
+            self.assertEqual(LocationLog.query.count(), 1)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.archive_dir, str(self.officer_id)))),
+                         ['2024-01.ndjson.gz', '2024-02.ndjson.gz'])
+        self.assertEqual(self.archive(), 0)
+    
+    def test_track_api_reads_archive(self):
+        """Test an admin track request serves archived points transparently"""
+        self.archive()
+        self.login('test_admin', 'test123')
+        response = self.client.get(f'/api/admin/users/{self.officer_id}/track?from=2024-01-31&to=2024-02-01')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['archived_points'], 3)
+        self.assertEqual([point['timestamp'] for point in data['points']],
+                         ['2024-01-31T10:00:00', '2024-01-31T10:01:00', '2024-02-01T10:00:00'])
+        self.assertEqual(data['points'][0]['accuracy'], 5)
+    
+    def test_repeated_batches_not_duplicated(self):
+        """Test a batch archived twice (crash before delete) is read back once"""
+        archive = app.extensions['location_archive']
+        with app.app_context():
+            rows = [{'id': log.id, 'timestamp': log.timestamp, 'latitude': log.latitude, 'longitude': log.longitude,
+                     'accuracy': log.accuracy, 'activity_type': log.activity_type}
+                    for log in LocationLog.query.filter(LocationLog.timestamp < datetime(2024, 2, 1))]
+        archive.append(self.officer_id, date(2024, 1, 1), rows)
+        self.archive()
+        self.assertEqual(len(archive.read(self.officer_id, datetime(2024, 1, 1), datetime(2024, 3, 1))), 3)
+    
+    def test_rebuild_counts_archived_points(self):
+        """Test the rollup rebuild still counts points that left the database"""
+        self.archive()
+        with app.app_context():
+            rebuild_daily_summaries()
+            summary = DailyOfficerSummary.query.filter_by(day=date(2024, 1, 31)).one()
+            self.assertEqual(summary.location_points, 2)
+    
+    def test_track_range_validated(self):
+        """Test the track API requires a bounded date range"""
+        self.login('test_admin', 'test123')
+        url = f'/api/admin/users/{self.officer_id}/track'
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(f'{url}?from=2024-03-01&to=2024-01-01').status_code, 400)
+        self.assertEqual(self.client.get(f'{url}?from=2024-01-01&to=2024-06-01').status_code, 400)
+
+
+class AdminListPaginationTests(OccamyTestCase):
+    """Test keyset pagination and filters on admin list endpoints"""
+    
+    def setUp(self):
+        super().setUp()
+        with app.app_context():
+            officer = User.query.filter_by(username='test_officer').first()
+            other = User(username='other_officer', email='other@test.com', password_hash='x',
+                         role='field_officer', name='Other Officer', state='Other State')
+            db.session.add(other)
+            db.session.flush()
+            base = datetime(2024, 2, 1, 10, 0)
+            for i in range(5):
+                db.session.add(Sale(user_id=officer.id, date=base + timedelta(days=i), sale_type='B2C',
+                                    customer_name=f'Customer {i}', product_sku='NUT-001',
+                                    product_name='Calcium', quantity=1))
+            # Two rows sharing a timestamp must still page deterministically
+            for sku in ('NUT-002', 'NUT-003'):
+                db.session.add(Sale(user_id=other.id, date=base, sale_type='B2B',
+                                    customer_name='Distributor', product_sku=sku,
+                                    product_name='Protein', quantity=10))
+            db.session.add(Meeting(user_id=officer.id, meeting_type='group', date=base))
+            db.session.commit()
+        self.login('test_admin', 'test123')
+    
+    def get_items(self, url):
+        data = json.loads(self.client.get(url).data)
+        return data['items'], data['next_cursor']
+    
+    def test_pages_cover_every_row_once(self):
+        """Test following next_cursor visits all rows newest first"""
+        seen = []
+        url = '/api/admin/sales?limit=3'
+        while True:
+            items, cursor = self.get_items(url)
+            seen.extend(item['id'] for item in items)
+            if cursor is None:
+                break
+            url = f'/api/admin/sales?limit=3&cursor={cursor}'
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+    
+    def test_default_page_size_from_config(self):
+        """Test ITEMS_PER_PAGE is the default page size"""
+        app.config['ITEMS_PER_PAGE'] = 2
+        try:
+            items, cursor = self.get_items('/api/admin/sales')
+        finally:
+            app.config['ITEMS_PER_PAGE'] = 50
+        self.assertEqual(len(items), 2)
+        self.assertIsNotNone(cursor)
+    
+    def test_sale_filters(self):
+        """Test sale_type, product_sku, state and date range filters"""
+        self.assertEqual(len(self.get_items('/api/admin/sales?sale_type=B2B')[0]), 2)
+        self.assertEqual(len(self.get_items('/api/admin/sales?product_sku=NUT-003')[0]), 1)
+        self.assertEqual(len(self.get_items('/api/admin/sales?state=Test%20State')[0]), 5)
+        items, _ = self.get_items('/api/admin/sales?from=2024-02-02&to=2024-02-03')
+        self.assertEqual([item['customer'] for item in items], ['Customer 2', 'Customer 1'])
+    
+    def test_meeting_officer_filter(self):
+        """Test meetings can be filtered by officer"""
+        with app.app_context():
+            other_id = User.query.filter_by(username='other_officer').first().id
+        self.assertEqual(self.get_items(f'/api/admin/meetings?user_id={other_id}')[0], [])
+        self.assertEqual(len(self.get_items('/api/admin/meetings')[0]), 1)
+    
+    def test_invalid_cursor_rejected(self):
+        """Test a malformed cursor returns 400"""
+        response = self.client.get('/api/admin/sales?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+
+class QueryBudgetTests(OccamyTestCase):
+    """Fail if a list endpoint issues more SQL than its budget"""
+    
+    # Statements per request, including the user loader
+    LIST_ENDPOINT_BUDGETS = {
+        '/api/admin/users': 2,
+        '/api/admin/meetings': 2,
+        '/api/admin/sales': 2,
+        '/api/admin/activities': 2
+    }
+    
+    def setUp(self):
+        super().setUp()
+        app.config['CACHE_ENABLED'] = False
+        app.config['ETAG_ENABLED'] = False
+        with app.app_context():
+            for i in range(10):
+                officer = User(username=f'budget_{i}', email=f'budget_{i}@test.com', password_hash='x',
+                               role='field_officer', name=f'Officer {i}', state='Budget State')
+                db.session.add(officer)
+                db.session.flush()
+                db.session.add(Meeting(user_id=officer.id, meeting_type='one_on_one'))
+                db.session.add(Sale(user_id=officer.id, sale_type='B2C', customer_name='Test',
+                                    product_sku='TEST', product_name='Test', quantity=1))
+            db.session.commit()
+            rebuild_daily_summaries()
+        self.login('test_admin', 'test123')
+    
+    def tearDown(self):
+        app.config['CACHE_ENABLED'] = True
+        app.config['ETAG_ENABLED'] = True
+        super().tearDown()
+    
+    def test_list_endpoints_within_query_budget(self):
+        """Test list endpoints do not lazy-load per row"""
+        for url, budget in self.LIST_ENDPOINT_BUDGETS.items():
+            with self.subTest(url=url):
+                with self.count_queries() as statements:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(len(statements), budget, '\n'.join(statements))
+
+
+class AdminMapTests(OccamyTestCase):
+    """Test the geohash column and the admin map endpoint"""
+    
+    BBOX = '75.8,30.8,75.9,30.95'  # around Ludhiana
+    
+    def setUp(self):
+        super().setUp()
+        with app.app_context():
+            officer = User.query.filter_by(username='test_officer').first()
+            self.officer_id = officer.id
+            for i in range(4):
+                db.session.add(Meeting(user_id=officer.id, meeting_type='group', date=datetime(2024, 3, 1 + i, 10),
+                                       location_lat=30.90 + i * 0.01, location_lng=75.85))
+            db.session.add(Meeting(user_id=officer.id, meeting_type='group', date=datetime(2024, 3, 1, 11),
+                                   location_lat=31.63, location_lng=74.87))  # Amritsar, outside the box
+            db.session.add(Meeting(user_id=officer.id, meeting_type='group', date=datetime(2024, 3, 1, 12)))
+            db.session.commit()
+        self.login('test_admin', 'test123')
+    
+    def map(self, query):
+        return self.client.get(f'/api/admin/map?{query}')
+    
+    def test_geohash_set_on_insert(self):
+        """Test ORM and bulk inserts store the geohash of their coordinates"""
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        with app.app_context():
+            meetings = Meeting.query.order_by(Meeting.id).all()
+            self.assertEqual(meetings[0].geohash, geo.encode(30.90, 75.85))
+            self.assertIsNone(meetings[-1].geohash)
+            db.session.execute(db.insert(LocationLog), [{
+                'user_id': self.officer_id, 'latitude': 30.9, 'longitude': 75.85, 'timestamp': datetime(2024, 3, 1)
+            }])
+            db.session.commit()
+            self.assertEqual(LocationLog.query.one().geohash, geo.encode(30.9, 75.85))
+    
+    def test_points_inside_bbox(self):
+        """Test a small result set comes back as the points inside the box"""
+        response = self.map(f'bbox={self.BBOX}&layers=meetings')
+        self.assertEqual(response.status_code, 200)
+        layer = json.loads(response.data)['layers']['meetings']
+        self.assertEqual(layer['type'], 'points')
+        self.assertEqual(len(layer['items']), 4)
+        self.assertTrue(all(75.8 <= point['lng'] <= 75.9 for point in layer['items']))
+    
+    def test_date_filter(self):
+        """Test from/to restrict the points by activity time"""
+        layer = json.loads(self.map(f'bbox={self.BBOX}&layers=meetings&from=2024-03-02&to=2024-03-03').data)
+        self.assertEqual(len(layer['layers']['meetings']['items']), 2)
+    
+    def test_clusters_above_point_limit(self):
+        """Test large result sets are clustered into at most MAP_MAX_CELLS cells"""
+        app.config['MAP_MAX_POINTS'] = 2
+        try:
+            data = json.loads(self.map('bbox=70,25,80,35').data)
+        finally:
+            app.config['MAP_MAX_POINTS'] = 500
+        layer = data['layers']['meetings']
+        self.assertEqual(layer['type'], 'clusters')
+        self.assertEqual(sum(cluster['count'] for cluster in layer['items']), 5)
+        self.assertLessEqual(len(layer['items']), app.config['MAP_MAX_CELLS'])
+        self.assertTrue(all(len(cluster['cell']) == data['precision'] for cluster in layer['items']))
+        self.assertEqual(data['layers']['sales']['items'], [])
+    
+    def test_location_pings_keep_the_map_cached(self):
+        """Test tracking points do not invalidate cached map responses"""
+        self.map(f'bbox={self.BBOX}&layers=meetings,locations')
+        with app.app_context():
+            db.session.add(LocationLog(user_id=self.officer_id, latitude=30.9, longitude=75.85))
+            db.session.commit()
+        self.assertEqual(self.map(f'bbox={self.BBOX}&layers=meetings,locations').headers['X-Cache'], 'HIT')
+        with app.app_context():
+            db.session.add(Meeting(user_id=self.officer_id, meeting_type='group', location_lat=30.9, location_lng=75.85))
+            db.session.commit()
+        self.assertEqual(self.map(f'bbox={self.BBOX}&layers=meetings,locations').headers['X-Cache'], 'MISS')
+    
+    def test_invalid_arguments_rejected(self):
+        """Test bad bboxes and unknown layers are rejected"""
+        self.assertEqual(self.map('bbox=1,2,3').status_code, 400)
+        self.assertEqual(self.map('bbox=80,25,70,35').status_code, 400)
+        self.assertEqual(self.map(f'bbox={self.BBOX}&layers=meetings,photos').status_code, 400)
+
+
+class ExportTests(OccamyTestCase):
+    """Test streaming exports of activity tables"""
+    
+    def setUp(self):
+        super().setUp()
+        with app.app_context():
+            officer = User.query.filter_by(username='test_officer').first()
+            for i in range(3):
+                db.session.add(Sale(user_id=officer.id, date=datetime(2024, 2, 1 + i, 10), sale_type='B2C',
+                                    customer_name=f'Customer {i}', product_sku='NUT-001',
+                                    product_name='Calcium', quantity=1, total_amount=500))
+            db.session.commit()
+        self.login('test_admin', 'test123')
+    
+    def test_csv_export_streams_filtered_rows(self):
+        """Test CSV export is streamed and honours the date filter"""
+        response = self.client.get('/api/admin/export/sales?from=2024-02-02')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual([row['customer_name'] for row in rows], ['Customer 1', 'Customer 2'])
+        self.assertEqual(rows[0]['officer_name'], 'Test Officer')
+        self.assertEqual(rows[0]['date'], '2024-02-02T10:00:00')
+    
+    def test_ndjson_export(self):
+        """Test NDJSON export emits one object per line"""
+        response = self.client.get('/api/admin/export/sales?format=ndjson&state=Test%20State')
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])['total_amount'], 500)
+    
+    def test_unknown_table_rejected(self):
+        """Test only activity tables can be exported"""
+        self.assertEqual(self.client.get('/api/admin/export/user').status_code, 404)
+        self.assertEqual(self.client.get('/api/admin/export/sales?format=xml').status_code, 400)
+
+
+class UserLoaderCacheTests(OccamyTestCase):
+    """Test the per-process cache behind login_manager.user_loader"""
+    
+    def officer_id(self):
+        with app.app_context():
+            return User.query.filter_by(username='test_officer').first().id
+    
+    def test_loader_hits_cache_after_first_request(self):
+        """Test repeat requests do not reload the user"""
+        self.login('test_officer', 'test123')
+        self.client.get('/api/field/worklog/status')
+        with self.count_queries() as statements:
+            response = self.client.get('/api/field/worklog/status')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('FROM user' in statement for statement in statements))
+    
+    def test_deactivation_takes_effect_immediately(self):
+        """Test an admin deactivation invalidates the cached identity"""
+        self.login('test_officer', 'test123')
+        self.assertEqual(self.client.get('/api/field/worklog/status').status_code, 200)
+        
+        admin = app.test_client()
+        admin.post('/login', data=json.dumps({'username': 'test_admin', 'password': 'test123'}),
+                   content_type='application/json')
+        response = admin.patch(f'/api/admin/users/{self.officer_id()}',
+                               data=json.dumps({'is_active': False}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        
+        self.assertEqual(self.client.get('/api/field/worklog/status').status_code, 302)
+    
+    def test_load_between_flush_and_commit_is_evicted(self):
+        """Test a request thread caching the old row before the commit does not outlive it"""
+        officer_id = str(self.officer_id())
+        
+        def load_in_another_thread():
+            with app.app_context():
+                self.assertTrue(load_user(officer_id).is_active)
+        
+        with app.app_context():
+            db.session.get(User, int(officer_id)).is_active = False
+            db.session.flush()
+            thread = threading.Thread(target=load_in_another_thread)
+            thread.start()
+            thread.join()
+            self.assertIsNotNone(user_cache.get(officer_id))
+            db.session.commit()
+        self.assertIsNone(user_cache.get(officer_id))
+        with app.app_context():
+            self.assertIsNone(load_user(officer_id))
+    
+    def test_is_active_must_be_boolean(self):
+        """Test a string or number for is_active is rejected and leaves the officer as is"""
+        self.login('test_admin', 'test123')
+        for value in ('false', 0, None):
+            with self.subTest(value=value):
+                response = self.client.patch(f'/api/admin/users/{self.officer_id()}',
+                                             data=json.dumps({'is_active': value}), content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+        with app.app_context():
+            self.assertTrue(db.session.get(User, self.officer_id()).is_active)
+    
+    def test_out_of_band_change_seen_after_ttl(self):
+        """Test a change made by another worker is picked up once the TTL lapses"""
+        app.config['USER_CACHE_TTL'] = 0.2
+        try:
+            self.login('test_officer', 'test123')
+            self.client.get('/api/field/worklog/status')
+            with app.app_context():
+                # Core UPDATE skips ORM events, like a write from another process
+                db.session.execute(db.update(User.__table__).where(User.id == self.officer_id())
+                                   .values(is_active=False))
+                db.session.commit()
+            self.assertEqual(self.client.get('/api/field/worklog/status').status_code, 200)
+            time.sleep(0.3)
+            self.assertEqual(self.client.get('/api/field/worklog/status').status_code, 302)
+        finally:
+            app.config['USER_CACHE_TTL'] = 30
+
+
+class PasswordHashingTests(OccamyTestCase):
+    """Test pooled password hashing and rehash on login"""
+    
+    def test_outdated_hash_upgraded_on_login(self):
+        """Test a login with an old-style hash stores a hash in the configured method"""
+        with app.app_context():
+            officer = User.query.filter_by(username='test_officer').first()
+            officer.password_hash = generate_password_hash('test123', method='pbkdf2:sha256:1000')
+            db.session.commit()
+        
+        response = self.login('test_officer', 'test123')
+        self.assertEqual(response.status_code, 200)
+        with app.app_context():
+            stored = User.query.filter_by(username='test_officer').first().password_hash
+        self.assertTrue(stored.startswith('scrypt'))
+        self.assertFalse(password_hasher.needs_rehash(stored))
+        
+        self.logout()
+        self.assertEqual(self.login('test_officer', 'test123').status_code, 200)
+    
+    def test_wrong_password_does_not_rehash(self):
+        """Test a failed login leaves the stored hash alone"""
+        with app.app_context():
+            officer = User.query.filter_by(username='test_officer').first()
+            officer.password_hash = generate_password_hash('test123', method='pbkdf2:sha256:1000')
+            db.session.commit()
+        
+        self.assertEqual(self.login('test_officer', 'wrong').status_code, 401)
+        with app.app_context():
+            stored = User.query.filter_by(username='test_officer').first().password_hash
+        self.assertTrue(stored.startswith('pbkdf2'))
+    
+    def test_busy_hasher_returns_503(self):
+        """Test logins are refused with Retry-After once every hashing slot is taken"""
+        app.config['PASSWORD_HASH_TIMEOUT'] = 0.05
+        taken = 0
+        try:
+            while password_hasher._slots.acquire(blocking=False):
+                taken += 1
+            response = self.login('test_officer', 'test123')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '1')
+        finally:
+            for _ in range(taken):
+                password_hasher._slots.release()
+            app.config['PASSWORD_HASH_TIMEOUT'] = 10
+        
+        self.assertEqual(self.login('test_officer', 'test123').status_code, 200)
+    
+    def test_pool_processes_are_not_forked_from_the_worker(self):
+        """Test the hashing pool starts its processes without forking a threaded worker"""
+        with app.app_context():
+            self.assertTrue(password_hasher.verify(password_hasher.hash('secret'), 'secret'))
+        self.assertIn(password_hasher._executor._mp_context.get_start_method(), ('forkserver', 'spawn'))
+
+
+class BulkUserImportTests(OccamyTestCase):
+    """Test bulk officer onboarding"""
+    
+    def bulk(self, body, content_type='application/json'):
+        return self.client.post('/api/admin/users/bulk', data=body, content_type=content_type)
+    
+    def test_csv_import_creates_officers(self):
+        """Test every valid CSV row becomes a field officer who can log in"""
+        self.login('test_admin', 'test123')
+        body = (
+            'username,email,password,name,state,district,phone\n'
+            'bulk_1,bulk_1@test.com,pass1,Bulk One,Punjab,Ludhiana,\n'
+            'bulk_2,bulk_2@test.com,pass2,Bulk Two,Punjab,,9999999999\n'
+        )
+        response = self.bulk(body, 'text/csv')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['created'], 2)
+        self.assertEqual(data['errors'], [])
+        
+        with app.app_context():
+            officer = User.query.filter_by(username='bulk_1').first()
+            self.assertEqual(officer.role, 'field_officer')
+            self.assertEqual(officer.district, 'Ludhiana')
+            self.assertIsNone(officer.phone)
+        self.logout()
+        self.assertEqual(self.login('bulk_2', 'pass2').status_code, 200)
+    
+    def test_json_import_reports_row_errors(self):
+        """Test invalid and clashing rows are skipped and reported by row number"""
+        self.login('test_admin', 'test123')
+        rows = [
+            {'username': 'bulk_ok', 'email': 'bulk_ok@test.com', 'password': 'p', 'name': 'Ok'},
+            {'username': 'test_officer', 'email': 'fresh@test.com', 'password': 'p', 'name': 'Taken'},
+            {'username': 'bulk_mail', 'email': 'officer@test.com', 'password': 'p', 'name': 'Taken Mail'},
+            {'username': 'bulk_ok', 'email': 'other@test.com', 'password': 'p', 'name': 'Repeat'},
+            {'username': 'bulk_nopass', 'email': 'nopass@test.com', 'name': 'No Password'}
+        ]
+        response = self.bulk(json.dumps({'users': rows}))
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertFalse(data['success'])
+        self.assertEqual(data['created'], 1)
+        self.assertEqual([error['row'] for error in data['errors']], [2, 3, 4, 5])
+        self.assertEqual(data['errors'][0]['error'], 'Username already exists')
+        self.assertEqual(data['errors'][3]['error'], 'Missing password')
+    
+    def test_uniqueness_checked_with_one_query(self):
+        """Test the statement count does not grow with the batch size"""
+        self.login('test_admin', 'test123')
+        rows = [{'username': f'bulk_{i}', 'email': f'bulk_{i}@test.com', 'password': 'p', 'name': f'Bulk {i}'}
+                for i in range(25)]
+        self.client.get('/api/admin/users')
+        with self.count_queries() as statements:
+            response = self.bulk(json.dumps(rows))
+        self.assertEqual(json.loads(response.data)['created'], 25)
+        self.assertEqual(len(statements), 2)
+        self.assertIn('IN (', statements[0])
+    
+    def test_concurrent_insert_conflict(self):
+        """Test a user created during hashing rolls the batch back with a 409"""
+        self.login('test_admin', 'test123')
+        rows = [{'username': f'bulk_{i}', 'email': f'bulk_{i}@test.com', 'password': 'p', 'name': f'Bulk {i}'}
+                for i in range(3)]
+        hash_many = password_hasher.hash_many
+        
+        def hash_while_another_admin_inserts(passwords):
+            with app.app_context(), db.engine.begin() as connection:
+                connection.execute(db.insert(User), {
+                    'username': 'bulk_1', 'email': 'elsewhere@test.com', 'password_hash': 'x',
+                    'role': 'field_officer', 'name': 'Elsewhere'
+                })
+            return hash_many(passwords)
+        
+        with mock.patch.object(password_hasher, 'hash_many', side_effect=hash_while_another_admin_inserts):
+            response = self.bulk(json.dumps(rows))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.data)['usernames'], ['bulk_1'])
+        with app.app_context():
+            self.assertEqual(User.query.filter(User.username.like('bulk_%')).count(), 1)
+        
+        rows[1]['username'] = 'bulk_1b'
+        self.assertEqual(json.loads(self.bulk(json.dumps(rows)).data)['created'], 3)
+    
+    def test_malformed_body_rejected(self):
+        """Test a body that is not a list of users is rejected"""
+        self.login('test_admin', 'test123')
+        self.assertEqual(self.bulk('{not json').status_code, 400)
+        self.assertEqual(self.bulk(json.dumps({'username': 'x'})).status_code, 400)
+    
+    def test_officer_cannot_bulk_import(self):
+        """Test bulk onboarding is admin only"""
+        self.login('test_officer', 'test123')
+        self.assertEqual(self.bulk(json.dumps([])).status_code, 403)
+
+
+class FakeRedis:
+    """Just enough of redis-py for RedisCacheBackend and RedisFeedBackend"""
+    
+    def __init__(self):
+        self.data = {}
+        self.streams = {}
+    
+    def get(self, key):
+        return self.data.get(key)
+    
+    def setex(self, key, ttl, value):
+        self.data[key] = value.encode('utf-8') if isinstance(value, str) else value
+    
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+    
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+    
+    def scan_iter(self, pattern):
+        prefix = pattern.rstrip('*')
+        return [key for key in self.data if key.startswith(prefix)]
+    
+    def xadd(self, key, fields, maxlen=None, approximate=True):
+        stream = self.streams.setdefault(key, [])
+        entry_id = f'{len(stream) + 1}-0'.encode()
+        stream.append((entry_id, {name.encode(): value.encode() for name, value in fields.items()}))
+        return entry_id
+    
+    def xrevrange(self, key, count=None):
+        return list(reversed(self.streams.get(key, [])))[:count]
+    
+    def xread(self, streams, count=None, block=None):
+        result = []
+        for key, after in streams.items():
+            after = int(after.split('-')[0])
+            entries = [entry for entry in self.streams.get(key, []) if int(entry[0].split(b'-')[0]) > after]
+            if entries:
+                result.append([key.encode(), entries[:count]])
+        return result
+
+
+class ResponseCacheTests(OccamyTestCase):
+    """Test caching of admin aggregate endpoints"""
+    
+    def add_sale(self):
+        with app.app_context():
+            officer = User.query.filter_by(username='test_officer').first()
+            db.session.add(Sale(user_id=officer.id, sale_type='B2C', customer_name='Test',
+                                product_sku='TEST', product_name='Test', quantity=1))
+            db.session.commit()
+            rebuild_daily_summaries()
+    
+    def test_repeat_request_is_served_from_cache(self):
+        """Test the second identical request skips the database"""
+        self.login('test_admin', 'test123')
+        first = self.client.get('/api/admin/sales')
+        with self.count_queries() as statements:
+            second = self.client.get('/api/admin/sales')
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+        # Neither the view nor the (cached) user loader touches the database
+        self.assertEqual(len(statements), 0)
+    
+    def test_query_parameters_are_part_of_key(self):
+        """Test different query strings are cached separately"""
+        self.login('test_admin', 'test123')
+        self.client.get('/api/admin/activities?days=7')
+        response = self.client.get('/api/admin/activities?days=30')
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+    
+    def test_write_invalidates_cache(self):
+        """Test committing a sale invalidates cached stats"""
+        self.login('test_admin', 'test123')
+        self.assertEqual(json.loads(self.client.get('/api/admin/stats').data)['total_sales'], 0)
+        self.add_sale()
+        response = self.client.get('/api/admin/stats')
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertEqual(json.loads(response.data)['total_sales'], 1)
+    
+    def test_shared_backend(self):
+        """Test the Redis backend caches and invalidates through the client"""
+        local_backend = response_cache.backend
+        response_cache.backend = RedisCacheBackend(FakeRedis())
+        try:
+            self.login('test_admin', 'test123')
+            self.client.get('/api/admin/sales')
+            self.assertEqual(self.client.get('/api/admin/sales').headers['X-Cache'], 'HIT')
+            self.add_sale()
+            response = self.client.get('/api/admin/sales')
+            self.assertEqual(response.headers['X-Cache'], 'MISS')
+            self.assertEqual(len(json.loads(response.data)['items']), 1)
+        finally:
+            response_cache.backend = local_backend
+    
+    def test_activities_follow_the_daily_summary(self):
+        """Test a logged meeting refreshes activities but a location ping does not"""
+        def as_officer(url, payload):
+            self.logout()
+            self.login('test_officer', 'test123')
+            self.client.post(url, json=payload)
+            self.logout()
+            self.login('test_admin', 'test123')
+        
+        as_officer('/api/field/location', {'latitude': 26.8, 'longitude': 80.9})
+        self.client.get('/api/admin/activities')
+        as_officer('/api/field/location', {'latitude': 26.8, 'longitude': 80.9})
+        self.assertEqual(self.client.get('/api/admin/activities').headers['X-Cache'], 'HIT')
+        
+        as_officer('/api/field/meeting', {'meeting_type': 'group', 'village': 'Rampur'})
+        response = self.client.get('/api/admin/activities')
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertEqual(json.loads(response.data)[0]['meetings'], 1)
+    
+    def test_cache_stats_endpoint(self):
+        """Test hit and miss counters are exposed"""
+        self.login('test_admin', 'test123')
+        before = json.loads(self.client.get('/api/admin/cache').data)
+        self.client.get('/api/admin/meetings')
+        self.client.get('/api/admin/meetings')
+        after = json.loads(self.client.get('/api/admin/cache').data)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+
+
+class ConditionalResponseTests(OccamyTestCase):
+    """Test ETags, 304 Not Modified and in-app compression"""
+    
+    def tearDown(self):
+        app.config['ETAG_ENABLED'] = True
+        app.config['COMPRESS_ENABLED'] = True
+        app.config['COMPRESS_MIN_SIZE'] = 1024
+        super().tearDown()
+    
+    def add_meeting(self):
+        with app.app_context():
+            officer = User.query.filter_by(username='test_officer').first()
+            db.session.add(Meeting(user_id=officer.id, meeting_type='group', village='Rampur'))
+            db.session.commit()
+    
+    def test_unchanged_list_is_not_modified_without_running_the_view(self):
+        """Test a matching If-None-Match costs only the watermark query"""
+        self.login('test_admin', 'test123')
+        first = self.client.get('/api/admin/users')
+        etag = first.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        self.assertEqual(first.headers['Cache-Control'], 'private, no-cache')
+        
+        with self.count_queries() as statements:
+            second = self.client.get('/api/admin/users', headers={'If-None-Match': etag})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.data, b'')
+        self.assertEqual(second.headers['ETag'], etag)
+        self.assertEqual(len(statements), 1, '\n'.join(statements))
+        self.assertNotIn('user.role', statements[0])
+        # Index lookups only, no full-table count
+        self.assertNotIn('count(', statements[0].lower())
+    
+    def test_update_changes_etag(self):
+        """Test edits, not only inserts, move the users watermark"""
+        self.login('test_admin', 'test123')
+        etag = self.client.get('/api/admin/users').headers['ETag']
+        with app.app_context():
+            officer_id = User.query.filter_by(username='test_officer').first().id
+        self.client.patch(f'/api/admin/users/{officer_id}', json={'phone': '9999999999'})
+        response = self.client.get('/api/admin/users', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(json.loads(response.data)[0]['phone'], '9999999999')
+    
+    def test_cached_list_revalidates_without_queries(self):
+        """Test the watermark is cached with the body and bumped by writes"""
+        self.login('test_admin', 'test123')
+        self.add_meeting()
+        etag = self.client.get('/api/admin/meetings').headers['ETag']
+        with self.count_queries() as statements:
+            response = self.client.get('/api/admin/meetings', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(statements), 0)
+        
+        self.add_meeting()
+        response = self.client.get('/api/admin/meetings', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.data)['items']), 2)
+    
+    def test_query_string_is_part_of_etag(self):
+        """Test each filter or page gets its own ETag"""
+        self.login('test_admin', 'test123')
+        etag = self.client.get('/api/admin/sales').headers['ETag']
+        response = self.client.get('/api/admin/sales?sale_type=B2B', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+    
+    def test_my_activities_etag_follows_body(self):
+        """Test the field summary revalidates against a hash of its content"""
+        self.login('test_officer', 'test123')
+        etag = self.client.get('/api/field/my-activities').headers['ETag']
+        self.assertEqual(self.client.get('/api/field/my-activities',
+                                         headers={'If-None-Match': etag}).status_code, 304)
+        self.add_meeting()
+        response = self.client.get('/api/field/my-activities', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['meetings'], 1)
+    
+    def test_etags_can_be_disabled(self):
+        """Test ETAG_ENABLED turns conditional responses off"""
+        app.config['ETAG_ENABLED'] = False
+        self.login('test_admin', 'test123')
+        self.assertNotIn('ETag', self.client.get('/api/admin/users').headers)
+    
+    def test_large_json_is_gzipped(self):
+        """Test responses over COMPRESS_MIN_SIZE are compressed when accepted"""
+        app.config['COMPRESS_MIN_SIZE'] = 64
+        self.login('test_admin', 'test123')
+        plain = self.client.get('/api/admin/users')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        
+        response = self.client.get('/api/admin/users', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(int(response.headers['Content-Length']), len(response.data))
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+        # Representations differ in bytes only, so the validator is shared
+        self.assertEqual(response.headers['ETag'], plain.headers['ETag'])
+    
+    def test_small_and_streamed_responses_are_not_compressed(self):
+        """Test short bodies and streams are sent as they are"""
+        self.login('test_admin', 'test123')
+        self.add_meeting()
+        headers = {'Accept-Encoding': 'gzip, br'}
+        self.assertNotIn('Content-Encoding', self.client.get('/api/admin/cache', headers=headers).headers)
+        app.config['COMPRESS_MIN_SIZE'] = 1
+        response = self.client.get('/api/admin/export/meetings', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response.headers)
+        app.config['COMPRESS_ENABLED'] = False
+        self.assertNotIn('Content-Encoding', self.client.get('/api/admin/users', headers=headers).headers)
+    
+    @unittest.skipIf(compression.brotli is None, 'brotli is not installed')
+    def test_brotli_preferred_when_accepted(self):
+        """Test br is chosen over gzip unless the client ranks it lower"""
+        app.config['COMPRESS_MIN_SIZE'] = 64
+        self.login('test_admin', 'test123')
+        plain = self.client.get('/api/admin/users').data
+        response = self.client.get('/api/admin/users', headers={'Accept-Encoding': 'gzip, deflate, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.data), plain)
+        response = self.client.get('/api/admin/users', headers={'Accept-Encoding': 'br;q=0.5, gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+
+
+class JSONProviderTests(OccamyTestCase):
+    """Test the orjson-backed JSON provider and its standard library fallback"""
+    
+    ENCODERS = [False, True] if json_provider.orjson is not None else [False]
+    
+    def tearDown(self):
+        app.config['JSON_FAST_ENCODER'] = True
+        super().tearDown()
+    
+    def add_activity(self):
+        with app.app_context():
+            officer = User.query.filter_by(username='test_officer').first()
+            db.session.add(Meeting(user_id=officer.id, meeting_type='one_on_one', person_name='Rāmu',
+                                   date=datetime(2024, 2, 6, 10, 30, 15, 250000)))
+            db.session.add(Sale(user_id=officer.id, sale_type='B2C', customer_name='Test', product_sku='TEST',
+                                product_name='Test', quantity=2, total_amount=99.5, date=datetime(2024, 2, 6, 11)))
+            db.session.commit()
+    
+    def test_list_rows_serialize_the_same_on_both_encoders(self):
+        """Test labelled rows become objects with ISO 8601 dates either way"""
+        self.add_activity()
+        self.login('test_admin', 'test123')
+        app.config['CACHE_ENABLED'] = False
+        try:
+            bodies = {}
+            for fast in self.ENCODERS:
+                app.config['JSON_FAST_ENCODER'] = fast
+                bodies[fast] = {url: json.loads(self.client.get(url).data) for url in
+                                ('/api/admin/meetings', '/api/admin/sales', '/api/admin/users')}
+        finally:
+            app.config['CACHE_ENABLED'] = True
+        
+        for body in bodies.values():
+            self.assertEqual(body, bodies[False])
+        meeting = bodies[False]['/api/admin/meetings']['items'][0]
+        self.assertEqual(meeting['date'], '2024-02-06T10:30:15.250000')
+        self.assertEqual(meeting['type'], 'one_on_one')
+        self.assertEqual(meeting['person_name'], 'Rāmu')
+        self.assertEqual(meeting['officer_name'], 'Test Officer')
+        sale = bodies[False]['/api/admin/sales']['items'][0]
+        self.assertEqual((sale['customer'], sale['amount'], sale['repeat_order']), ('Test', 99.5, False))
+        self.assertEqual(bodies[False]['/api/admin/users'][0]['username'], 'test_officer')
+    
+    def test_activities_dates_are_iso(self):
+        """Test summary days are written as YYYY-MM-DD"""
+        self.add_activity()
+        with app.app_context():
+            rebuild_daily_summaries()
+        self.login('test_admin', 'test123')
+        with mock.patch('app.datetime') as fake_datetime:
+            fake_datetime.utcnow.return_value = datetime(2024, 2, 7)
+            rows = json.loads(self.client.get('/api/admin/activities').data)
+        self.assertEqual(rows[0]['date'], '2024-02-06')
+        self.assertEqual(rows[0]['meetings'], 1)
+    
+    def test_provider_types(self):
+        """Test dates, numpy numbers and non-string keys on both encoders"""
+        for fast in self.ENCODERS:
+            app.config['JSON_FAST_ENCODER'] = fast
+            with app.app_context():
+                text = app.json.dumps({'day': date(2024, 2, 6), 'km': geo.np.float64(1.5) if geo.np else 1.5, 3: 'x'})
+                self.assertEqual(json.loads(text), {'day': '2024-02-06', 'km': 1.5, '3': 'x'})
+                self.assertEqual(app.json.loads(b'{"a": [1, 2]}'), {'a': [1, 2]})
+    
+    @unittest.skipIf(json_provider.orjson is None, 'orjson is not installed')
+    def test_invalid_json_body_is_rejected(self):
+        """Test orjson parse errors still surface as a 400"""
+        self.login('test_officer', 'test123')
+        response = self.client.post('/api/field/meeting', data='{"meeting_type": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class LiveFeedTests(OccamyTestCase):
+    """Test the admin Server-Sent Events feed"""
+    
+    def setUp(self):
+        super().setUp()
+        self.settings = {key: app.config[key] for key in ('LIVE_FEED_HEARTBEAT', 'LIVE_FEED_MAX_STREAM_SECONDS')}
+        # Short-lived streams so a test can read one to the end
+        app.config.update(LIVE_FEED_HEARTBEAT=0.05, LIVE_FEED_MAX_STREAM_SECONDS=0.1)
+        self.cursor = live_feed.backend.last_id()
+    
+    def tearDown(self):
+        app.config.update(self.settings)
+        super().tearDown()
+    
+    def read_events(self, last_event_id):
+        """(id, event, data) of every event in one stream response"""
+        self.logout()
+        self.login('test_admin', 'test123')
+        response = self.client.get('/api/admin/stream', headers={'Last-Event-ID': last_event_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertEqual(response.headers['X-Accel-Buffering'], 'no')
+        events = []
+        for block in response.get_data(as_text=True).split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+            if 'event' in fields:
+                events.append((fields['id'], fields['event'], json.loads(fields['data'])))
+        return events
+    
+    def test_committed_writes_are_streamed(self):
+        """Test each field write reaches the stream as its own event, in order"""
+        self.login('test_officer', 'test123')
+        self.post('/api/field/worklog/start', {'latitude': 28.6, 'longitude': 77.2, 'odometer': 100})
+        self.post('/api/field/meeting', {'meeting_type': 'one_on_one', 'person_name': 'Farmer',
+                                         'person_category': 'Farmer', 'business_potential': 'High'})
+        self.post('/api/field/sale', {'sale_type': 'B2C', 'customer_name': 'Farmer', 'product_sku': 'SKU1',
+                                      'product_name': 'Feed', 'quantity': 2, 'total_amount': 500})
+        self.post('/api/field/sample', {'recipient_name': 'Farmer', 'product_name': 'Feed', 'quantity': 1})
+        self.post('/api/field/location', {'latitude': 28.61, 'longitude': 77.21})
+        self.post('/api/field/worklog/end', {'latitude': 28.62, 'longitude': 77.22, 'odometer': 120})
+        
+        events = self.read_events(self.cursor)
+        self.assertEqual([name for _, name, _ in events],
+                         ['work_start', 'meeting', 'sale', 'sample', 'position', 'work_end'])
+        # The dashboard renders list rows straight from these payloads
+        self.assertEqual((events[1][2]['person_category'], events[1][2]['business_potential']), ('Farmer', 'High'))
+        self.assertEqual(events[2][2]['total_amount'], 500)
+        self.assertEqual(events[4][2]['latitude'], 28.61)
+        self.assertEqual(events[5][2]['distance_traveled'], 20)
+        
+        # A reconnecting client only receives what it missed
+        self.assertEqual([name for _, name, _ in self.read_events(events[3][0])], ['position', 'work_end'])
+    
+    def test_batch_publishes_latest_position(self):
+        """Test a location batch sends only the officer's newest fix"""
+        self.login('test_officer', 'test123')
+        now = datetime.utcnow()
+        points = [{'latitude': 28.6 + i * 0.001, 'longitude': 77.2, 'timestamp': (now - timedelta(minutes=3 - i)).isoformat()}
+                  for i in range(3)]
+        self.post('/api/field/location/batch', {'points': points})
+        events = self.read_events(self.cursor)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0][1], 'position')
+        self.assertAlmostEqual(events[0][2]['latitude'], 28.602)
+    
+    def test_rolled_back_write_is_not_published(self):
+        """Test events wait for the commit"""
+        with app.app_context():
+            officer = User.query.filter_by(username='test_officer').first()
+            db.session.add(Meeting(user_id=officer.id, meeting_type='group', village='Test'))
+            db.session.flush()
+            db.session.rollback()
+        self.assertEqual(live_feed.backend.last_id(), self.cursor)
+    
+    def test_stream_requires_admin(self):
+        """Test field officers cannot open the feed"""
+        self.login('test_officer', 'test123')
+        self.assertEqual(self.client.get('/api/admin/stream').status_code, 403)
+    
+    def test_streams_per_process_are_capped(self):
+        """Test a full process answers 503 and frees the slot when a stream closes"""
+        self.login('test_admin', 'test123')
+        with mock.patch.object(live_feed, 'slots', threading.BoundedSemaphore(1)):
+            first = self.client.get('/api/admin/stream', buffered=False)
+            self.assertEqual(first.status_code, 200)
+            busy = self.client.get('/api/admin/stream')
+            self.assertEqual(busy.status_code, 503)
+            self.assertIn('Retry-After', busy.headers)
+            first.close()
+            self.assertEqual(self.client.get('/api/admin/stream').status_code, 200)
+    
+    def test_shared_backend(self):
+        """Test events travel through a Redis stream"""
+        local_backend = live_feed.backend
+        live_feed.backend = RedisFeedBackend(FakeRedis())
+        try:
+            self.login('test_officer', 'test123')
+            self.post('/api/field/meeting', {'meeting_type': 'group', 'village': 'Test', 'attendees_count': 12})
+            events = self.read_events('0-0')
+            self.assertEqual(events, [('1-0', 'meeting', events[0][2])])
+            self.assertEqual(events[0][2]['village'], 'Test')
+            self.assertEqual(live_feed.backend.cursor(None), '1-0')
+        finally:
+            live_feed.backend = local_backend
+
+
+class AppFactoryTests(OccamyTestCase):
+    """Test create_app and database engine tuning"""
+    
+    def test_testing_config_applied(self):
+        """Test the factory loads the named config class"""
+        self.assertTrue(app.config['TESTING'])
+        self.assertEqual(app.config['SQLALCHEMY_DATABASE_URI'], 'sqlite:///test_occamy.db')
+        self.assertFalse(app.config['LOCATION_BUFFER_ENABLED'])
+    
+    def test_sqlite_pragmas_applied(self):
+        """Test every SQLite connection is switched to WAL with a busy timeout"""
+        with app.app_context():
+            pragma = lambda name: db.session.execute(db.text(f'PRAGMA {name}')).scalar()
+            self.assertEqual(pragma('journal_mode'), 'wal')
+            self.assertEqual(pragma('synchronous'), 1)  # NORMAL
+            self.assertEqual(pragma('busy_timeout'), app.config['SQLITE_BUSY_TIMEOUT'])
+
+    def test_apps_keep_their_own_extensions(self):
+        """Test a second app gets its own instances and leaves the first app's alone"""
+        other = create_app('testing')
+        for name in ('location_buffer', 'password_hasher', 'photo_store', 'user_cache', 'response_cache', 'live_feed'):
+            self.assertIsNot(other.extensions[name], app.extensions[name], name)
+        self.assertIs(location_buffer.app, app)
+        self.assertIs(password_hasher.app, app)
+        with app.app_context():
+            from app import location_buffer as current_buffer
+            self.assertIs(current_buffer._get_current_object(), location_buffer)
+        other.extensions['location_buffer'].shutdown()
+        other.extensions['password_hasher'].shutdown()
+        other.extensions['photo_store'].shutdown()
+
+    def test_engine_options_for_postgres(self):
+        """Test pool and statement timeout settings are passed to server databases"""
+        settings = dict(app.config, SQLALCHEMY_DATABASE_URI='postgresql://occamy@db/occamy_db')
+        options = engine_options(settings)
+        self.assertEqual(options['pool_size'], app.config['DB_POOL_SIZE'])
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=30000'})
+        self.assertEqual(engine_options(app.config), {})
+
+
+class SchemaUpgradeTests(OccamyTestCase):
+    """Test `migrate_db.py indexes` on a database created by the first release"""
+    
+    BASELINE_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'occamy.db')
+    
+    def setUp(self):
+        super().setUp()
+        with sqlite3.connect(f'file:{self.BASELINE_DB}?mode=ro', uri=True) as baseline:
+            schema = [sql for (sql,) in baseline.execute("SELECT sql FROM sqlite_master WHERE sql IS NOT NULL")]
+        with app.app_context():
+            db.drop_all()
+            for statement in schema:
+                db.session.execute(db.text(statement))
+            db.session.execute(db.text(
+                "INSERT INTO user (id, username, email, password_hash, role, name, state, is_active, created_at) "
+                "VALUES (1, 'old_officer', 'old@test.com', 'x', 'field_officer', 'Old Officer', 'Punjab', 1, "
+                "'2024-01-01 00:00:00')"))
+            db.session.execute(db.text(
+                "INSERT INTO meeting (user_id, meeting_type, date, location_lat, location_lng) "
+                "VALUES (1, 'group', '2024-02-06 09:00:00', 30.9, 75.85)"))
+            db.session.execute(db.text(
+                "INSERT INTO work_log (user_id, date, status, distance_traveled) VALUES (1, '2024-02-06', 'ended', 12)"))
+            db.session.commit()
+    
+    def test_indexes_command_upgrades_first_release_schema(self):
+        """Test columns are added and backfilled before the indexes that use them"""
+        from migrate_db import create_indexes
+        with app.app_context():
+            # Left by a release before keyset pagination
+            db.session.execute(db.text('CREATE INDEX ix_meeting_date ON meeting (date)'))
+            db.session.commit()
+        with mock.patch('migrate_db.app', app):
+            create_indexes()
+        with app.app_context():
+            inspector = db.inspect(db.engine)
+            meeting_indexes = [i['name'] for i in inspector.get_indexes('meeting')]
+            self.assertIn('ix_meeting_geohash', meeting_indexes)
+            self.assertIn('ix_meeting_date_id', meeting_indexes)
+            self.assertNotIn('ix_meeting_date', meeting_indexes)
+            self.assertIn('ix_sale_user_id_activity_day', [i['name'] for i in inspector.get_indexes('sale')])
+            self.assertIn('ix_location_log_geohash', [i['name'] for i in inspector.get_indexes('location_log')])
+            self.assertIn('ix_user_updated_at', [i['name'] for i in inspector.get_indexes('user')])
+            meeting = Meeting.query.one()
+            self.assertEqual(meeting.activity_day, date(2024, 2, 6))
+            self.assertEqual(meeting.geohash, geo.encode(30.9, 75.85))
+            self.assertEqual(WorkLog.query.one().gps_distance, None)
+            summary = DailyOfficerSummary.query.one()
+            self.assertEqual((summary.meetings, summary.distance), (1, 12))
+        # Re-running is harmless
+        with mock.patch('migrate_db.app', app):
+            create_indexes()
+
+
 class DatabaseModelTests(OccamyTestCase):
     """Test database models"""
     
@@ -375,6 +2237,77 @@ class DatabaseModelTests(OccamyTestCase):
             retrieved = Meeting.query.filter_by(user_id=user.id).first()
             self.assertIsNotNone(retrieved)
     
+    def test_activity_indexes_created(self):
+        """Test composite activity indexes exist on a fresh database"""
+        with app.app_context():
+            inspector = db.inspect(db.engine)
+            sale_indexes = {i['name']: i['column_names'] for i in inspector.get_indexes('sale')}
+            self.assertEqual(sale_indexes['ix_sale_user_id_date'], ['user_id', 'date'])
+            self.assertEqual(sale_indexes['ix_sale_date_sale_type'], ['date', 'sale_type'])
+            # Keyset pagination seeks on (date, id)
+            self.assertEqual(sale_indexes['ix_sale_date_id'], ['date', 'id'])
+            meeting_indexes = {i['name']: i['column_names'] for i in inspector.get_indexes('meeting')}
+            self.assertEqual(meeting_indexes['ix_meeting_date_id'], ['date', 'id'])
+            location_indexes = [i['name'] for i in inspector.get_indexes('location_log')]
+            self.assertIn('ix_location_log_user_id_timestamp', location_indexes)
+    
+    def test_activity_day_set_on_insert(self):
+        """Test activity_day is derived from date for ORM and bulk inserts"""
+        with app.app_context():
+            user = User.query.filter_by(username='test_officer').first()
+            db.session.add(Meeting(user_id=user.id, meeting_type='group', date=datetime(2024, 2, 6, 23, 30)))
+            db.session.execute(db.insert(Sale), [{
+                'user_id': user.id, 'date': datetime(2024, 2, 7, 0, 15), 'sale_type': 'B2C',
+                'customer_name': 'Test', 'product_sku': 'TEST', 'product_name': 'Test', 'quantity': 1
+            }])
+            db.session.commit()
+            self.assertEqual(Meeting.query.one().activity_day, date(2024, 2, 6))
+            self.assertEqual(Sale.query.one().activity_day, date(2024, 2, 7))
+    
+    def test_backfill_activity_day(self):
+        """Test the migration command fills activity_day on existing rows"""
+        from migrate_db import backfill_activity_day
+        with app.app_context():
+            user = User.query.filter_by(username='test_officer').first()
+            db.session.add(Meeting(user_id=user.id, meeting_type='group', date=datetime(2024, 2, 6, 9)))
+            db.session.commit()
+            db.session.execute(db.update(Meeting).values(activity_day=None))
+            db.session.commit()
+        with mock.patch('migrate_db.app', app):
+            backfill_activity_day()
+        with app.app_context():
+            self.assertEqual(Meeting.query.one().activity_day, date(2024, 2, 6))
+    
+    def test_backfill_geohash(self):
+        """Test the migration command fills geohash on existing rows"""
+        from migrate_db import backfill_geohash
+        with app.app_context():
+            user = User.query.filter_by(username='test_officer').first()
+            db.session.add(Meeting(user_id=user.id, meeting_type='group', location_lat=30.9, location_lng=75.85))
+            db.session.commit()
+            db.session.execute(db.update(Meeting).values(geohash=None))
+            db.session.commit()
+        with mock.patch('migrate_db.app', app):
+            backfill_geohash()
+        with app.app_context():
+            self.assertEqual(Meeting.query.one().geohash, geo.encode(30.9, 75.85))
+    
+    def test_indexes_command_adds_work_log_columns(self):
+        """Test the upgrade command adds WorkLog columns newer than the database"""
+        from migrate_db import create_indexes
+        columns = ('track_points', 'track_points_kept', 'gps_distance', 'gps_distance_ratio')
+        with app.app_context():
+            for column in columns:
+                db.session.execute(db.text(f'ALTER TABLE work_log DROP COLUMN {column}'))
+            db.session.commit()
+        with mock.patch('migrate_db.app', app):
+            create_indexes()
+        with app.app_context():
+            existing = [column['name'] for column in db.inspect(db.engine).get_columns('work_log')]
+            for column in columns:
+                self.assertIn(column, existing)
+            self.assertEqual(WorkLog.query.count(), 0)
+    
     def test_user_relationships(self):
         """Test user relationships work"""
         with app.app_context():
@@ -403,6 +2336,27 @@ def run_tests():
     suite.addTests(loader.loadTestsFromTestCase(AuthenticationTests))
     suite.addTests(loader.loadTestsFromTestCase(AdminAPITests))
     suite.addTests(loader.loadTestsFromTestCase(FieldOfficerAPITests))
+    suite.addTests(loader.loadTestsFromTestCase(LocationBufferTests))
+    suite.addTests(loader.loadTestsFromTestCase(FieldSyncTests))
+    suite.addTests(loader.loadTestsFromTestCase(IdempotencyTests))
+    suite.addTests(loader.loadTestsFromTestCase(PhotoUploadTests))
+    suite.addTests(loader.loadTestsFromTestCase(DailySummaryTests))
+    suite.addTests(loader.loadTestsFromTestCase(TrackCompactionTests))
+    suite.addTests(loader.loadTestsFromTestCase(GpsDistanceTests))
+    suite.addTests(loader.loadTestsFromTestCase(LocationArchiveTests))
+    suite.addTests(loader.loadTestsFromTestCase(AdminListPaginationTests))
+    suite.addTests(loader.loadTestsFromTestCase(QueryBudgetTests))
+    suite.addTests(loader.loadTestsFromTestCase(ResponseCacheTests))
+    suite.addTests(loader.loadTestsFromTestCase(ConditionalResponseTests))
+    suite.addTests(loader.loadTestsFromTestCase(JSONProviderTests))
+    suite.addTests(loader.loadTestsFromTestCase(AdminMapTests))
+    suite.addTests(loader.loadTestsFromTestCase(ExportTests))
+    suite.addTests(loader.loadTestsFromTestCase(UserLoaderCacheTests))
+    suite.addTests(loader.loadTestsFromTestCase(PasswordHashingTests))
+    suite.addTests(loader.loadTestsFromTestCase(BulkUserImportTests))
+    suite.addTests(loader.loadTestsFromTestCase(LiveFeedTests))
+    suite.addTests(loader.loadTestsFromTestCase(AppFactoryTests))
+    suite.addTests(loader.loadTestsFromTestCase(SchemaUpgradeTests))
     suite.addTests(loader.loadTestsFromTestCase(DatabaseModelTests))
     
     # Run tests
@@ -0,0 +1,8 @@
+"""
+WSGI entry point for Occamy Field Operations
+Builds the production app once per process; run with `gunicorn wsgi:app`
+"""
+
+from app import create_app
+
+app = create_app()